@@ -87,7 +87,10 @@ class Agent(TransportLayers):
         self.__credentials = credentials
         self.__p2p = p2p
         self.__rpc = None
-        self.__events = None
+        self.__threads_rpc = None
+        self.__coprotocols_rpc = None
+        self.__events = []
+        self.__parent = None
         self.__wallet = None
         self.__timeout = timeout
         self.__loop = loop
@@ -139,7 +142,7 @@ class Agent(TransportLayers):
                 self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
             )
         else:
-            rpc = self.__rpc
+            rpc = await self.__get_coprotocols_rpc()
         return TheirEndpointCoProtocolTransport(
             my_verkey=my_verkey,
             endpoint=endpoint,
@@ -153,7 +156,7 @@ class Agent(TransportLayers):
                 self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
             )
         else:
-            rpc = self.__rpc
+            rpc = await self.__get_coprotocols_rpc()
         return PairwiseCoProtocolTransport(
             pairwise=pairwise,
             rpc=rpc
@@ -161,12 +164,7 @@ class Agent(TransportLayers):
 
     @dispatch(str, Pairwise)
     async def spawn(self, thid: str, pairwise: Pairwise) -> ThreadBasedCoProtocolTransport:
-        if self.__spawn_strategy == SpawnStrategy.PARALLEL:
-            rpc = await AgentRPC.create(
-                self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
-            )
-        else:
-            rpc = self.__rpc
+        rpc = await self.__get_threads_rpc()
         return ThreadBasedCoProtocolTransport(
             thid=thid,
             pairwise=pairwise,
@@ -176,12 +174,7 @@ class Agent(TransportLayers):
     @dispatch(str)
     @abstractmethod
     async def spawn(self, thid: str) -> ThreadBasedCoProtocolTransport:
-        if self.__spawn_strategy == SpawnStrategy.PARALLEL:
-            rpc = await AgentRPC.create(
-                self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
-            )
-        else:
-            rpc = self.__rpc
+        rpc = await self.__get_threads_rpc()
         return ThreadBasedCoProtocolTransport(
             thid=thid,
             pairwise=None,
@@ -190,12 +183,7 @@ class Agent(TransportLayers):
 
     @dispatch(str, Pairwise, str)
     async def spawn(self, thid: str, pairwise: Pairwise, pthid: str) -> ThreadBasedCoProtocolTransport:
-        if self.__spawn_strategy == SpawnStrategy.PARALLEL:
-            rpc = await AgentRPC.create(
-                self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
-            )
-        else:
-            rpc = self.__rpc
+        rpc = await self.__get_threads_rpc()
         return ThreadBasedCoProtocolTransport(
             thid=thid,
             pairwise=pairwise,
@@ -206,12 +194,7 @@ class Agent(TransportLayers):
     @dispatch(str, str)
     @abstractmethod
     async def spawn(self, thid: str, pthid: str) -> ThreadBasedCoProtocolTransport:
-        if self.__spawn_strategy == SpawnStrategy.PARALLEL:
-            rpc = await AgentRPC.create(
-                self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
-            )
-        else:
-            rpc = self.__rpc
+        rpc = await self.__get_threads_rpc()
         return ThreadBasedCoProtocolTransport(
             thid=thid,
             pairwise=None,
@@ -235,20 +218,69 @@ class Agent(TransportLayers):
         self.__pairwise_list = WalletPairwiseList(api=(self.__wallet.pairwise, self.__wallet.did))
         self.__microledgers = MicroledgerList(api=self.__rpc)
 
+    def fork(self) -> 'Agent':
+        """Agent that shares RPC connection and wallet services of this one, but has its own
+        co-protocols and events channels, so concurrent contexts don't read events of each other.
+
+        Closing of the fork closes only its own channels.
+        """
+        self.__check_is_open()
+        inst = Agent(
+            server_address=self.__server_address, credentials=self.__credentials, p2p=self.__p2p,
+            timeout=self.__timeout, loop=self.__loop, storage=self.__storage, name=self.__name,
+            spawn_strategy=self.__spawn_strategy
+        )
+        inst.__parent = self
+        inst.__rpc = self.__rpc
+        inst.__endpoints = self.__endpoints
+        inst.__wallet = self.__wallet
+        inst.__ledgers = self.__ledgers
+        inst.__pairwise_list = self.__pairwise_list
+        inst.__microledgers = self.__microledgers
+        return inst
+
     async def subscribe(self) -> Listener:
         self.__check_is_open()
-        self.__events = await AgentEvents.create(
+        events = await AgentEvents.create(
             self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop
         )
-        return Listener(self.__events, self.pairwise_list)
+        self.__events.append(events)
+        return Listener(events, self.pairwise_list)
 
     async def close(self):
-        if self.__rpc:
+        if self.__rpc and self.__parent is None:
             await self.__rpc.close()
-        if self.__events:
-            await self.__events.close()
+        for channel in (self.__threads_rpc, self.__coprotocols_rpc):
+            if channel and channel.done() and not channel.cancelled() and not channel.exception():
+                await channel.result().close()
+        self.__threads_rpc = None
+        self.__coprotocols_rpc = None
+        events, self.__events = self.__events, []
+        for channel in events:
+            await channel.close()
         self.__wallet = None
 
+    async def __get_threads_rpc(self) -> AgentRPC:
+        # Thread based transports are demultiplexed by AgentRPC, so parallel strategy shares
+        # single dedicated connection among them instead of connection per transport
+        if self.__spawn_strategy != SpawnStrategy.PARALLEL:
+            return await self.__get_coprotocols_rpc()
+        if self.__threads_rpc is None or (self.__threads_rpc.done() and self.__threads_rpc.exception()):
+            self.__threads_rpc = asyncio.ensure_future(
+                AgentRPC.create(self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop)
+            )
+        return await asyncio.shield(self.__threads_rpc)
+
+    async def __get_coprotocols_rpc(self) -> AgentRPC:
+        # Fork shares RPC connection of the parent for calls only, its co-protocols are served by own channel
+        if self.__parent is None:
+            return self.__rpc
+        if self.__coprotocols_rpc is None or (self.__coprotocols_rpc.done() and self.__coprotocols_rpc.exception()):
+            self.__coprotocols_rpc = asyncio.ensure_future(
+                AgentRPC.create(self.__server_address, self.__credentials, self.__p2p, self.__timeout, self.__loop)
+            )
+        return await asyncio.shield(self.__coprotocols_rpc)
+
     async def ping(self) -> bool:
         success = await self.__rpc.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/ping_agent'
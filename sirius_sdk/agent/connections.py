@@ -1,9 +1,10 @@
 import json
 import aiohttp
 import asyncio
+import collections
 import datetime
 from abc import ABC, abstractmethod
-from typing import List, Any, Union, Optional
+from typing import List, Any, Union, Optional, Callable
 
 from sirius_sdk.base import WebSocketConnector
 from sirius_sdk.encryption import P2PConnection
@@ -13,6 +14,10 @@ from sirius_sdk.errors.exceptions import *
 from sirius_sdk.agent.transport import http_send
 
 
+# Agent reports unknown RPC call like "Unknown message type ..." or "Unknown msg_type ..."
+UNKNOWN_MESSAGE_TYPE_MARKERS = ('message type', 'msg_type', 'msg type', 'message_type')
+
+
 class Endpoint:
     """Active Agent endpoints
     https://github.com/hyperledger/aries-rfcs/tree/master/concepts/0094-cross-domain-messaging
@@ -138,15 +143,48 @@ class AgentRPC(BaseAgentConnection):
         self.__websockets = {}
         self.__prefer_agent_side = True
         self.__tcp_connector = aiohttp.TCPConnector(ssl=False, keepalive_timeout=60)
+        self.__unsupported_features = set()
+        self.__multiplexer = None
+        # services built over this connection for co-protocol transports, see agent.coprotocols
+        self.coprotocol_services = None
 
     @property
     def endpoints(self) -> List[Endpoint]:
         return self.__endpoints
 
+    def is_feature_supported(self, feature: str) -> bool:
+        """Optional agent-side features are considered supported until agent rejects them
+
+        :param feature: feature id, for example msg_type of optional RPC call
+        """
+        return feature not in self.__unsupported_features
+
+    def mark_feature_unsupported(self, feature: str):
+        self.__unsupported_features.add(feature)
+
+    @staticmethod
+    def is_unknown_message_type_error(e: Exception) -> bool:
+        """Agent rejected the call since it does not know its msg_type, any other error is call failure
+
+        :param e: error raised by remote_call
+        """
+        if not isinstance(e, SiriusPromiseContextException):
+            return False
+        text = ('%s %s' % (e.class_name, e.printable)).lower()
+        return 'unknown' in text and any(marker in text for marker in UNKNOWN_MESSAGE_TYPE_MARKERS)
+
     @property
     def networks(self) -> List[str]:
         return self.__networks
 
+    @property
+    def multiplexer(self) -> 'CoProtocolsMultiplexer':
+        """Demultiplexer of co-protocols channel, built on first access"""
+        if self.__multiplexer is None:
+            self.__multiplexer = CoProtocolsMultiplexer(self)
+            Future.mailbox(self.__tunnel_rpc).on_event = self.__multiplexer.route
+        return self.__multiplexer
+
     async def remote_call(
             self, msg_type: str, params: dict = None, wait_response: bool = True, reconnect_on_error: bool = True
     ) -> Any:
@@ -198,7 +236,8 @@ class AgentRPC(BaseAgentConnection):
             self, message: Message,
             their_vk: Union[List[str], str], endpoint: str,
             my_vk: Optional[str], routing_keys: Optional[List[str]],
-            coprotocol: bool = False, ignore_errors: bool = False
+            coprotocol: bool = False, ignore_errors: bool = False,
+            threads: List[str] = None, threads_ttl: int = None, stop_threads: List[str] = None
     ) -> Optional[Message]:
         """Send Message to other Indy compatible agent
         
@@ -212,6 +251,10 @@ class AgentRPC(BaseAgentConnection):
              - https://github.com/hyperledger/aries-rfcs/tree/master/concepts/0003-protocols
              - https://github.com/hyperledger/aries-rfcs/tree/master/concepts/0008-message-id-and-threading
         :param ignore_errors: bool hide any raised exception
+        :param threads: (optional) threads to route to co-protocols channel before message is sent,
+            for example ~please_ack message ids
+        :param threads_ttl: (optional) time to live of the threads
+        :param stop_threads: (optional) threads that are not needed anymore
         :return: Response message if coprotocol is True
         """
         if not self._connector.is_open:
@@ -226,18 +269,66 @@ class AgentRPC(BaseAgentConnection):
             'recipient_verkeys': recipient_verkeys,
             'sender_verkey': my_vk
         }
+        msg_type_with_threads = 'did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/send_message_with_threads'
+        sent = False
+        if (threads or stop_threads) and self.__prefer_agent_side:
+            if self.is_feature_supported(msg_type_with_threads):
+                # Threads are (un)registered by the same request: single round-trip instead of three
+                try:
+                    ok, body = await self.remote_call(
+                        msg_type=msg_type_with_threads,
+                        params=dict(
+                            params,
+                            timeout=self.timeout,
+                            endpoint_address=endpoint,
+                            start_threads=threads or [],
+                            stop_threads=stop_threads or [],
+                            channel_address=self.__tunnel_coprotocols.address,
+                            ttl=threads_ttl
+                        )
+                    )
+                    sent = True
+                except SiriusPromiseContextException as e:
+                    if not self.is_unknown_message_type_error(e):
+                        raise
+                    # Agent is outdated: message was not sent, use legacy flow from now
+                    self.mark_feature_unsupported(msg_type_with_threads)
+        if not sent:
+            ok, body = await self.__send_message_legacy(params, endpoint, threads, threads_ttl, stop_threads)
+        if not ok:
+            if not ignore_errors:
+                raise SiriusRPCError(body)
+        else:
+            if coprotocol:
+                response = await self.read_protocol_message()
+                return response
+            else:
+                return None
+
+    async def __send_message_legacy(
+            self, params: dict, endpoint: str,
+            threads: Optional[List[str]], threads_ttl: Optional[int], stop_threads: Optional[List[str]]
+    ) -> (bool, Any):
+        if stop_threads:
+            await self.stop_protocol_with_threads(stop_threads, off_response=True)
         if self.__prefer_agent_side:
-            params['timeout'] = self.timeout
-            params['endpoint_address'] = endpoint
+            if threads:
+                await self.start_protocol_with_threads(threads, threads_ttl)
+            params = dict(params, timeout=self.timeout, endpoint_address=endpoint)
             ok, body = await self.remote_call(
                 msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/send_message',
                 params=params
             )
         else:
-            wired = await self.remote_call(
+            coro_prepare = self.remote_call(
                 msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/prepare_message_for_send',
                 params=params
             )
+            if threads:
+                # RPC calls may be performed concurrently
+                wired, _ = await asyncio.gather(coro_prepare, self.start_protocol_with_threads(threads, threads_ttl))
+            else:
+                wired = await coro_prepare
             if endpoint.startswith('ws://') or endpoint.startswith('wss://'):
                 ws = await self.__get_websocket(endpoint)
                 await ws.send_bytes(wired)
@@ -245,15 +336,7 @@ class AgentRPC(BaseAgentConnection):
             else:
                 ok, body = await http_send(wired, endpoint, timeout=self.timeout, connector=self.__tcp_connector)
             body = body.decode()
-        if not ok:
-            if not ignore_errors:
-                raise SiriusRPCError(body)
-        else:
-            if coprotocol:
-                response = await self.read_protocol_message()
-                return response
-            else:
-                return None
+        return ok, body
 
     async def send_message_batched(self, message: Message, batches: List[RoutingBatch]) -> List[Any]:
         if not self._connector.is_open:
@@ -270,9 +353,30 @@ class AgentRPC(BaseAgentConnection):
         return results
 
     async def read_protocol_message(self) -> Message:
+        if self.__multiplexer is not None:
+            # events of subscribed threads are not returned
+            return await self.__multiplexer.read(None, timeout=self._timeout)
         response = await self.__tunnel_coprotocols.receive(timeout=self._timeout)
         return response
 
+    async def _pump_protocol_channel(self, timeout: float, ready: Callable[[], bool]) -> Optional[Message]:
+        """Read connection on behalf of all its readers: RPC responses are parked for their futures
+
+        :param timeout: timeout in sec
+        :param ready: reader does not need to read anymore, it is checked when connection is acquired
+        :return: co-protocol event if any
+        """
+        mailbox = Future.mailbox(self.__tunnel_rpc)
+        async with mailbox.lock:
+            if ready():
+                return None
+            payload = await self.__tunnel_coprotocols.receive(timeout)
+        thid = payload.get('~thread', {}).get('thid', None)
+        if payload.get('@type') == Future.MSG_TYPE and thid is not None:
+            mailbox.park(thid, payload)
+            return None
+        return payload
+
     async def start_protocol_with_threading(self, thid: str, ttl: int=None):
         await self.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/start_protocol',
@@ -363,6 +467,8 @@ class AgentRPC(BaseAgentConnection):
         self.__tunnel_coprotocols = AddressedTunnel(
             address=channel_sub_protocol, input_=self._connector, output_=self._connector, p2p=self._p2p
         )
+        if self.__multiplexer is not None:
+            Future.mailbox(self.__tunnel_rpc).on_event = self.__multiplexer.route
         # Extract active endpoints
         endpoints = context.get('~endpoints', [])
         endpoint_collection = []
@@ -413,6 +519,157 @@ class AgentRPC(BaseAgentConnection):
         return ws
 
 
+class _ThreadsBatch:
+
+    def __init__(self):
+        self.threads = []
+        self.task = None
+
+
+class CoProtocolsMultiplexer:
+    """Sub-protocol channel of the AgentRPC shared by thread based co-protocols.
+
+    Incoming co-protocol events are demultiplexed by ~thread (thid, then pthid) into queues of subscribers,
+    so any count of threaded conversations is served by the single connection. Events without known thread
+    are kept in the unrouted queue.
+    Threads (un)registrations of concurrent subscribers are batched into single start/stop request.
+    Channel is read by the subscriber who waits for event, events of others are queued on the way.
+    """
+
+    POLL_INTERVAL = 1  # sec
+    MAX_UNROUTED = 100
+
+    def __init__(self, rpc: 'AgentRPC'):
+        self.__rpc = rpc
+        self.__queues = {}
+        self.__links = {}
+        self.__unrouted = collections.deque(maxlen=self.MAX_UNROUTED)
+        self.__pending_start = {}
+        self.__pending_stop = None
+
+    @property
+    def threads(self) -> List[str]:
+        return list(self.__queues.keys())
+
+    async def subscribe(self, thid: str, ttl: int = None):
+        """Route events of the thread to the subscriber queue and register thread on agent-side
+
+        :param thid: thread id
+        :param ttl: time to live of the thread registration
+        """
+        if thid not in self.__queues:
+            self.__queues[thid] = collections.deque()
+            self.__take_unrouted(thid)
+        batch = self.__pending_start.get(ttl, None)
+        if batch is None:
+            batch = _ThreadsBatch()
+            batch.task = asyncio.ensure_future(self.__start_threads(ttl, batch))
+            self.__pending_start[ttl] = batch
+        batch.threads.append(thid)
+        try:
+            await asyncio.shield(batch.task)
+        except Exception:
+            self.__forget(thid)
+            raise
+
+    def link(self, thid: str, owner: str):
+        """Route events of the thread to the queue of the subscribed owner thread,
+        for example acks of the ~please_ack messages sent by the owner
+
+        :param thid: thread id
+        :param owner: thread id of the subscriber
+        """
+        if owner in self.__queues:
+            self.__links[thid] = owner
+            self.__take_unrouted(thid)
+
+    def unlink(self, threads: List[str]):
+        for thid in threads:
+            self.__links.pop(thid, None)
+
+    async def unsubscribe(self, thid: str):
+        self.__forget(thid)
+        batch = self.__pending_stop
+        if batch is None:
+            batch = _ThreadsBatch()
+            batch.task = asyncio.ensure_future(self.__stop_threads(batch))
+            self.__pending_stop = batch
+        batch.threads.append(thid)
+        await asyncio.shield(batch.task)
+
+    async def read(self, thid: Optional[str], timeout: float = None) -> Message:
+        """Read event of the thread
+
+        :param thid: thread id, None to read events that are not routed to any subscriber
+        :param timeout: timeout in sec
+        """
+        queue = self.__unrouted if thid is None else self.__queues.get(thid, None)
+        if queue is None:
+            raise SiriusPendingOperation('Subscribe to thread "%s" at first' % thid)
+        loop = asyncio.get_event_loop()
+        expires_at = None if timeout is None else loop.time() + timeout
+        while not queue:
+            if thid is not None and self.__queues.get(thid, None) is not queue:
+                # transport was stopped by concurrent task, for example co-protocol was aborted
+                raise SiriusConnectionClosed('Thread "%s" is unsubscribed' % thid)
+            if expires_at is None:
+                poll = self.POLL_INTERVAL
+            else:
+                poll = min(expires_at - loop.time(), self.POLL_INTERVAL)
+                if poll <= 0:
+                    raise SiriusTimeoutIO()
+            try:
+                event = await self.__rpc._pump_protocol_channel(timeout=poll, ready=lambda: bool(queue))
+            except SiriusTimeoutIO:
+                continue
+            if event is not None:
+                self.route(event)
+        return queue.popleft()
+
+    def route(self, event: Message):
+        thid = self.__thread_of(event)
+        if thid is None:
+            self.__unrouted.append(event)
+        else:
+            self.__queues[thid].append(event)
+
+    def __thread_of(self, event: Message) -> Optional[str]:
+        message = event.get('message', None) or {}
+        thread = message.get('~thread', {})
+        for thid in (thread.get('thid', None), thread.get('pthid', None)):
+            if thid is None:
+                continue
+            if thid in self.__queues:
+                return thid
+            owner = self.__links.get(thid, None)
+            if owner in self.__queues:
+                return owner
+        return None
+
+    def __take_unrouted(self, thid: str):
+        owner = self.__links.get(thid, thid)
+        for event in list(self.__unrouted):
+            if self.__thread_of(event) == owner:
+                self.__unrouted.remove(event)
+                self.__queues[owner].append(event)
+
+    def __forget(self, thid: str):
+        self.__queues.pop(thid, None)
+        for linked in [linked for linked, owner in self.__links.items() if owner == thid]:
+            del self.__links[linked]
+
+    async def __start_threads(self, ttl: Optional[int], batch: _ThreadsBatch):
+        # let concurrent subscribers join the batch
+        await asyncio.sleep(0)
+        del self.__pending_start[ttl]
+        await self.__rpc.start_protocol_with_threads(batch.threads, ttl)
+
+    async def __stop_threads(self, batch: _ThreadsBatch):
+        await asyncio.sleep(0)
+        self.__pending_stop = None
+        await self.__rpc.stop_protocol_with_threads(batch.threads, off_response=True)
+
+
 class AgentEvents(BaseAgentConnection):
     """RPC service.
 
@@ -0,0 +1,188 @@
+import copy
+import asyncio
+import contextvars
+from typing import List, Optional, Tuple
+
+from sirius_sdk.errors.exceptions import *
+from sirius_sdk.agent.pairwise import Pairwise
+from sirius_sdk.agent.microledgers import AbstractMicroledger, Transaction
+from sirius_sdk.agent.consensus.simple.messages import SimpleConsensusProblemReport
+from sirius_sdk.agent.consensus.simple.state_machines import MicroLedgerSimpleConsensus
+from sirius_sdk.hub.latency import LatencyTracker
+
+
+class _PendingCommit:
+
+    def __init__(self, transactions: List[Transaction]):
+        self.transactions = transactions
+        self.future = asyncio.get_event_loop().create_future()
+        self.stamp = asyncio.get_event_loop().time()
+        self.problem_report = None
+
+
+class _LedgerQueue:
+
+    def __init__(self, ledger: AbstractMicroledger, participants: List[str]):
+        self.ledger = ledger
+        self.participants = participants
+        self.pending = []
+        self.pending_txns_count = 0
+        self.batch_is_full = asyncio.Event()
+        self.in_flight = []
+        self.worker = None
+
+
+class MicroLedgerGroupCommit:
+    """Group-commit front-end for MicroLedgerSimpleConsensus.
+
+    Transactions of concurrent callers are queued per ledger and committed by a single consensus round
+    when batch size or delay threshold is reached. Rounds of the same ledger are serialized since acceptors
+    check ledger state of every propose, but the next batch is accumulated while current round is in progress,
+    so it is proposed as soon as the previous round finishes.
+    """
+
+    DEF_MAX_BATCH_SIZE = 100
+    DEF_MAX_DELAY = 0.05  # sec
+
+    def __init__(
+            self, me: Pairwise.Me, time_to_live: int = 60, logger=None,
+            max_batch_size: int = DEF_MAX_BATCH_SIZE, max_delay: float = DEF_MAX_DELAY,
+            latency_tracker: LatencyTracker = None
+    ):
+        """
+        :param me: self-side of the microledger relationships
+        :param time_to_live: timeout of every consensus round
+        :param logger: consensus state machine logger
+        :param max_batch_size: transactions count that cuts the batch immediately
+        :param max_delay: max time in sec the first queued transaction waits for the batch to be filled
+        :param latency_tracker: (optional) tracker of participants response times shared by the rounds
+        """
+        if max_batch_size <= 0:
+            raise SiriusContextError('Batch size must be > 0')
+        self.__me = me
+        self.__time_to_live = time_to_live
+        self.__logger = logger
+        self.__max_batch_size = max_batch_size
+        self.__max_delay = max_delay
+        self.__latency_tracker = latency_tracker
+        self.__queues = {}
+        self.__problem_report = contextvars.ContextVar('problem_report', default=None)
+
+    @property
+    def me(self) -> Pairwise.Me:
+        return self.__me
+
+    @property
+    def problem_report(self) -> Optional[SimpleConsensusProblemReport]:
+        """Problem report of the failed round of the last commit call made in current context"""
+        return self.__problem_report.get()
+
+    async def commit(
+            self, ledger: AbstractMicroledger, participants: List[str], transactions: List[Transaction]
+    ) -> (bool, Optional[List[Transaction]]):
+        """Same as MicroLedgerSimpleConsensus.commit, but transactions may be committed in batch with others
+
+        :return: success flag and committed transactions in the same order they were passed
+        """
+        if not transactions:
+            return True, []
+        queue = self.__queues.get(ledger.name, None)
+        if queue is None:
+            queue = _LedgerQueue(ledger, participants)
+            self.__queues[ledger.name] = queue
+        elif set(queue.participants) != set(participants):
+            raise SiriusContextError('Participants differ from the ones of pending commits to "%s"' % ledger.name)
+        item = _PendingCommit(list(transactions))
+        queue.pending.append(item)
+        queue.pending_txns_count += len(item.transactions)
+        if queue.pending_txns_count >= self.__max_batch_size:
+            queue.batch_is_full.set()
+        if queue.worker is None:
+            queue.worker = asyncio.ensure_future(self.__worker(queue))
+            queue.worker.add_done_callback(lambda worker: self.__on_worker_done(queue, worker))
+        self.__problem_report.set(None)
+        ok, txns = await asyncio.shield(item.future)
+        self.__problem_report.set(item.problem_report)
+        return ok, txns
+
+    async def flush(self):
+        """Wait all queued transactions are processed"""
+        workers = [queue.worker for queue in self.__queues.values() if queue.worker is not None]
+        if workers:
+            await asyncio.wait(workers)
+
+    async def _run_round(
+            self, ledger: AbstractMicroledger, participants: List[str], transactions: List[Transaction]
+    ) -> Tuple[bool, Optional[List[Transaction]], Optional[SimpleConsensusProblemReport]]:
+        state_machine = MicroLedgerSimpleConsensus(
+            self.me, time_to_live=self.__time_to_live, logger=self.__logger, latency_tracker=self.__latency_tracker
+        )
+        ok, txns = await state_machine.commit(ledger, participants, transactions)
+        return ok, txns, state_machine.problem_report
+
+    async def __worker(self, queue: _LedgerQueue):
+        try:
+            while queue.pending:
+                if queue.pending_txns_count < self.__max_batch_size:
+                    # transactions queued while previous round was in progress may be already late
+                    elapsed = asyncio.get_event_loop().time() - queue.pending[0].stamp
+                    if elapsed < self.__max_delay:
+                        try:
+                            await asyncio.wait_for(queue.batch_is_full.wait(), self.__max_delay - elapsed)
+                        except asyncio.TimeoutError:
+                            pass
+                batch = self.__cut_batch(queue)
+                queue.in_flight = batch
+                transactions = [txn for item in batch for txn in item.transactions]
+                try:
+                    ok, txns, problem_report = await self._run_round(queue.ledger, queue.participants, transactions)
+                except Exception as e:
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                    continue
+                offset = 0
+                for item in batch:
+                    if not item.future.done():
+                        if ok:
+                            item.future.set_result((True, txns[offset:offset+len(item.transactions)]))
+                        else:
+                            # every caller gets its own copy, so it may be modified safely
+                            item.problem_report = copy.deepcopy(problem_report)
+                            item.future.set_result((False, None))
+                    offset += len(item.transactions)
+                queue.in_flight = []
+        finally:
+            self.__stop_worker(queue)
+
+    def __on_worker_done(self, queue: _LedgerQueue, worker: asyncio.Task):
+        # Worker cancelled before it was started did not run its finally block
+        if queue.worker is worker:
+            self.__stop_worker(queue)
+
+    def __stop_worker(self, queue: _LedgerQueue):
+        # Worker may be cancelled or failed: callers must not wait forever
+        outstanding = queue.in_flight + queue.pending
+        queue.in_flight = []
+        queue.pending = []
+        queue.pending_txns_count = 0
+        for item in outstanding:
+            if not item.future.done():
+                item.future.set_exception(SiriusContextError('Group commit of "%s" was interrupted' % queue.ledger.name))
+        queue.worker = None
+        if self.__queues.get(queue.ledger.name, None) is queue:
+            del self.__queues[queue.ledger.name]
+
+    def __cut_batch(self, queue: _LedgerQueue) -> List[_PendingCommit]:
+        # Callers transactions are never split among rounds
+        batch = []
+        count = 0
+        while queue.pending and (not batch or count + len(queue.pending[0].transactions) <= self.__max_batch_size):
+            item = queue.pending.pop(0)
+            batch.append(item)
+            count += len(item.transactions)
+        queue.pending_txns_count -= count
+        queue.batch_is_full.clear()
+        if queue.pending_txns_count >= self.__max_batch_size:
+            queue.batch_is_full.set()
+        return batch
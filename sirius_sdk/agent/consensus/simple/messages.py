@@ -241,8 +241,8 @@ class BaseTransactionsMessage(SimpleConsensusMessage):
     def __init__(self, transactions: List[Transaction] = None, state: Optional[MicroLedgerState] = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if transactions is not None:
+            transactions = [Transaction(txn) for txn in transactions]
             for txn in transactions:
-                txn = Transaction(txn)
                 if not txn.has_metadata():
                     raise SiriusContextError('Transaction must have processed by Ledger engine and has metadata')
             self['transactions'] = transactions
@@ -257,9 +257,14 @@ class BaseTransactionsMessage(SimpleConsensusMessage):
 
     @property
     def transactions(self) -> Optional[List[Transaction]]:
+        """Transactions of the message, they are restored once and kept by message, so memoized
+        serialization of them is reused by the next stages"""
         txns = self.get('transactions', None)
         if txns is not None:
-            return [Transaction(txn) for txn in txns]
+            for n, txn in enumerate(txns):
+                if not isinstance(txn, Transaction):
+                    txns[n] = Transaction(txn)
+            return list(txns)
         else:
             return None
 
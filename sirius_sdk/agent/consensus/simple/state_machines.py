@@ -1,13 +1,19 @@
+import time
 import uuid
+import asyncio
+import weakref
+import collections
 import logging
 import contextlib
 from datetime import datetime
-from typing import Union, Tuple
+from typing import Union, Tuple, Dict, Optional
 
 import sirius_sdk
 from sirius_sdk.agent.pairwise import AbstractPairwiseList
 from sirius_sdk.agent.microledgers import MicroledgerList, AbstractMicroledger
 from sirius_sdk.hub import CoProtocolThreadedTheirs, CoProtocolThreadedP2P
+from sirius_sdk.hub.core import _current_hub
+from sirius_sdk.hub.latency import LatencyTracker
 from sirius_sdk.base import AbstractStateMachine
 from sirius_sdk.agent.aries_rfc.feature_0015_acks import Ack, Status
 from sirius_sdk.agent.consensus.simple.messages import *
@@ -19,11 +25,120 @@ RESPONSE_NOT_ACCEPTED = "response_not_accepted"
 RESPONSE_PROCESSING_ERROR = 'response_processing_error'
 
 
+class ParticipantsCache:
+    """Pairwise of consensus participants resolved via pairwise list.
+
+    Entries are scoped to the pairwise list they were loaded from, bounded by LRU with time to live and
+    invalidated on pairwise modifications. Concurrent state machines share loading of the same participant.
+    """
+
+    DEF_MAX_SIZE = 1000
+    DEF_TTL = 300  # sec
+
+    def __init__(self, max_size: int = DEF_MAX_SIZE, ttl: float = DEF_TTL):
+        """
+        :param max_size: max count of pairwise kept per pairwise list
+        :param ttl: time to live of cached pairwise in sec
+        """
+        if max_size <= 0:
+            raise SiriusContextError('Cache size must be > 0')
+        self.__max_size = max_size
+        self.__ttl = ttl
+        # pairwise list -> {(my DID, their DID): (pairwise, expires_at)}
+        self.__scopes = weakref.WeakKeyDictionary()
+        self.__loading = {}
+        AbstractPairwiseList.add_update_listener(self.invalidate)
+
+    async def resolve(
+            self, me: Pairwise.Me, participants: List[str], pairwise_list: AbstractPairwiseList = None
+    ) -> Dict[str, Pairwise]:
+        """Resolve participants DIDs (except self) to pairwise, missing ones are loaded concurrently
+
+        :param me: self-side of relationships
+        :param participants: participants DIDs
+        :param pairwise_list: (optional) pairwise storage, storage of the current context by default
+        """
+        if pairwise_list is None:
+            pairwise_list = await _current_hub().get_pairwise_list()
+        items = self.__scopes.get(pairwise_list, None)
+        if items is None:
+            items = collections.OrderedDict()
+            self.__scopes[pairwise_list] = items
+        resolved = {}
+        missing = []
+        now = time.monotonic()
+        for did in participants:
+            if did != me.did and did not in resolved:
+                key = (me.did, did)
+                item = items.get(key, None)
+                if item is not None and item[1] > now:
+                    items.move_to_end(key)
+                    resolved[did] = item[0]
+                else:
+                    missing.append(did)
+        if missing:
+            loaded = await asyncio.gather(*[self.__load(pairwise_list, items, me.did, did) for did in set(missing)])
+            for pairwise in loaded:
+                resolved[pairwise.their.did] = pairwise
+        return resolved
+
+    def invalidate(self, their_did: str = None):
+        """Drop cached pairwise and results of pending loads for DID, all entries by default"""
+        for items in list(self.__scopes.values()):
+            if their_did is None:
+                items.clear()
+            else:
+                for key in [key for key in items.keys() if key[1] == their_did]:
+                    del items[key]
+        # result of the pending load is not cached
+        for key in [key for key in self.__loading.keys() if their_did is None or key[2] == their_did]:
+            del self.__loading[key]
+
+    async def __load(self, pairwise_list: AbstractPairwiseList, items: dict, me_did: str, their_did: str) -> Pairwise:
+        key = (id(pairwise_list), me_did, their_did)
+        loading = self.__loading.get(key, None)
+        if loading is None:
+            # Concurrent state machines share the same loading, it is not cancelled with the caller started it
+            loading = asyncio.ensure_future(self.__fetch(pairwise_list, items, key, their_did))
+            self.__loading[key] = loading
+        pairwise = await asyncio.shield(loading)
+        if pairwise is None:
+            raise SiriusValidationError(f'Unknown pairwise for DID: {their_did}')
+        return pairwise
+
+    async def __fetch(self, pairwise_list: AbstractPairwiseList, items: dict, key: tuple, their_did: str) -> Optional[Pairwise]:
+        loading = asyncio.current_task()
+        try:
+            pairwise = await pairwise_list.load_for_did(their_did)
+        finally:
+            # key may be invalidated while loading
+            actual = self.__loading.get(key, None) is loading
+            if actual:
+                del self.__loading[key]
+        if pairwise is not None and actual:
+            items[key[1:]] = (pairwise, time.monotonic() + self.__ttl)
+            items.move_to_end(key[1:])
+            while len(items) > self.__max_size:
+                items.popitem(last=False)
+        return pairwise
+
+
 class MicroLedgerSimpleConsensus(AbstractStateMachine):
 
-    def __init__(self, me: Pairwise.Me, time_to_live: int = 60, logger=None, *args, **kwargs):
+    participants_cache = ParticipantsCache()
+
+    def __init__(
+            self, me: Pairwise.Me, time_to_live: int = 60, logger=None, *args,
+            latency_tracker: LatencyTracker = None, **kwargs
+    ):
+        """
+        :param latency_tracker: (optional) tracker of participants response times, leader stops waiting
+          participants after the time derived from observed ones. Every stage waits for the whole
+          time to live by default
+        """
         super().__init__(time_to_live=time_to_live, logger=logger, *args, **kwargs)
         self.__me = me
+        self.latency_tracker = latency_tracker
         self.__problem_report = None
         self.__cached_p2p = {}
 
@@ -39,7 +154,8 @@ class MicroLedgerSimpleConsensus(AbstractStateMachine):
     async def acceptors(self, theirs: List[Pairwise], thread_id: str):
         co = CoProtocolThreadedTheirs(
             thid=thread_id,
-            theirs=theirs
+            theirs=theirs,
+            latency=self.latency_tracker
         )
         self._register_for_aborting(co)
         try:
@@ -217,13 +333,8 @@ class MicroLedgerSimpleConsensus(AbstractStateMachine):
                     raise
 
     async def _bootstrap(self, participants: List[str]):
-        for did in participants:
-            if did != self.me.did:
-                if did not in self.__cached_p2p:
-                    p = await sirius_sdk.PairwiseList.load_for_did(did)
-                    if p is None:
-                        raise SiriusValidationError(f'Unknown pairwise for DID: {did}')
-                    self.__cached_p2p[did] = p
+        resolved = await self.participants_cache.resolve(self.me, participants)
+        self.__cached_p2p.update(resolved)
 
     async def _load_ledger(self, propose: ProposeTransactionsMessage) -> AbstractMicroledger:
         try:
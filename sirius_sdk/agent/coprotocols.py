@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -12,6 +13,47 @@ from sirius_sdk.agent.microledgers import MicroledgerList
 from sirius_sdk.agent.pairwise import AbstractPairwiseList, WalletPairwiseList
 
 
+class _RPCServices:
+    """Wallet, microledgers and pairwise list over the RPC connection.
+
+    Built on first access and shared among all transports of the connection
+    """
+
+    __slots__ = ('__rpc', '__wallet', '__microledgers', '__pairwise_list')
+
+    def __init__(self, rpc: AgentRPC):
+        self.__rpc = rpc
+        self.__wallet = None
+        self.__microledgers = None
+        self.__pairwise_list = None
+
+    @staticmethod
+    def of(rpc: AgentRPC) -> '_RPCServices':
+        services = getattr(rpc, 'coprotocol_services', None)
+        if services is None:
+            services = _RPCServices(rpc)
+            rpc.coprotocol_services = services
+        return services
+
+    @property
+    def wallet(self) -> DynamicWallet:
+        if self.__wallet is None:
+            self.__wallet = DynamicWallet(self.__rpc)
+        return self.__wallet
+
+    @property
+    def microledgers(self) -> MicroledgerList:
+        if self.__microledgers is None:
+            self.__microledgers = MicroledgerList(api=self.__rpc)
+        return self.__microledgers
+
+    @property
+    def pairwise_list(self) -> AbstractPairwiseList:
+        if self.__pairwise_list is None:
+            self.__pairwise_list = WalletPairwiseList(api=(self.wallet.pairwise, self.wallet.did))
+        return self.__pairwise_list
+
+
 class AbstractCoProtocolTransport(ABC):
     """Abstraction application-level protocols in the context of interactions among agent-like things.
 
@@ -31,6 +73,13 @@ class AbstractCoProtocolTransport(ABC):
     SEC_PER_HOURS = 3600
     SEC_PER_MIN = 60
 
+    # transports are short-living and spawned in great numbers
+    __slots__ = (
+        '_rpc', '_check_protocols', '_check_verkeys', '__time_to_live', '__default_timeout', '__die_timestamp',
+        '__their_vk', '__endpoint', '__my_vk', '__routing_keys', '__is_setup', '__protocols', '__please_ack_ids',
+        '__is_started', '__pending_stops'
+    )
+
     def __init__(self, rpc: AgentRPC):
         """
         :param rpc: RPC (independent connection)
@@ -40,9 +89,6 @@ class AbstractCoProtocolTransport(ABC):
         self._check_protocols = True
         self._check_verkeys = False
         self.__default_timeout = rpc.timeout
-        self.__wallet = DynamicWallet(self._rpc)
-        self.__microledgers = MicroledgerList(api=self._rpc)
-        self.__pairwise_list = WalletPairwiseList(api=(self.__wallet.pairwise, self.__wallet.did))
         self.__die_timestamp = None
         self.__their_vk = None
         self.__endpoint = None
@@ -52,6 +98,7 @@ class AbstractCoProtocolTransport(ABC):
         self.__protocols = []
         self.__please_ack_ids = []
         self.__is_started = False
+        self.__pending_stops = []
 
     @property
     def protocols(self) -> List[str]:
@@ -75,15 +122,15 @@ class AbstractCoProtocolTransport(ABC):
 
     @property
     def wallet(self) -> DynamicWallet:
-        return self.__wallet
+        return _RPCServices.of(self._rpc).wallet
 
     @property
     def microledgers(self) -> MicroledgerList:
-        return self.__microledgers
+        return _RPCServices.of(self._rpc).microledgers
 
     @property
     def pairwise_list(self) -> AbstractPairwiseList:
-        return self.__pairwise_list
+        return _RPCServices.of(self._rpc).pairwise_list
 
     @property
     def is_alive(self) -> bool:
@@ -116,18 +163,23 @@ class AbstractCoProtocolTransport(ABC):
             raise SiriusPendingOperation('You must Setup protocol instance at first')
         try:
             self._rpc.timeout = self.__get_io_timeout()
-            await self.__setup_context(message)
+            ack_message_id = self.__ack_message_id(message)
             try:
-                event = await self._rpc.send_message(
+                await self._rpc.send_message(
                     message=message,
                     their_vk=self.__their_vk,
                     endpoint=self.__endpoint,
                     my_vk=self.__my_vk,
                     routing_keys=self.__routing_keys,
-                    coprotocol=True
+                    coprotocol=False,
+                    **self.__threads_context(ack_message_id)
                 )
+                event = await self._read_protocol_event(self._rpc.timeout)
             finally:
-                await self.__cleanup_context(message)
+                if ack_message_id:
+                    # ack is not expected anymore since switch is completed
+                    self._unlink_ack_threads([ack_message_id])
+                    self.__stop_ack_thread_soon(ack_message_id)
             if self._check_verkeys:
                 recipient_verkey = event.get('recipient_verkey', None)
                 sender_verkey = event.get('sender_verkey')
@@ -149,12 +201,19 @@ class AbstractCoProtocolTransport(ABC):
         except SiriusTimeoutIO:
             return False, None
 
-    async def get_one(self) -> (Optional[Message], str, Optional[str]):
-        timeout = self.__get_io_timeout()
+    async def get_one(self, timeout: float = None) -> (Optional[Message], str, Optional[str]):
+        """Read message of the protocol
+
+        :param timeout: (optional) reading timeout in sec, it can't exceed the rest of time to live
+        """
+        io_timeout = self.__get_io_timeout()
+        if timeout is None:
+            timeout = io_timeout
+        elif io_timeout is not None:
+            timeout = min(timeout, io_timeout)
         if (timeout is not None) and (timeout <= 0):
             raise SiriusTimeoutIO
-        self._rpc.timeout = timeout
-        event = await self._rpc.read_protocol_message()
+        event = await self._read_protocol_event(timeout)
         if 'message' in event:
             ok, message = restore_message_instance(event['message'])
             if not ok:
@@ -165,6 +224,14 @@ class AbstractCoProtocolTransport(ABC):
         recipient_verkey = event.get('recipient_verkey', None)
         return message, sender_verkey, recipient_verkey
 
+    async def _read_protocol_event(self, timeout: Optional[float]) -> Message:
+        """Read event of the protocol from co-protocols channel
+
+        :param timeout: timeout in sec
+        """
+        self._rpc.timeout = timeout
+        return await self._rpc.read_protocol_message()
+
     async def send(self, message: Message):
         """Send message and don't wait answer
 
@@ -174,7 +241,7 @@ class AbstractCoProtocolTransport(ABC):
         if not self.__is_setup:
             raise SiriusPendingOperation('You must Setup protocol instance at first')
         self._rpc.timeout = self.__get_io_timeout()
-        await self.__setup_context(message)
+        ack_message_id = self.__ack_message_id(message)
         await self._rpc.send_message(
             message=message,
             their_vk=self.__their_vk,
@@ -182,8 +249,11 @@ class AbstractCoProtocolTransport(ABC):
             my_vk=self.__my_vk,
             routing_keys=self.__routing_keys,
             coprotocol=False,
-            ignore_errors=True
+            ignore_errors=True,
+            **self.__threads_context(ack_message_id)
         )
+        if ack_message_id:
+            self.__please_ack_ids.append(ack_message_id)
 
     async def send_many(self, message: Message, to: List[Pairwise]) -> List[Any]:
         batches = [
@@ -199,28 +269,60 @@ class AbstractCoProtocolTransport(ABC):
         )
         return results
 
-    async def __setup_context(self, message: Message):
+    def __ack_message_id(self, message: Message) -> Optional[str]:
         if self.PLEASE_ACK_DECORATOR in message:
-            ack_message_id = message.get(self.PLEASE_ACK_DECORATOR, {}).get('message_id', None) or message.id
+            return message.get(self.PLEASE_ACK_DECORATOR, {}).get('message_id', None) or message.id
+        else:
+            return None
+
+    def _link_ack_thread(self, ack_message_id: str):
+        """Ack of the ~please_ack message is expected in the thread of the message id"""
+        pass
+
+    def _unlink_ack_threads(self, ack_message_ids: List[str]):
+        pass
+
+    def __threads_context(self, ack_message_id: Optional[str]) -> dict:
+        """Ack threads registration that is performed by the send request"""
+        context = {}
+        if ack_message_id:
+            self._link_ack_thread(ack_message_id)
+            context['threads'] = [ack_message_id]
+            context['threads_ttl'] = self.__get_io_timeout() or 3600
+        return context
+
+    async def __setup_context(self, message: Message):
+        ack_message_id = self.__ack_message_id(message)
+        if ack_message_id:
+            self._link_ack_thread(ack_message_id)
             ttl = self.__get_io_timeout() or 3600
             await self._rpc.start_protocol_with_threads(
                 threads=[ack_message_id], ttl=ttl
             )
             self.__please_ack_ids.append(ack_message_id)
 
-    async def __cleanup_context(self, message: Message=None):
-        if message:
-            if self.PLEASE_ACK_DECORATOR in message:
-                ack_message_id = message.get(self.PLEASE_ACK_DECORATOR, {}).get('message_id', None) or message.id
-                await self._rpc.stop_protocol_with_threads(
-                    threads=[ack_message_id], off_response=True
-                )
-                self.__please_ack_ids = [i for i in self.__please_ack_ids if i != ack_message_id]
-        else:
-            await self._rpc.stop_protocol_with_threads(
-                threads=self.__please_ack_ids, off_response=True
+    def __stop_ack_thread_soon(self, ack_message_id: str):
+        # switch does not wait one more round-trip, errors are raised by stop()
+        self.__pending_stops = [
+            task for task in self.__pending_stops if not task.done() or task.cancelled() or task.exception()
+        ]
+        self.__pending_stops.append(
+            asyncio.ensure_future(
+                self._rpc.stop_protocol_with_threads(threads=[ack_message_id], off_response=True)
             )
-            self.__please_ack_ids.clear()
+        )
+
+    async def __cleanup_context(self):
+        pending, self.__pending_stops = self.__pending_stops, []
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        self._unlink_ack_threads(self.__please_ack_ids)
+        await self._rpc.stop_protocol_with_threads(
+            threads=self.__please_ack_ids, off_response=True
+        )
+        self.__please_ack_ids.clear()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
 
     def __get_io_timeout(self):
         if self.__die_timestamp:
@@ -236,6 +338,8 @@ class AbstractCoProtocolTransport(ABC):
 
 class TheirEndpointCoProtocolTransport(AbstractCoProtocolTransport):
 
+    __slots__ = ('__endpoint', '__my_verkey')
+
     def __init__(
             self, my_verkey: str, endpoint: TheirEndpoint, rpc: AgentRPC
     ):
@@ -270,6 +374,8 @@ class TheirEndpointCoProtocolTransport(AbstractCoProtocolTransport):
 
 class PairwiseCoProtocolTransport(AbstractCoProtocolTransport):
 
+    __slots__ = ('__pairwise',)
+
     def __init__(
             self, pairwise: Pairwise, rpc: AgentRPC
     ):
@@ -308,6 +414,8 @@ class ThreadBasedCoProtocolTransport(AbstractCoProtocolTransport):
       - https://github.com/hyperledger/aries-rfcs/tree/master/concepts/0008-message-id-and-threading
     """
 
+    __slots__ = ('__thid', '__pthid', '__sender_order', '__received_orders', '__pairwise', '__their')
+
     def __init__(
             self, thid: str, pairwise: Optional[Pairwise], rpc: AgentRPC, pthid: str=None
     ):
@@ -341,11 +449,12 @@ class ThreadBasedCoProtocolTransport(AbstractCoProtocolTransport):
         if protocols is None:
             self._check_protocols = False
         await super().start(protocols, time_to_live)
-        await self._rpc.start_protocol_with_threading(self.__thid, time_to_live)
+        # thread is served by multiplexer of the RPC channel, registrations of concurrent threads are batched
+        await self._rpc.multiplexer.subscribe(self.__thid, time_to_live)
 
     async def stop(self):
         await super().stop()
-        await self._rpc.stop_protocol_with_threading(self.__thid, True)
+        await self._rpc.multiplexer.unsubscribe(self.__thid)
 
     async def switch(self, message: Message) -> (bool, Message):
         self.__prepare_message(message)
@@ -360,6 +469,19 @@ class ThreadBasedCoProtocolTransport(AbstractCoProtocolTransport):
                     self.__received_orders[recipient] = max(order, respond_sender_order)
         return ok, response
 
+    def _link_ack_thread(self, ack_message_id: str):
+        if self.is_started:
+            self._rpc.multiplexer.link(ack_message_id, self.__thid)
+
+    def _unlink_ack_threads(self, ack_message_ids: List[str]):
+        self._rpc.multiplexer.unlink(ack_message_ids)
+
+    async def _read_protocol_event(self, timeout: Optional[float]) -> Message:
+        if self.is_started:
+            return await self._rpc.multiplexer.read(self.__thid, timeout)
+        else:
+            return await super()._read_protocol_event(timeout)
+
     async def send(self, message: Message):
         self.__prepare_message(message)
         await super().send(message)
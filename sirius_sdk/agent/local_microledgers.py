@@ -0,0 +1,524 @@
+import os
+import json
+import uuid
+import mmap
+import shutil
+import struct
+import hashlib
+import datetime
+from typing import List, Union, Tuple, Optional, Iterator
+
+from sirius_sdk.errors.exceptions import *
+from sirius_sdk.agent import merkle
+from sirius_sdk.agent.microledgers import AbstractMicroledger, AbstractMicroledgerList, Transaction, MerkleInfo, \
+    AuditProof, LedgerMeta, METADATA_ATTR, calc_leaf_hash
+
+
+class _LocalMicroledger(AbstractMicroledger):
+    """Microledger maintained by SDK itself without Agent round-trips.
+
+    Transactions are kept by log in canonical serialized form together with their leaf hashes,
+    Merkle tree is maintained incrementally so appends are O(1) and root hashes/proofs are O(log n)
+    """
+
+    def __init__(self, name: str, log):
+        self.__name = name
+        self.__log = log
+        self.__tree = merkle.MerkleTree(log.leaf_hashes())
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def size(self) -> int:
+        return self.__log.committed
+
+    @property
+    def uncommitted_size(self) -> int:
+        return len(self.__tree)
+
+    @property
+    def root_hash(self) -> str:
+        return merkle.to_b58(self.__tree.root_hash(self.size))
+
+    @property
+    def uncommitted_root_hash(self) -> str:
+        return merkle.to_b58(self.__tree.root_hash())
+
+    @property
+    def seq_no(self) -> int:
+        return self.size
+
+    @property
+    def meta(self) -> LedgerMeta:
+        return self.__log.meta
+
+    def close(self):
+        """Release resources allocated by transactions log"""
+        self.__log.close()
+
+    async def reload(self):
+        self.__log.reload()
+        self.__tree = merkle.MerkleTree(self.__log.leaf_hashes())
+
+    async def rename(self, new_name: str):
+        self.__log.rename(new_name)
+        self.__name = new_name
+
+    async def init(self, genesis: List[Transaction]) -> List[Transaction]:
+        if len(self.__tree) > 0:
+            raise SiriusContextError('Microledger "%s" already initialized' % self.name)
+        txns = self.__append(genesis, None)
+        self.__log.set_committed(len(txns))
+        return txns
+
+    async def append(
+            self, transactions: Union[List[Transaction], List[dict]], txn_time: Union[str, int] = None
+    ) -> (int, int, List[Transaction]):
+        start = len(self.__tree) + 1
+        txns = self.__append(transactions, txn_time)
+        return start, start + len(txns) - 1, txns
+
+    async def commit(self, count: int) -> (int, int, List[Transaction]):
+        start = self.size + 1
+        end = min(self.size + count, self.uncommitted_size)
+        txns = self.__read(start, end)
+        self.__log.set_committed(end)
+        return start, end, txns
+
+    async def discard(self, count: int):
+        self.__truncate(max(self.uncommitted_size - count, self.size))
+
+    async def merkle_info(self, seq_no: int) -> MerkleInfo:
+        # The same semantic as Agent has: root and path of the tree built over first seq_no transactions
+        self.__check_seq_no(seq_no, self.uncommitted_size)
+        return MerkleInfo(
+            root_hash=merkle.to_b58(self.__tree.root_hash(seq_no)),
+            audit_path=merkle.to_b58(self.__tree.audit_path(seq_no - 1, seq_no))
+        )
+
+    async def audit_proof(self, seq_no: int) -> AuditProof:
+        self.__check_seq_no(seq_no, self.size)
+        return AuditProof(
+            root_hash=self.root_hash,
+            audit_path=merkle.to_b58(self.__tree.audit_path(seq_no - 1, self.size)),
+            ledger_size=self.size
+        )
+
+    def consistency_proof(self, first_size: int, second_size: int = None) -> List[str]:
+        """Proof that ledger state of first_size transactions is prefix of the state of second_size transactions"""
+        return merkle.to_b58(self.__tree.consistency_proof(first_size, second_size))
+
+    async def reset_uncommitted(self):
+        self.__truncate(self.size)
+
+    async def get_transaction(self, seq_no: int) -> Transaction:
+        self.__check_seq_no(seq_no, self.size)
+        return self.__read(seq_no, seq_no)[0]
+
+    async def get_uncommitted_transaction(self, seq_no: int) -> Transaction:
+        self.__check_seq_no(seq_no, self.uncommitted_size)
+        return self.__read(seq_no, seq_no)[0]
+
+    async def get_last_transaction(self) -> Transaction:
+        return await self.get_uncommitted_transaction(self.uncommitted_size)
+
+    async def get_last_committed_transaction(self) -> Transaction:
+        return await self.get_transaction(self.size)
+
+    async def get_all_transactions(self) -> List[Transaction]:
+        return self.__read(1, self.size)
+
+    async def get_uncommitted_transactions(self) -> List[Transaction]:
+        return self.__read(self.size + 1, self.uncommitted_size)
+
+    async def _load_page(self, start: int, end: int, uncommitted: bool) -> List[Transaction]:
+        self.__check_seq_no(start, self.uncommitted_size if uncommitted else self.size)
+        self.__check_seq_no(end, self.uncommitted_size if uncommitted else self.size)
+        return self.__read(start, end)
+
+    def __append(self, transactions: Union[List[Transaction], List[dict]], txn_time: Union[str, int] = None) -> List[Transaction]:
+        txns = []
+        records = []
+        seq_no = len(self.__tree)
+        for txn in transactions:
+            if isinstance(txn, Transaction):
+                txn = Transaction(txn)
+            elif isinstance(txn, dict):
+                txn = Transaction.create(txn)
+            else:
+                raise SiriusContextError('Unexpected transaction type')
+            seq_no += 1
+            metadata = dict(txn[METADATA_ATTR])
+            metadata['seqNo'] = seq_no
+            if txn_time is not None:
+                metadata['txnTime'] = txn_time
+            txn[METADATA_ATTR] = metadata
+            txns.append(txn)
+            records.append((txn.serialize(), calc_leaf_hash(txn)))
+        self.__log.append(records)
+        self.__tree.extend([leaf for _, leaf in records])
+        return txns
+
+    def __read(self, start: int, end: int) -> List[Transaction]:
+        if end < start:
+            return []
+        return [Transaction(json.loads(data.decode())) for data in self.__log.read(start - 1, end)]
+
+    def __truncate(self, size: int):
+        self.__log.truncate(size)
+        self.__tree.truncate(size)
+
+    @staticmethod
+    def __check_seq_no(seq_no: int, upper: int):
+        if not 1 <= seq_no <= upper:
+            raise SiriusContextError('Transaction with seqNo: %s is out of range' % seq_no)
+
+
+def _ledger_path(root_dir: str, name: str) -> str:
+    return os.path.join(root_dir, hashlib.md5(name.encode()).hexdigest())
+
+
+class _FileTransactionsLog:
+    """Append-only log of serialized transactions.
+
+    Files layout inside ledger directory:
+      - transactions.log: serialized transactions one after another
+      - transactions.idx: fixed size records (end offset of the transaction in log, leaf hash), mmap'd for reading
+      - state.json: ledger meta and count of committed transactions
+    """
+
+    INDEX_RECORD = struct.Struct('>Q32s')
+
+    def __init__(self, path: str, durable: bool = False):
+        self.__path = path
+        self.__durable = durable
+        self.__state = None
+        self.__log = None
+        self.__index = None
+        self.__mmap = None
+        self.__count = 0
+        self.reload()
+
+    @staticmethod
+    def initialize(path: str, name: str):
+        os.makedirs(path)
+        state = {
+            'meta': LedgerMeta(name=name, uid=uuid.uuid4().hex, created=str(datetime.datetime.utcnow())),
+            'committed': 0
+        }
+        with open(os.path.join(path, 'state.json'), 'w') as f:
+            json.dump(state, f)
+
+    @property
+    def meta(self) -> LedgerMeta:
+        return LedgerMeta(**self.__state['meta'])
+
+    @property
+    def committed(self) -> int:
+        return self.__state['committed']
+
+    def __len__(self):
+        return self.__count
+
+    def reload(self):
+        self.close()
+        with open(os.path.join(self.__path, 'state.json')) as f:
+            self.__state = json.load(f)
+        self.__log = open(os.path.join(self.__path, 'transactions.log'), 'a+b')
+        self.__index = open(os.path.join(self.__path, 'transactions.idx'), 'a+b')
+        # Crash recovery: drop index records that point beyond the log and log tail not covered by index
+        log_size = os.fstat(self.__log.fileno()).st_size
+        count = os.fstat(self.__index.fileno()).st_size // self.INDEX_RECORD.size
+        self.__count = count
+        while count > 0 and self.__end_offset(count - 1) > log_size:
+            count -= 1
+        self.__truncate_files(count)
+        if self.committed > count:
+            self.set_committed(count)
+
+    def close(self):
+        self.__unmap()
+        for f in [self.__log, self.__index]:
+            if f is not None:
+                f.close()
+        self.__log = self.__index = None
+
+    def rename(self, new_name: str):
+        new_path = _ledger_path(os.path.dirname(self.__path), new_name)
+        if os.path.exists(new_path):
+            raise SiriusContextError('MicroLedger with name "%s" already exists' % new_name)
+        self.__state['meta']['name'] = new_name
+        self.__save_state()
+        self.close()
+        os.rename(self.__path, new_path)
+        self.__path = new_path
+        self.reload()
+
+    def set_committed(self, count: int):
+        self.__state['committed'] = count
+        self.__save_state()
+
+    def leaf_hashes(self) -> Iterator[bytes]:
+        for index in range(self.__count):
+            yield self.__record(index)[1]
+
+    def append(self, records: List[Tuple[bytes, bytes]]):
+        if not records:
+            return
+        offset = self.__end_offset(self.__count - 1) if self.__count else 0
+        index_records = []
+        for data, leaf_hash in records:
+            offset += len(data)
+            index_records.append(self.INDEX_RECORD.pack(offset, leaf_hash))
+        # Log is written first, so index never points to the data that was not stored
+        self.__write(self.__log, b''.join(data for data, _ in records))
+        self.__write(self.__index, b''.join(index_records))
+        self.__count += len(records)
+
+    def read(self, start: int, end: int) -> List[bytes]:
+        """Read transactions with zero-based indexes [start, end)"""
+        offsets = [self.__end_offset(index) for index in range(start, end)]
+        first = self.__end_offset(start - 1) if start > 0 else 0
+        self.__log.seek(first)
+        data = self.__log.read(offsets[-1] - first)
+        result = []
+        prev = first
+        for offset in offsets:
+            result.append(data[prev - first:offset - first])
+            prev = offset
+        return result
+
+    def truncate(self, count: int):
+        self.__truncate_files(count)
+
+    def __truncate_files(self, count: int):
+        self.__unmap()
+        log_size = self.__end_offset(count - 1) if count > 0 else 0
+        self.__count = count
+        self.__index.truncate(count * self.INDEX_RECORD.size)
+        self.__log.truncate(log_size)
+        if self.__durable:
+            os.fsync(self.__index.fileno())
+            os.fsync(self.__log.fileno())
+
+    def __end_offset(self, index: int) -> int:
+        return self.__record(index)[0]
+
+    def __record(self, index: int) -> Tuple[int, bytes]:
+        pos = index * self.INDEX_RECORD.size
+        if self.__mmap is None or len(self.__mmap) < pos + self.INDEX_RECORD.size:
+            # Index grows by appends, so mapping is refreshed lazily when reading beyond it
+            self.__unmap()
+            self.__index.flush()
+            self.__mmap = mmap.mmap(self.__index.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.INDEX_RECORD.unpack_from(self.__mmap, pos)
+
+    def __unmap(self):
+        if self.__mmap is not None:
+            self.__mmap.close()
+            self.__mmap = None
+
+    def __write(self, f, data: bytes):
+        f.write(data)
+        f.flush()
+        if self.__durable:
+            os.fsync(f.fileno())
+
+    def __save_state(self):
+        file_path = os.path.join(self.__path, 'state.json')
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.__state, f)
+            if self.__durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+
+
+class FileMicroledger(_LocalMicroledger):
+    """Microledger persisted to local file system"""
+
+    def __init__(self, name: str, path: str, durable: bool = False):
+        """
+        :param name: ledger name
+        :param path: ledger directory
+        :param durable: fsync every write operation
+        """
+        super().__init__(name, _FileTransactionsLog(path, durable))
+
+
+class _LocalMicroledgerList(AbstractMicroledgerList):
+
+    def __init__(self):
+        self.instances = {}
+
+    async def leaf_hash(self, txn: Union[Transaction, bytes]) -> bytes:
+        if isinstance(txn, (Transaction, bytes)):
+            return calc_leaf_hash(txn)
+        else:
+            raise RuntimeError('Unexpected transaction type')
+
+    def close(self):
+        for instance in self.instances.values():
+            instance.close()
+        self.instances.clear()
+
+    def _instance(self, name: str) -> Optional[_LocalMicroledger]:
+        instance = self.instances.get(name, None)
+        if instance is None or instance.name != name:
+            # ledger may be renamed after it was loaded
+            instance = None
+            for key, value in list(self.instances.items()):
+                if value.name != key:
+                    del self.instances[key]
+                    self.instances[value.name] = value
+                if value.name == name:
+                    instance = value
+        return instance
+
+
+class FileMicroledgerList(_LocalMicroledgerList):
+    """Microledgers persisted to local file system: every ledger is stored in own directory inside root dir"""
+
+    def __init__(self, root_dir: str, durable: bool = False):
+        """
+        :param root_dir: directory to store ledgers in, it will be created if not exists
+        :param durable: fsync every write operation
+        """
+        super().__init__()
+        os.makedirs(root_dir, exist_ok=True)
+        self.__root_dir = root_dir
+        self.__durable = durable
+
+    async def create(self, name: str, genesis: Union[List[Transaction], List[dict]]) -> (AbstractMicroledger, List[Transaction]):
+        if await self.is_exists(name):
+            raise SiriusContextError('MicroLedger with name "%s" already exists' % name)
+        path = _ledger_path(self.__root_dir, name)
+        _FileTransactionsLog.initialize(path, name)
+        instance = FileMicroledger(name, path, self.__durable)
+        try:
+            txns = await instance.init(genesis)
+        except Exception:
+            instance.close()
+            shutil.rmtree(path)
+            raise
+        self.instances[name] = instance
+        return instance, txns
+
+    async def ledger(self, name: str) -> AbstractMicroledger:
+        instance = self._instance(name)
+        if instance is None:
+            if not await self.is_exists(name):
+                raise SiriusContextError('MicroLedger with name "%s" does not exists' % name)
+            instance = FileMicroledger(name, _ledger_path(self.__root_dir, name), self.__durable)
+            self.instances[name] = instance
+        return instance
+
+    async def reset(self, name: str):
+        if not await self.is_exists(name):
+            raise SiriusContextError('MicroLedger with name "%s" does not exists' % name)
+        instance = self._instance(name)
+        if instance is not None:
+            instance.close()
+        self.instances = {key: value for key, value in self.instances.items() if value is not instance}
+        shutil.rmtree(_ledger_path(self.__root_dir, name))
+
+    async def is_exists(self, name: str):
+        return os.path.isfile(os.path.join(_ledger_path(self.__root_dir, name), 'state.json'))
+
+    async def list(self) -> List[LedgerMeta]:
+        collection = []
+        for dir_name in sorted(os.listdir(self.__root_dir)):
+            file_path = os.path.join(self.__root_dir, dir_name, 'state.json')
+            if os.path.isfile(file_path):
+                with open(file_path) as f:
+                    collection.append(LedgerMeta(**json.load(f)['meta']))
+        return collection
+
+
+class _MemoryTransactionsLog:
+
+    def __init__(self, name: str):
+        self.__meta = LedgerMeta(name=name, uid=uuid.uuid4().hex, created=str(datetime.datetime.utcnow()))
+        self.__data = []
+        self.__leaf_hashes = []
+        self.__committed = 0
+
+    @property
+    def meta(self) -> LedgerMeta:
+        return LedgerMeta(**self.__meta)
+
+    @property
+    def committed(self) -> int:
+        return self.__committed
+
+    def __len__(self):
+        return len(self.__data)
+
+    def reload(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rename(self, new_name: str):
+        self.__meta['name'] = new_name
+
+    def set_committed(self, count: int):
+        self.__committed = count
+
+    def leaf_hashes(self) -> Iterator[bytes]:
+        return iter(self.__leaf_hashes)
+
+    def append(self, records: List[Tuple[bytes, bytes]]):
+        for data, leaf_hash in records:
+            self.__data.append(data)
+            self.__leaf_hashes.append(leaf_hash)
+
+    def read(self, start: int, end: int) -> List[bytes]:
+        return self.__data[start:end]
+
+    def truncate(self, count: int):
+        del self.__data[count:]
+        del self.__leaf_hashes[count:]
+
+
+class InMemoryMicroledger(_LocalMicroledger):
+    """Microledger kept in process memory, useful for simulations and local consensus benchmarks.
+
+    Root hashes are maintained incrementally: committed and uncommitted roots are views of the same tree
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name, _MemoryTransactionsLog(name))
+
+
+class InMemoryMicroledgerList(_LocalMicroledgerList):
+
+    async def create(self, name: str, genesis: Union[List[Transaction], List[dict]]) -> (AbstractMicroledger, List[Transaction]):
+        if await self.is_exists(name):
+            raise SiriusContextError('MicroLedger with name "%s" already exists' % name)
+        instance = InMemoryMicroledger(name)
+        txns = await instance.init(genesis)
+        self.instances[name] = instance
+        return instance, txns
+
+    async def ledger(self, name: str) -> AbstractMicroledger:
+        instance = self._instance(name)
+        if instance is None:
+            raise SiriusContextError('MicroLedger with name "%s" does not exists' % name)
+        return instance
+
+    async def reset(self, name: str):
+        instance = self._instance(name)
+        if instance is None:
+            raise SiriusContextError('MicroLedger with name "%s" does not exists' % name)
+        del self.instances[name]
+
+    async def is_exists(self, name: str):
+        return self._instance(name) is not None
+
+    async def list(self) -> List[LedgerMeta]:
+        return [instance.meta for instance in self.instances.values()]
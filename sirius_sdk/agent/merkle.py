@@ -0,0 +1,285 @@
+import hashlib
+from typing import List, Union, Iterable, Tuple
+
+from sirius_sdk.encryption import b58_to_bytes, bytes_to_b58
+from sirius_sdk.errors.exceptions import SiriusValidationError
+
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+HashValue = Union[str, bytes]
+
+
+def _ensure_bytes(value: HashValue) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    elif isinstance(value, str):
+        return b58_to_bytes(value)
+    else:
+        raise SiriusValidationError('Unexpected hash value type')
+
+
+def _split(size: int) -> int:
+    # largest power of two smaller than size (RFC 6962, 2.1)
+    k = 1
+    while k << 1 < size:
+        k <<= 1
+    return k
+
+
+def leaf_hash(data: bytes) -> bytes:
+    """Hash of the serialized transaction as it is computed by Agent Merkle tree
+
+    :param data: serialized transaction
+    :return: raw sha256 digest
+    """
+    return hashlib.sha256(LEAF_PREFIX + data).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def root_hash(leaves: List[bytes]) -> bytes:
+    """Merkle Tree Hash of the leaves list
+
+    :param leaves: leaf hashes in ledger order
+    :return: raw root hash
+    """
+    return MerkleTree(leaves).root_hash()
+
+
+def audit_path(index: int, leaves: List[bytes]) -> List[bytes]:
+    """Inclusion proof of the leaf with zero-based index in the tree built over leaves
+
+    :return: hashes list from the bottom of the tree to the top
+    """
+    return MerkleTree(leaves).audit_path(index)
+
+
+def consistency_proof(first_size: int, leaves: List[bytes]) -> List[bytes]:
+    """Proof that tree of first_size leaves is prefix of the tree built over leaves
+
+    :param first_size: size of the older tree
+    :param leaves: leaf hashes of the newer tree
+    """
+    return MerkleTree(leaves).consistency_proof(first_size)
+
+
+class MerkleTree:
+    """Incrementally maintained Merkle tree.
+
+    Keeps hashes of all complete subtrees, so append is amortized O(1) and root hash, audit path
+    and consistency proof for any prefix of the tree are calculated in O(log n) node lookups
+    """
+
+    ROOTS_CACHE_SIZE = 8
+
+    def __init__(self, leaves: List[bytes] = None):
+        self.__levels = [[]]
+        # roots of the prefixes are immutable while tree is not truncated
+        self.__roots = {}
+        if leaves:
+            self.extend(leaves)
+
+    def __len__(self):
+        return len(self.__levels[0])
+
+    def leaf(self, index: int) -> bytes:
+        return self.__levels[0][index]
+
+    def append(self, leaf: bytes):
+        self.__levels[0].append(leaf)
+        height = 0
+        while len(self.__levels[height]) % 2 == 0:
+            level = self.__levels[height]
+            if len(self.__levels) == height + 1:
+                self.__levels.append([])
+            self.__levels[height + 1].append(node_hash(level[-2], level[-1]))
+            height += 1
+
+    def extend(self, leaves: Iterable[bytes]):
+        for leaf in leaves:
+            self.append(leaf)
+
+    def truncate(self, size: int):
+        """Drop leaves after first size ones"""
+        if not 0 <= size <= len(self):
+            raise SiriusValidationError('Tree size is out of range')
+        for height, level in enumerate(self.__levels):
+            del level[size >> height:]
+        self.__roots = {key: value for key, value in self.__roots.items() if key <= size}
+        while len(self.__levels) > 1 and not self.__levels[-1]:
+            self.__levels.pop()
+
+    def root_hash(self, size: int = None) -> bytes:
+        """Root hash of the tree built over first size leaves (whole tree by default)"""
+        size = self.__check_size(size)
+        root = self.__roots.get(size, None)
+        if root is None:
+            if size == 0:
+                root = hashlib.sha256(b'').digest()
+            else:
+                root = self.__subtree_hash(0, size)
+            if len(self.__roots) >= self.ROOTS_CACHE_SIZE:
+                self.__roots.clear()
+            self.__roots[size] = root
+        return root
+
+    def audit_path(self, index: int, size: int = None) -> List[bytes]:
+        """Inclusion proof of the leaf with zero-based index in the tree of first size leaves"""
+        size = self.__check_size(size)
+        if not 0 <= index < size:
+            raise SiriusValidationError('Leaf index is out of range')
+        path = []
+        start = 0
+        while size > 1:
+            k = _split(size)
+            if index < start + k:
+                path.append(self.__subtree_hash(start + k, size - k))
+                size = k
+            else:
+                path.append(self.__subtree_hash(start, k))
+                start += k
+                size -= k
+        path.reverse()
+        return path
+
+    def consistency_proof(self, first_size: int, second_size: int = None) -> List[bytes]:
+        """Proof that tree of first_size leaves is prefix of the tree of second_size leaves"""
+        size = self.__check_size(second_size)
+        if not 0 < first_size <= size:
+            raise SiriusValidationError('Tree size is out of range')
+        proof = []
+        complete = True
+        start = 0
+        m = first_size
+        while m != size:
+            k = _split(size)
+            if m <= k:
+                proof.append(self.__subtree_hash(start + k, size - k))
+                size = k
+            else:
+                proof.append(self.__subtree_hash(start, k))
+                start += k
+                size -= k
+                m -= k
+                complete = False
+        if not complete:
+            proof.append(self.__subtree_hash(start, size))
+        proof.reverse()
+        return proof
+
+    def __check_size(self, size: int = None) -> int:
+        if size is None:
+            return len(self)
+        if not 0 <= size <= len(self):
+            raise SiriusValidationError('Tree size is out of range')
+        return size
+
+    def __subtree_hash(self, start: int, size: int) -> bytes:
+        if size & (size - 1) == 0:
+            # subtrees that appear in proofs are aligned, so complete ones are already calculated
+            height = size.bit_length() - 1
+            return self.__levels[height][start >> height]
+        k = _split(size)
+        return node_hash(self.__subtree_hash(start, k), self.__subtree_hash(start + k, size - k))
+
+
+def verify_audit_path(
+        leaf: HashValue, seq_no: int, tree_size: int, path: List[HashValue], expected_root: HashValue
+) -> bool:
+    """Check the leaf is included to the tree of tree_size leaves with expected root
+
+    :param leaf: leaf hash
+    :param seq_no: one-based sequence number of the transaction
+    :param tree_size: count of leaves the root hash was calculated for
+    :param path: audit path returned by Agent
+    :param expected_root: root hash returned by Agent
+    """
+    if not 0 < seq_no <= tree_size:
+        return False
+    fn, sn = seq_no - 1, tree_size - 1
+    r = _ensure_bytes(leaf)
+    for p in path:
+        if sn == 0:
+            return False
+        p = _ensure_bytes(p)
+        if fn & 1 or fn == sn:
+            r = node_hash(p, r)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            r = node_hash(r, p)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and r == _ensure_bytes(expected_root)
+
+
+def verify_consistency(
+        first_size: int, second_size: int, first_root: HashValue, second_root: HashValue, proof: List[HashValue]
+) -> bool:
+    """Check the tree of second_size leaves is append-only extension of the tree of first_size leaves"""
+    first_root, second_root = _ensure_bytes(first_root), _ensure_bytes(second_root)
+    if not 0 < first_size <= second_size:
+        return False
+    if first_size == second_size:
+        return not proof and first_root == second_root
+    if not proof:
+        return False
+    proof = [_ensure_bytes(p) for p in proof]
+    if first_size & (first_size - 1) == 0:
+        # first tree is complete: its root is the first node of the path
+        proof = [first_root] + proof
+    fn, sn = first_size - 1, second_size - 1
+    while fn & 1:
+        fn >>= 1
+        sn >>= 1
+    fr = sr = proof[0]
+    for c in proof[1:]:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            fr = node_hash(c, fr)
+            sr = node_hash(c, sr)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            sr = node_hash(sr, c)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and fr == first_root and sr == second_root
+
+
+def verify_many(
+        items: Iterable[Tuple[HashValue, int, int, List[HashValue], HashValue]]
+) -> List[bool]:
+    """Batch version of verify_audit_path
+
+    :param items: (leaf, seq_no, tree_size, audit_path, root_hash) tuples
+    :return: verification results in the same order
+    """
+    decoded = {}
+
+    def _decode(value: HashValue) -> bytes:
+        # audit paths of neighbour leaves share most of the nodes
+        if isinstance(value, str):
+            if value not in decoded:
+                decoded[value] = b58_to_bytes(value)
+            return decoded[value]
+        return _ensure_bytes(value)
+
+    return [
+        verify_audit_path(_decode(leaf), seq_no, tree_size, [_decode(p) for p in path], _decode(root))
+        for leaf, seq_no, tree_size, path, root in items
+    ]
+
+
+def to_b58(values: Union[bytes, List[bytes]]) -> Union[str, List[str]]:
+    """Convert hashes to the presentation used by Agent in MerkleInfo/AuditProof"""
+    if isinstance(values, bytes):
+        return bytes_to_b58(values)
+    return [bytes_to_b58(value) for value in values]
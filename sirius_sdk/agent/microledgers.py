@@ -1,23 +1,278 @@
+import os
 import json
+import asyncio
+import shelve
+import shutil
+import tempfile
+import hashlib
+import collections
 from abc import ABC, abstractmethod
-from typing import List, Union, Dict
+from typing import List, Union, Dict, Any, Optional, AsyncIterator
 
 from sirius_sdk.errors.exceptions import *
 from sirius_sdk.agent.connections import AgentRPC
+from sirius_sdk.agent import merkle
 
 
 METADATA_ATTR = 'txnMetadata'
 
 
-def serialize_ordering(value: dict) -> bytes:
-    data = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode()
-    return data
+def serialize_ordering(value: Union[dict, list]) -> bytes:
+    if isinstance(value, Transaction):
+        return value.serialize()
+    elif _contains_transactions(value):
+        return _serialize_composite(value).encode()
+    else:
+        return _dumps_ordering(value).encode()
 
 
-class Transaction(dict):
+def _dumps_ordering(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
 
-    def __init__(self, *args, **kwargs):
+
+def _contains_transactions(value: Any) -> bool:
+    if isinstance(value, Transaction):
+        return True
+    elif isinstance(value, dict):
+        return any(_contains_transactions(v) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        return any(_contains_transactions(v) for v in value)
+    else:
+        return False
+
+
+def _serialize_composite(value: Any) -> str:
+    """Build the same output as _dumps_ordering but reuse memoized dumps of nested transactions"""
+    if isinstance(value, Transaction):
+        return value.serialize().decode()
+    elif isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value.keys()):
+            return _dumps_ordering(value)
+        items = [
+            _dumps_ordering(k) + ':' + _serialize_composite(v) for k, v in sorted(value.items(), key=lambda i: i[0])
+        ]
+        return '{' + ','.join(items) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '[' + ','.join(_serialize_composite(v) for v in value) + ']'
+    else:
+        return _dumps_ordering(value)
+
+
+class _Revision:
+    """Mutation counter shared by transaction and all of its nested containers"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+
+def _track(value: Any, revision: _Revision) -> Any:
+    if isinstance(value, (_TrackedDict, _TrackedList)) and value._revision is revision:
+        return value
+    elif isinstance(value, dict):
+        return _TrackedDict(revision, value)
+    elif isinstance(value, list):
+        return _TrackedList(revision, value)
+    else:
+        return value
+
+
+class _TrackedDict(dict):
+    """Nested dict of Transaction: any mutation invalidates memoized serialization of the owner.
+
+    Nested containers are stored as is and wrapped on first access, so construction does not copy whole tree.
+    """
+
+    def __init__(self, revision: _Revision = None, *args, **kwargs):
+        self._revision = revision or _Revision()
         super().__init__(*args, **kwargs)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        tracked = _track(value, self._revision)
+        if tracked is not value:
+            dict.__setitem__(self, key, tracked)
+        return tracked
+
+    def __setitem__(self, key, value):
+        self._revision.bump()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._revision.bump()
+        super().__delitem__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        self._track_items()
+        return super().values()
+
+    def items(self):
+        self._track_items()
+        return super().items()
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        self._revision.bump()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._revision.bump()
+        return super().popitem()
+
+    def clear(self):
+        self._revision.bump()
+        super().clear()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (None, dict(self))
+
+    def _track_items(self):
+        for key, value in list(dict.items(self)):
+            tracked = _track(value, self._revision)
+            if tracked is not value:
+                dict.__setitem__(self, key, tracked)
+
+    def _track_tree(self):
+        """Wrap all nested containers, so they are not shared with the caller anymore"""
+        self._track_items()
+        for value in dict.values(self):
+            if isinstance(value, (_TrackedDict, _TrackedList)):
+                value._track_tree()
+
+
+class _TrackedList(list):
+    """Nested list of Transaction: any mutation invalidates memoized serialization of the owner.
+
+    Nested containers are stored as is and wrapped on first access, so construction does not copy whole tree.
+    """
+
+    def __init__(self, revision: _Revision = None, iterable=()):
+        self._revision = revision or _Revision()
+        super().__init__(iterable)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            self._track_items()
+            return super().__getitem__(key)
+        value = super().__getitem__(key)
+        tracked = _track(value, self._revision)
+        if tracked is not value:
+            list.__setitem__(self, key, tracked)
+        return tracked
+
+    def __iter__(self):
+        self._track_items()
+        return super().__iter__()
+
+    def __reversed__(self):
+        self._track_items()
+        return super().__reversed__()
+
+    def __setitem__(self, key, value):
+        self._revision.bump()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._revision.bump()
+        super().__delitem__(key)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, other):
+        self._revision.bump()
+        return super().__imul__(other)
+
+    def append(self, value):
+        self._revision.bump()
+        super().append(value)
+
+    def extend(self, iterable):
+        self._revision.bump()
+        super().extend(iterable)
+
+    def insert(self, index, value):
+        self._revision.bump()
+        super().insert(index, value)
+
+    def pop(self, *args):
+        self._revision.bump()
+        return super().pop(*args)
+
+    def remove(self, value):
+        self._revision.bump()
+        super().remove(value)
+
+    def clear(self):
+        self._revision.bump()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._revision.bump()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._revision.bump()
+        super().reverse()
+
+    def __reduce__(self):
+        return self.__class__, (None, list(self))
+
+    def _track_items(self):
+        for index, value in enumerate(list.__iter__(self)):
+            tracked = _track(value, self._revision)
+            if tracked is not value:
+                list.__setitem__(self, index, tracked)
+
+    def _track_tree(self):
+        self._track_items()
+        for value in list.__iter__(self):
+            if isinstance(value, (_TrackedDict, _TrackedList)):
+                value._track_tree()
+
+
+class Transaction(_TrackedDict):
+    """Microledger transaction
+
+    Canonical serialization (sorted keys, compact separators) and digests of it are memoized,
+    memo is invalidated on any mutation of transaction or nested containers. Nested containers passed
+    by the caller are shared with transaction until they are accessed through it or it is serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        source = args[0] if len(args) == 1 and not kwargs else None
+        if isinstance(source, Transaction):
+            # Copy shares nested containers with source, so it shares mutation counter as well
+            source._track_items()
+            super().__init__(source._revision, source)
+            self.__cached_revision = source.__cached_revision
+            self.__serialized = source.__serialized
+            self.__digests = source.__digests
+        else:
+            super().__init__(None, *args, **kwargs)
+            self.__cached_revision = None
+            self.__serialized = None
+            self.__digests = {}
         if METADATA_ATTR not in self:
             self[METADATA_ATTR] = {}
 
@@ -28,6 +283,35 @@ class Transaction(dict):
         else:
             return False
 
+    def serialize(self) -> bytes:
+        """Canonical representation that is used for hashing and signing"""
+        self.__check_revision()
+        if self.__serialized is None:
+            # memo must not be affected by containers of the caller
+            self._track_tree()
+            self.__serialized = _dumps_ordering(self).encode()
+        return self.__serialized
+
+    def digest(self, hashfunc: str = 'sha256', prefix: bytes = b'') -> bytes:
+        """Digest of canonical representation
+
+        :param hashfunc: hashlib algorithm name
+        :param prefix: bytes to prepend to canonical representation before hashing
+        """
+        self.__check_revision()
+        key = (hashfunc, prefix)
+        digest = self.__digests.get(key, None)
+        if digest is None:
+            hasher = hashlib.new(hashfunc)
+            hasher.update(prefix)
+            hasher.update(self.serialize())
+            digest = hasher.digest()
+            self.__digests[key] = digest
+        return digest
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
     @staticmethod
     def create(*args, **kwargs):
         inst = Transaction(*args, **kwargs)
@@ -44,6 +328,28 @@ class Transaction(dict):
         else:
             raise SiriusContextError('Unexpected input value')
 
+    def __check_revision(self):
+        if self.__cached_revision != self._revision.value:
+            self.__serialized = None
+            self.__digests = {}
+            self.__cached_revision = self._revision.value
+
+
+def calc_leaf_hash(txn: Union[Transaction, dict, bytes]) -> bytes:
+    """Leaf hash of the transaction in the same manner as Agent calculates it
+
+    :param txn: transaction or its serialization, bytes are always treated as serialized transaction
+      (as AbstractMicroledgerList.leaf_hash does), use merkle module to work with computed leaf hashes
+    """
+    if isinstance(txn, Transaction):
+        return txn.digest('sha256', merkle.LEAF_PREFIX)
+    elif isinstance(txn, dict):
+        return merkle.leaf_hash(serialize_ordering(txn))
+    elif isinstance(txn, bytes):
+        return merkle.leaf_hash(txn)
+    else:
+        raise SiriusContextError('Unexpected transaction type')
+
 
 class MerkleInfo:
 
@@ -59,6 +365,18 @@ class MerkleInfo:
     def audit_path(self) -> List[str]:
         return self.__audit_path
 
+    def verify(self, txn: Union['Transaction', bytes], seq_no: int) -> bool:
+        """Check transaction with seq_no is included to the tree with root_hash locally
+
+        :param txn: transaction or its serialization
+        :param seq_no: sequence number that was passed to merkle_info call
+        """
+        return merkle.verify_audit_path(calc_leaf_hash(txn), seq_no, self._tree_size(seq_no), self.audit_path, self.root_hash)
+
+    def _tree_size(self, seq_no: int) -> int:
+        # Agent returns merkle info of the tree built over first seq_no transactions
+        return seq_no
+
 
 class LedgerMeta(dict):
 
@@ -91,9 +409,14 @@ class AuditProof(MerkleInfo):
     def ledger_size(self) -> int:
         return self.__ledger_size
 
+    def _tree_size(self, seq_no: int) -> int:
+        return self.ledger_size
+
 
 class AbstractMicroledger(ABC):
 
+    DEF_PAGE_SIZE = 100
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -186,6 +509,50 @@ class AbstractMicroledger(ABC):
     async def get_uncommitted_transactions(self) -> List[Transaction]:
         pass
 
+    async def iter_transactions(
+            self, start: int = None, end: int = None, page_size: int = DEF_PAGE_SIZE,
+            uncommitted: bool = False, read_ahead: bool = False
+    ) -> AsyncIterator[Transaction]:
+        """Iterate over ledger history page by page, memory usage is O(page_size) regardless of ledger size
+
+        :param start: seq_no of first transaction, by default first committed (or first uncommitted)
+        :param end: seq_no of last transaction (inclusive), by default last committed (or last uncommitted)
+        :param page_size: count of transactions loaded at once
+        :param uncommitted: iterate over uncommitted transactions
+        :param read_ahead: load next page while caller is processing current one
+        """
+        if page_size <= 0:
+            raise SiriusContextError('Page size must be > 0')
+        if start is None:
+            start = self.size + 1 if uncommitted else 1
+        if end is None:
+            end = self.uncommitted_size if uncommitted else self.size
+        next_page = None
+        try:
+            for page_start in range(start, end + 1, page_size):
+                page_end = min(page_start + page_size - 1, end)
+                if next_page is None:
+                    txns = await self._load_page(page_start, page_end, uncommitted)
+                else:
+                    txns = await next_page
+                    next_page = None
+                if read_ahead and page_end < end:
+                    next_page = asyncio.ensure_future(
+                        self._load_page(page_end + 1, min(page_end + page_size, end), uncommitted)
+                    )
+                for txn in txns:
+                    yield txn
+                del txns
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def _load_page(self, start: int, end: int, uncommitted: bool) -> List[Transaction]:
+        if uncommitted:
+            return [await self.get_uncommitted_transaction(seq_no) for seq_no in range(start, end + 1)]
+        else:
+            return [await self.get_transaction(seq_no) for seq_no in range(start, end + 1)]
+
 
 class AbstractMicroledgerList(ABC):
 
@@ -207,19 +574,136 @@ class AbstractMicroledgerList(ABC):
 
     @abstractmethod
     async def leaf_hash(self, txn: Union[Transaction, bytes]) -> bytes:
+        """Leaf hash of the transaction in ledger Merkle tree
+
+        :param txn: transaction or its serialization, see calc_leaf_hash
+        """
         pass
 
     @abstractmethod
     async def list(self) -> List[LedgerMeta]:
         pass
 
+    async def load_many(self, names: List[str]) -> List[AbstractMicroledger]:
+        """Load ledgers with actual state
+
+        :param names: ledger names
+        :return: ledgers in the same order as names
+        """
+        ledgers = []
+        for name in names:
+            ledger = await self.ledger(name)
+            await ledger.reload()
+            ledgers.append(ledger)
+        return ledgers
+
+    async def reload_all(self) -> List[AbstractMicroledger]:
+        """Load all existing ledgers with actual state"""
+        collection = await self.list()
+        return await self.load_many([meta.name for meta in collection])
+
+
+class TransactionsCache:
+    """Client-side cache of committed transactions keyed by seq_no
+
+    Committed transactions are immutable, so they may be served locally. Cache holds canonical
+    serialization of transactions (so callers can't corrupt cached values) in bounded LRU,
+    evicted items are spilled to disk if spill_path or spill_dir is set.
+    """
+
+    DEF_MAX_SIZE = 1000
+
+    def __init__(self, max_size: int = DEF_MAX_SIZE, spill_path: str = None, spill_dir: str = None):
+        """
+        :param max_size: max count of transactions to keep in memory
+        :param spill_path: (optional) path to file to spill evicted transactions to
+        :param spill_dir: (optional) directory to create unique spill file in, file is removed on close
+        """
+        if max_size <= 0:
+            raise SiriusContextError('Cache size must be > 0')
+        self.__max_size = max_size
+        self.__items = collections.OrderedDict()
+        self.__own_dir = None
+        if spill_path is None and spill_dir is not None:
+            # dbm backends may create several files, so every cache owns temporary directory
+            self.__own_dir = tempfile.mkdtemp(prefix='txns-', dir=spill_dir)
+            spill_path = os.path.join(self.__own_dir, 'spill')
+        self.__spill_path = spill_path
+        self.__spill = shelve.open(spill_path, flag='n') if spill_path else None
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Close spill file, spill file created in spill_dir is removed"""
+        spill, self.__spill = getattr(self, '_TransactionsCache__spill', None), None
+        if spill is not None:
+            spill.close()
+        own_dir, self.__own_dir = getattr(self, '_TransactionsCache__own_dir', None), None
+        if own_dir is not None:
+            shutil.rmtree(own_dir, ignore_errors=True)
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def spill_path(self) -> Optional[str]:
+        return self.__spill_path
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, seq_no: int):
+        return self.__load(seq_no) is not None
+
+    def get(self, seq_no: int) -> Optional[Transaction]:
+        data = self.__load(seq_no)
+        if data is not None:
+            return Transaction(json.loads(data.decode()))
+        else:
+            return None
+
+    def put(self, seq_no: int, txn: Transaction):
+        if not isinstance(txn, Transaction):
+            txn = Transaction(txn)
+        self.__items[seq_no] = txn.serialize()
+        self.__items.move_to_end(seq_no)
+        while len(self.__items) > self.__max_size:
+            evicted_seq_no, evicted = self.__items.popitem(last=False)
+            if self.__spill is not None:
+                self.__spill[str(evicted_seq_no)] = evicted
+
+    def clear(self):
+        self.__items.clear()
+        if self.__spill is not None:
+            self.__spill.clear()
+
+    def __load(self, seq_no: int) -> Optional[bytes]:
+        data = self.__items.get(seq_no, None)
+        if data is not None:
+            self.__items.move_to_end(seq_no)
+        elif self.__spill is not None:
+            data = self.__spill.get(str(seq_no), None)
+        return data
+
 
 class Microledger(AbstractMicroledger):
 
-    def __init__(self, name: str, api: AgentRPC):
+    def __init__(self, name: str, api: AgentRPC, cache: TransactionsCache = None):
+        """
+        :param name: ledger name
+        :param api: agent connection
+        :param cache: (optional) client-side cache of committed transactions
+        """
         self.__name = name
         self.__api = api
         self.__state = None
+        self.__cache = cache
+
+    @property
+    def cache(self) -> Optional[TransactionsCache]:
+        return self.__cache
 
     @property
     def name(self) -> str:
@@ -257,7 +741,7 @@ class Microledger(AbstractMicroledger):
                 'name': self.name
             }
         )
-        self.__state = state
+        self.__set_state(state)
 
     async def rename(self, new_name: str):
         await self.__api.remote_call(
@@ -268,15 +752,18 @@ class Microledger(AbstractMicroledger):
             }
         )
         self.__name = new_name
+        self.invalidate_cache()
 
     async def init(self, genesis: List[Transaction]) -> List[Transaction]:
-        self.__state, txns = await self.__api.remote_call(
+        state, txns = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/initialize',
             params={
                 'name': self.name,
                 'genesis_txns': genesis
             }
         )
+        self.invalidate_cache()
+        self.__set_state(state)
         txns = [Transaction.from_value(txn) for txn in txns]
         return txns
 
@@ -291,41 +778,53 @@ class Microledger(AbstractMicroledger):
                 transactions_to_append.append(Transaction.create(txn))
             else:
                 raise RuntimeError('Unexpected transaction type')
-        transactions_with_meta = await self.__api.remote_call(
-            msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/append_txns_metadata',
-            params={
-                'name': self.name,
-                'txns': transactions_to_append,
-                'txn_time': txn_time
-            }
-        )
-        self.__state, start, end, appended_txns = await self.__api.remote_call(
-            msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/append_txns',
-            params={
-                'name': self.name,
-                'txns': transactions_with_meta,
-            }
-        )
+        msg_type_append = 'did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/append_txns_with_metadata'
+        if self.__api.is_feature_supported(msg_type_append):
+            try:
+                state, start, end, appended_txns = await self.__api.remote_call(
+                    msg_type=msg_type_append,
+                    params={
+                        'name': self.name,
+                        'txns': transactions_to_append,
+                        'txn_time': txn_time
+                    }
+                )
+                self.__set_state(state)
+            except SiriusPromiseContextException as e:
+                if not self.__api.is_unknown_message_type_error(e):
+                    raise
+                # Agent is outdated: transactions were not appended, use legacy flow from now
+                self.__api.mark_feature_unsupported(msg_type_append)
+                start, end, appended_txns = await self.__append_in_two_steps(transactions_to_append, txn_time)
+        else:
+            start, end, appended_txns = await self.__append_in_two_steps(transactions_to_append, txn_time)
         return start, end, Transaction.from_value(appended_txns)
 
     async def commit(self, count: int) -> (int, int, List[Transaction]):
-        self.__state, start, end, committed_txns = await self.__api.remote_call(
+        state, start, end, committed_txns = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/commit_txns',
             params={
                 'name': self.name,
                 'count': count,
             }
         )
-        return start, end, Transaction.from_value(committed_txns)
+        self.__set_state(state, is_committing=True)
+        committed_txns = Transaction.from_value(committed_txns)
+        if self.__cache is not None:
+            for seq_no, txn in zip(range(start, end + 1), committed_txns):
+                self.__cache.put(seq_no, txn)
+        return start, end, committed_txns
 
     async def discard(self, count: int):
-        self.__state = await self.__api.remote_call(
+        state = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/discard_txns',
             params={
                 'name': self.name,
                 'count': count,
             }
         )
+        self.invalidate_cache()
+        self.__set_state(state)
 
     async def merkle_info(self, seq_no: int) -> MerkleInfo:
         merkle_info = await self.__api.remote_call(
@@ -355,14 +854,20 @@ class Microledger(AbstractMicroledger):
         )
 
     async def reset_uncommitted(self):
-        self.__state = await self.__api.remote_call(
+        state = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/reset_uncommitted',
             params={
                 'name': self.name,
             }
         )
+        self.invalidate_cache()
+        self.__set_state(state)
 
     async def get_transaction(self, seq_no: int) -> Transaction:
+        if self.__cache is not None:
+            txn = self.__cache.get(seq_no)
+            if txn is not None:
+                return txn
         txn = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/get_by_seq_no',
             params={
@@ -372,6 +877,8 @@ class Microledger(AbstractMicroledger):
         )
         txn = Transaction.from_value(txn)
         assert isinstance(txn, Transaction)
+        if self.__cache is not None:
+            self.__cache.put(seq_no, txn)
         return txn
 
     async def get_uncommitted_transaction(self, seq_no: int) -> Transaction:
@@ -398,6 +905,7 @@ class Microledger(AbstractMicroledger):
         return txn
 
     async def get_last_committed_transaction(self) -> Transaction:
+        # Ledger may be committed outside since state was loaded, so last transaction is always requested
         txn = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/get_last_committed_txn',
             params={
@@ -406,18 +914,27 @@ class Microledger(AbstractMicroledger):
         )
         txn = Transaction.from_value(txn)
         assert isinstance(txn, Transaction)
+        if self.__cache is not None:
+            seq_no = txn[METADATA_ATTR].get('seqNo', None)
+            if seq_no is not None:
+                self.__cache.put(seq_no, txn)
         return txn
 
     async def get_all_transactions(self) -> List[Transaction]:
+        # Local state may be stale, so count of committed transactions is defined by Agent
         txns = await self.__api.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/get_all_txns',
             params={
                 'name': self.name
             }
         )
+        seq_numbers = [t[0] for t in txns]
         txns = [t[1] for t in txns]
         txns = Transaction.from_value(txns)
         assert isinstance(txns, list)
+        if self.__cache is not None:
+            for seq_no, txn in zip(seq_numbers, txns):
+                self.__cache.put(seq_no, txn)
         return txns
 
     async def get_uncommitted_transactions(self) -> List[Transaction]:
@@ -431,15 +948,96 @@ class Microledger(AbstractMicroledger):
         assert isinstance(txns, list)
         return txns
 
+    def invalidate_cache(self):
+        if self.__cache is not None:
+            self.__cache.clear()
+
+    def _assign_state(self, state: dict):
+        # State loaded outside, for example by bulk request of MicroledgerList
+        self.__set_state(state)
+
+    async def _load_page(self, start: int, end: int, uncommitted: bool) -> List[Transaction]:
+        if self.__cache is not None and not uncommitted:
+            seq_numbers = range(start, end + 1)
+            if all(seq_no in self.__cache for seq_no in seq_numbers):
+                return [self.__cache.get(seq_no) for seq_no in seq_numbers]
+        msg_type_range = 'did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/get_txns_range'
+        if self.__api.is_feature_supported(msg_type_range):
+            try:
+                txns = await self.__api.remote_call(
+                    msg_type=msg_type_range,
+                    params={
+                        'name': self.name,
+                        'start': start,
+                        'end': end,
+                        'uncommitted': uncommitted
+                    }
+                )
+            except SiriusPromiseContextException as e:
+                if not self.__api.is_unknown_message_type_error(e):
+                    raise
+                # Agent is outdated: load page transaction by transaction from now
+                self.__api.mark_feature_unsupported(msg_type_range)
+                return await super()._load_page(start, end, uncommitted)
+        else:
+            return await super()._load_page(start, end, uncommitted)
+        page = []
+        for seq_no, txn in txns:
+            txn = Transaction.from_value(txn)
+            if self.__cache is not None and not uncommitted:
+                self.__cache.put(seq_no, txn)
+            page.append(txn)
+        return page
+
     def __check_state_is_exists(self):
         if self.__state is None:
             raise SiriusContextError('Load state of Microledger at First!')
 
+    def __set_state(self, state: dict, is_committing: bool = False):
+        if self.__state is not None and state is not None:
+            # Committed transactions may be changed outside only if ledger was re-created
+            root_hash_changed = self.__state['root_hash'] != state['root_hash']
+            if root_hash_changed and not is_committing:
+                self.invalidate_cache()
+            elif state['size'] < self.__state['size']:
+                self.invalidate_cache()
+        self.__state = state
+
+    async def __append_in_two_steps(
+            self, transactions: List[Transaction], txn_time: Union[str, int] = None
+    ) -> (int, int, List[dict]):
+        transactions_with_meta = await self.__api.remote_call(
+            msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/append_txns_metadata',
+            params={
+                'name': self.name,
+                'txns': transactions,
+                'txn_time': txn_time
+            }
+        )
+        state, start, end, appended_txns = await self.__api.remote_call(
+            msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/append_txns',
+            params={
+                'name': self.name,
+                'txns': transactions_with_meta,
+            }
+        )
+        self.__set_state(state)
+        return start, end, appended_txns
+
 
 class MicroledgerList(AbstractMicroledgerList):
 
-    def __init__(self, api: AgentRPC):
+    BULK_SIZE = 500
+
+    def __init__(self, api: AgentRPC, cache_size: Optional[int] = None, spill_dir: str = None):
+        """
+        :param api: agent connection
+        :param cache_size: (optional) max count of committed transactions cached in memory per ledger, disabled by default
+        :param spill_dir: (optional) directory to spill transactions evicted from cache to
+        """
         self.__api = api
+        self.__cache_size = cache_size
+        self.__spill_dir = spill_dir
         self.instances = {}
 
     async def create(self, name: str, genesis: Union[List[Transaction], List[dict]]) -> (AbstractMicroledger, List[Transaction]):
@@ -451,7 +1049,7 @@ class MicroledgerList(AbstractMicroledgerList):
                 genesis_txns.append(Transaction.create(txn))
             else:
                 raise RuntimeError('Unexpected transaction type')
-        instance = Microledger(name, self.__api)
+        instance = Microledger(name, self.__api, self.__create_cache())
         txns = await instance.init(genesis_txns)
         self.instances[name] = instance
         return instance, txns
@@ -459,7 +1057,7 @@ class MicroledgerList(AbstractMicroledgerList):
     async def ledger(self, name: str) -> AbstractMicroledger:
         if name not in self.instances:
             await self.__check_is_exists(name)
-            instance = Microledger(name, self.__api)
+            instance = Microledger(name, self.__api, self.__create_cache())
             self.instances[name] = instance
         return self.instances[name]
 
@@ -472,7 +1070,8 @@ class MicroledgerList(AbstractMicroledgerList):
             }
         )
         if name in self.instances.keys():
-            del self.instances[name]
+            self.instances[name].invalidate_cache()
+            self.__close_cache(self.instances.pop(name))
 
     async def is_exists(self, name: str):
         is_exists = await self.__api.remote_call(
@@ -484,19 +1083,11 @@ class MicroledgerList(AbstractMicroledgerList):
         return is_exists
 
     async def leaf_hash(self, txn: Union[Transaction, bytes]) -> bytes:
-        if isinstance(txn, Transaction):
-            data = json.dumps(txn, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode()
-        elif isinstance(txn, bytes):
-            data = txn
+        # calculated locally with the same scheme as Agent does, no round-trip required
+        if isinstance(txn, (Transaction, bytes)):
+            return calc_leaf_hash(txn)
         else:
             raise RuntimeError('Unexpected transaction type')
-        leaf_hash = await self.__api.remote_call(
-            msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/leaf_hash',
-            params={
-                'data': data
-            }
-        )
-        return leaf_hash
 
     async def list(self) -> List[LedgerMeta]:
         collection = await self.__api.remote_call(
@@ -507,8 +1098,59 @@ class MicroledgerList(AbstractMicroledgerList):
         )
         return [LedgerMeta(**item) for item in collection]
 
+    async def load_many(self, names: List[str]) -> List[AbstractMicroledger]:
+        if not names:
+            return []
+        msg_type_states = 'did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/microledgers/1.0/states'
+        if not self.__api.is_feature_supported(msg_type_states):
+            return await super().load_many(names)
+        states = {}
+        try:
+            for i in range(0, len(names), self.BULK_SIZE):
+                chunk = await self.__api.remote_call(
+                    msg_type=msg_type_states,
+                    params={
+                        'names': names[i:i+self.BULK_SIZE]
+                    }
+                )
+                states.update(chunk)
+        except SiriusPromiseContextException as e:
+            if not self.__api.is_unknown_message_type_error(e):
+                raise
+            # Agent is outdated: load ledgers one by one from now
+            self.__api.mark_feature_unsupported(msg_type_states)
+            return await super().load_many(names)
+        for name in names:
+            if states.get(name, None) is None:
+                raise SiriusContextError('MicroLedger with name "%s" does not exists' % name)
+        ledgers = []
+        for name in names:
+            instance = self.instances.get(name, None)
+            if instance is None:
+                instance = Microledger(name, self.__api, self.__create_cache())
+                self.instances[name] = instance
+            instance._assign_state(states[name])
+            ledgers.append(instance)
+        return ledgers
+
+    def __create_cache(self) -> Optional[TransactionsCache]:
+        if self.__cache_size:
+            return TransactionsCache(max_size=self.__cache_size, spill_dir=self.__spill_dir)
+        else:
+            return None
+
+    def close(self):
+        """Release caches of loaded ledgers, spill files are removed"""
+        for instance in self.instances.values():
+            self.__close_cache(instance)
+
+    @staticmethod
+    def __close_cache(instance: Microledger):
+        if instance.cache is not None:
+            instance.cache.close()
+
     async def __check_is_exists(self, name: str):
         if name not in self.instances.keys():
             is_exists = await self.is_exists(name)
             if not is_exists:
-                raise SiriusContextError('MicroLedger with name "" does not exists' % name)
+                raise SiriusContextError('MicroLedger with name "%s" does not exists' % name)
@@ -1,18 +1,35 @@
 import sys
+import json
+import time
+import asyncio
+import weakref
+import collections
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Callable, Any, Awaitable, Union
 from urllib.parse import urlparse, urlunparse
 
+from sirius_sdk.errors.exceptions import SiriusContextError
 from sirius_sdk.agent.wallet.abstract.did import AbstractDID
 from sirius_sdk.agent.wallet.abstract.pairwise import AbstractPairwise
 
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    # endpoints, routing keys and self-side keys are repeated among relationships
+    return sys.intern(value) if type(value) is str else value
+
+
+def _load_did_doc(value: Union[dict, str, None]) -> Optional[dict]:
+    return json.loads(value) if isinstance(value, str) else value
+
+
 class TheirEndpoint:
 
+    __slots__ = ('endpoint', 'verkey', 'routing_keys')
+
     def __init__(self, endpoint: str, verkey: str, routing_keys: List[str]=None):
-        self.endpoint = endpoint
+        self.endpoint = _intern(endpoint)
         self.verkey = verkey
-        self.routing_keys = routing_keys or []
+        self.routing_keys = [_intern(key) for key in routing_keys] if routing_keys else []
 
     @property
     def netloc(self) -> Optional[str]:
@@ -26,28 +43,58 @@ class TheirEndpoint:
         if self.endpoint:
             components = list(urlparse(self.endpoint))
             components[1] = value
-            self.endpoint = urlunparse(components)
+            self.endpoint = _intern(urlunparse(components))
 
 
 class Pairwise:
 
+    __slots__ = ('__me', '__their', '__metadata', '__extras', '__snapshot')
+
     class Their(TheirEndpoint):
 
+        __slots__ = ('did', 'label', '__did_doc')
+
         def __init__(
                 self, did: str, label: str, endpoint: str, verkey: str,
-                routing_keys: List[str] = None, did_doc: dict = None
+                routing_keys: List[str] = None, did_doc: Union[dict, str] = None
         ):
+            """
+            :param did_doc: DID Doc or its JSON that is parsed on first access
+            """
             self.did = did
             self.label = label
-            self.did_doc = did_doc
+            self.__did_doc = did_doc
             super().__init__(endpoint, verkey, routing_keys)
 
+        @property
+        def did_doc(self) -> Optional[dict]:
+            self.__did_doc = _load_did_doc(self.__did_doc)
+            return self.__did_doc
+
+        @did_doc.setter
+        def did_doc(self, value: Union[dict, str, None]):
+            self.__did_doc = value
+
     class Me:
 
-        def __init__(self, did, verkey, did_doc: dict = None):
-            self.did = did
-            self.verkey = verkey
-            self.did_doc = did_doc
+        __slots__ = ('did', 'verkey', '__did_doc')
+
+        def __init__(self, did, verkey, did_doc: Union[dict, str] = None):
+            """
+            :param did_doc: DID Doc or its JSON that is parsed on first access
+            """
+            self.did = _intern(did)
+            self.verkey = _intern(verkey)
+            self.__did_doc = did_doc
+
+        @property
+        def did_doc(self) -> Optional[dict]:
+            self.__did_doc = _load_did_doc(self.__did_doc)
+            return self.__did_doc
+
+        @did_doc.setter
+        def did_doc(self, value: Union[dict, str, None]):
+            self.__did_doc = value
 
         def __eq__(self, other):
             if isinstance(other, Pairwise.Me):
@@ -57,6 +104,8 @@ class Pairwise:
         self.__me = me
         self.__their = their
         self.__metadata = metadata
+        self.__extras = None
+        self.__snapshot = None
 
     @property
     def their(self) -> Their:
@@ -68,11 +117,113 @@ class Pairwise:
 
     @property
     def metadata(self) -> dict:
+        if self.__extras is not None:
+            # Restored in compact form: metadata is materialized on first access from relationship fields
+            # as they were restored, changes of me/their made since then are not reflected
+            metadata = dict(self.__extras)
+            metadata.update(_snapshot_metadata(self.__snapshot))
+            self.__metadata = metadata
+            self.__extras = None
+            self.__snapshot = None
         return self.__metadata
 
+    @staticmethod
+    def _compact(me: Me, their: Their, extras: dict, me_did_doc: Any, their_did_doc: Any) -> 'Pairwise':
+        """Pairwise which metadata is extras plus relationship fields, fields are snapshotted since
+        me/their may be modified before metadata is accessed
+
+        :param me_did_doc: DID Doc of me as it was restored (dict or JSON)
+        :param their_did_doc: DID Doc of their as it was restored (dict or JSON)
+        """
+        pairwise = Pairwise(me, their)
+        pairwise.__extras = extras
+        pairwise.__snapshot = (
+            me.did, me.verkey, me_did_doc,
+            their.did, their.verkey, their.label, their.endpoint, tuple(their.routing_keys), their_did_doc
+        )
+        return pairwise
+
+
+def _snapshot_metadata(snapshot: tuple) -> dict:
+    me_did, me_verkey, me_did_doc, their_did, their_verkey, label, endpoint, routing_keys, their_did_doc = snapshot
+    return {
+        'me': {
+            'did': me_did,
+            'verkey': me_verkey,
+            'did_doc': _load_did_doc(me_did_doc)
+        },
+        'their': {
+            'did': their_did,
+            'verkey': their_verkey,
+            'label': label,
+            'endpoint': {
+                'address': endpoint,
+                'routing_keys': list(routing_keys)
+            },
+            'did_doc': _load_did_doc(their_did_doc)
+        }
+    }
+
+
+def _relationship_metadata(pairwise: Pairwise) -> dict:
+    return {
+        'me': {
+            'did': pairwise.me.did,
+            'verkey': pairwise.me.verkey,
+            'did_doc': pairwise.me.did_doc
+        },
+        'their': {
+            'did': pairwise.their.did,
+            'verkey': pairwise.their.verkey,
+            'label': pairwise.their.label,
+            'endpoint': {
+                'address': pairwise.their.endpoint,
+                'routing_keys': pairwise.their.routing_keys
+            },
+            'did_doc': pairwise.their.did_doc
+        }
+    }
+
+
+class BulkResult:
+    """Outcome of the bulk operation for single pairwise"""
+
+    def __init__(self, pairwise: Pairwise, created: bool = False, error: Exception = None):
+        self.pairwise = pairwise
+        self.created = created
+        self.error = error
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
 
 class AbstractPairwiseList(ABC):
 
+    DEF_BULK_CONCURRENCY = 16
+
+    # Process-wide observers of pairwise modifications, for example caches of resolved pairwise
+    __update_listeners = []
+
+    @staticmethod
+    def add_update_listener(listener: Callable[[str], None]):
+        """Subscribe to pairwise modifications
+
+        :param listener: callable that accepts DID of the modified relationship
+        """
+        if listener not in AbstractPairwiseList.__update_listeners:
+            AbstractPairwiseList.__update_listeners.append(listener)
+
+    @staticmethod
+    def remove_update_listener(listener: Callable[[str], None]):
+        if listener in AbstractPairwiseList.__update_listeners:
+            AbstractPairwiseList.__update_listeners.remove(listener)
+
+    @staticmethod
+    def _notify_updated(their_did: str):
+        for listener in list(AbstractPairwiseList.__update_listeners):
+            listener(their_did)
+
     @abstractmethod
     async def create(self, pairwise: Pairwise):
         raise NotImplemented
@@ -97,6 +248,54 @@ class AbstractPairwiseList(ABC):
     async def load_for_verkey(self, their_verkey: str) -> Optional[Pairwise]:
         raise NotImplemented
 
+    async def create_many(
+            self, collection: List[Pairwise], concurrency: int = DEF_BULK_CONCURRENCY
+    ) -> List[BulkResult]:
+        """Create pairwise, up to concurrency items are processed at once
+
+        :return: results in the same order as collection, failure of item doesn't stop others
+        """
+        async def create(pairwise: Pairwise) -> bool:
+            await self.create(pairwise)
+            return True
+
+        return await self._run_bulk(collection, create, concurrency)
+
+    async def ensure_exists_many(
+            self, collection: List[Pairwise], concurrency: int = DEF_BULK_CONCURRENCY
+    ) -> List[BulkResult]:
+        """Same as create_many but existing pairwise are updated"""
+        async def ensure_exists(pairwise: Pairwise) -> bool:
+            if await self.is_exists(pairwise.their.did):
+                await self.update(pairwise)
+                return False
+            else:
+                await self.create(pairwise)
+                return True
+
+        return await self._run_bulk(collection, ensure_exists, concurrency)
+
+    @staticmethod
+    async def _run_bulk(
+            collection: List[Pairwise], operation: Callable[[Pairwise], Awaitable[bool]], concurrency: int
+    ) -> List[BulkResult]:
+        if concurrency <= 0:
+            raise SiriusContextError('Concurrency must be > 0')
+        results = [None] * len(collection)
+        pending = iter(enumerate(collection))
+
+        # Workers pull items so count of coroutines is bounded regardless of collection size
+        async def worker():
+            for index, pairwise in pending:
+                try:
+                    created = await operation(pairwise)
+                    results[index] = BulkResult(pairwise, created=created)
+                except Exception as e:
+                    results[index] = BulkResult(pairwise, error=e)
+
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, len(collection)))])
+        return results
+
     async def enumerate(self):
         cur = 0
         await self._start_loading()
@@ -130,10 +329,32 @@ class AbstractPairwiseList(ABC):
 
 class WalletPairwiseList(AbstractPairwiseList):
 
-    def __init__(self, api: (AbstractPairwise, AbstractDID)):
+    __ME_FIELDS = {'did', 'verkey', 'did_doc'}
+    __THEIR_FIELDS = {'did', 'verkey', 'label', 'endpoint', 'did_doc'}
+    __ENDPOINT_FIELDS = {'address', 'routing_keys'}
+    DEF_PAGE_SIZE = 100
+
+    def __init__(
+            self, api: (AbstractPairwise, AbstractDID), page_size: int = DEF_PAGE_SIZE, prefetch: bool = True,
+            lazy_did_docs: bool = False
+    ):
+        """
+        :param api: wallet services
+        :param page_size: count of pairwise loaded at once by enumerate
+        :param prefetch: load next page while caller is processing current one
+        :param lazy_did_docs: keep DID Docs of restored pairwise serialized until they are accessed,
+          it reduces memory of large lists at the cost of serialization on restore
+        """
+        if page_size <= 0:
+            raise SiriusContextError('Page size must be > 0')
         self._api_pairwise = api[0]
         self._api_did = api[1]
+        self.__page_size = page_size
+        self.__prefetch = prefetch
+        self.__lazy_did_docs = lazy_did_docs
         self.__is_loading = False
+        self.__offset = 0
+        self.__next_page = None
 
     async def create(self, pairwise: Pairwise):
         await self._api_did.store_their_did(did=pairwise.their.did, verkey=pairwise.their.verkey)
@@ -145,6 +366,7 @@ class WalletPairwiseList(AbstractPairwiseList):
             metadata=metadata,
             tags=self._build_tags(pairwise)
         )
+        self._notify_updated(pairwise.their.did)
 
     async def update(self, pairwise: Pairwise):
         await self._api_pairwise.set_pairwise_metadata(
@@ -152,6 +374,7 @@ class WalletPairwiseList(AbstractPairwiseList):
             metadata=pairwise.metadata,
             tags=self._build_tags(pairwise)
         )
+        self._notify_updated(pairwise.their.did)
 
     async def is_exists(self, their_did: str) -> bool:
         return await self._api_pairwise.is_pairwise_exists(their_did=their_did)
@@ -166,7 +389,7 @@ class WalletPairwiseList(AbstractPairwiseList):
         if await self.is_exists(their_did):
             raw = await self._api_pairwise.get_pairwise(their_did)
             metadata = raw['metadata']
-            pairwise = self._restore_pairwise(metadata)
+            pairwise = self._restore_pairwise(metadata, self.__lazy_did_docs)
             return pairwise
         else:
             return None
@@ -175,24 +398,42 @@ class WalletPairwiseList(AbstractPairwiseList):
         collection, count = await self._api_pairwise.search(tags={'their_verkey': their_verkey}, limit=1)
         if collection:
             metadata = collection[0]['metadata']
-            pairwise = self._restore_pairwise(metadata)
+            pairwise = self._restore_pairwise(metadata, self.__lazy_did_docs)
             return pairwise
         else:
             return None
 
     async def _start_loading(self):
         self.__is_loading = True
+        self.__offset = 0
+        self.__next_page = None
 
     async def _partial_load(self) -> (bool, List[Pairwise]):
-        if self.__is_loading:
-            items = await self._api_pairwise.list_pairwise()
-            self.__is_loading = False
-            return True, [self._restore_pairwise(item['metadata']) for item in items]
+        # Pairwise are restored page by page, so memory usage is O(page_size) regardless of wallet size
+        if not self.__is_loading:
+            return False, []
+        if self.__next_page is not None:
+            items, total = await self.__next_page
+            self.__next_page = None
         else:
+            items, total = await self._api_pairwise.list_pairwise_page(self.__offset, self.__page_size)
+        if not items:
+            self.__is_loading = False
             return False, []
+        self.__offset += len(items)
+        if len(items) < self.__page_size or (total is not None and self.__offset >= total):
+            self.__is_loading = False
+        elif self.__prefetch:
+            self.__next_page = asyncio.ensure_future(
+                self._api_pairwise.list_pairwise_page(self.__offset, self.__page_size)
+            )
+        return True, [self._restore_pairwise(item['metadata'], self.__lazy_did_docs) for item in items]
 
     async def _stop_loading(self):
         self.__is_loading = False
+        if self.__next_page is not None:
+            self.__next_page.cancel()
+            self.__next_page = None
 
     @staticmethod
     def _build_tags(p: Pairwise):
@@ -203,42 +444,280 @@ class WalletPairwiseList(AbstractPairwiseList):
         }
 
     @staticmethod
-    def _restore_pairwise(metadata: dict):
-        pairwise = Pairwise(
-            me=Pairwise.Me(
-                did=metadata.get('me', {}).get('did', None),
-                verkey=metadata.get('me', {}).get('verkey', None),
-                did_doc=metadata.get('me', {}).get('did_doc', None)
-            ),
-            their=Pairwise.Their(
-                did=metadata.get('their', {}).get('did', None),
-                verkey=metadata.get('their', {}).get('verkey', None),
-                label=metadata.get('their', {}).get('label', None),
-                endpoint=metadata.get('their', {}).get('endpoint', {}).get('address', None),
-                routing_keys=metadata.get('their', {}).get('endpoint', {}).get('routing_keys', None),
-                did_doc=metadata.get('their', {}).get('did_doc', None)
-            ),
-            metadata=metadata
+    def _restore_pairwise(metadata: dict, lazy_did_docs: bool = False):
+        me = metadata.get('me', {})
+        their = metadata.get('their', {})
+        endpoint = their.get('endpoint', {})
+        compact = set(me.keys()) == WalletPairwiseList.__ME_FIELDS and \
+            set(their.keys()) == WalletPairwiseList.__THEIR_FIELDS and \
+            set(endpoint.keys()) == WalletPairwiseList.__ENDPOINT_FIELDS and isinstance(endpoint['routing_keys'], list)
+        if compact and lazy_did_docs:
+            # Metadata is not retained: DID Docs are kept serialized until they are accessed
+            me_did_doc = json.dumps(me['did_doc']) if me['did_doc'] is not None else None
+            their_did_doc = json.dumps(their['did_doc']) if their['did_doc'] is not None else None
+        else:
+            me_did_doc = me.get('did_doc', None)
+            their_did_doc = their.get('did_doc', None)
+        restored_me = Pairwise.Me(
+            did=me.get('did', None),
+            verkey=me.get('verkey', None),
+            did_doc=me_did_doc
         )
-        return pairwise
+        restored_their = Pairwise.Their(
+            did=their.get('did', None),
+            verkey=their.get('verkey', None),
+            label=their.get('label', None),
+            endpoint=endpoint.get('address', None),
+            routing_keys=endpoint.get('routing_keys', None),
+            did_doc=their_did_doc
+        )
+        if compact:
+            extras = {key: value for key, value in metadata.items() if key not in ('me', 'their')}
+            return Pairwise._compact(restored_me, restored_their, extras, me_did_doc, their_did_doc)
+        else:
+            return Pairwise(me=restored_me, their=restored_their, metadata=metadata)
 
     @staticmethod
     def _build_metadata(pairwise: Pairwise) -> dict:
-        metadata = {
-            'me': {
-                'did': pairwise.me.did,
-                'verkey': pairwise.me.verkey,
-                'did_doc': pairwise.me.did_doc
-            },
-            'their': {
-                'did': pairwise.their.did,
-                'verkey': pairwise.their.verkey,
-                'label': pairwise.their.label,
-                'endpoint': {
-                    'address': pairwise.their.endpoint,
-                    'routing_keys': pairwise.their.routing_keys
-                },
-                'did_doc': pairwise.their.did_doc
-            }
+        return _relationship_metadata(pairwise)
+
+
+class CachedPairwiseList(AbstractPairwiseList):
+    """Caching decorator of pairwise list.
+
+    Pairwise are indexed by their DID and their verkey in bounded LRU with time to live, misses are
+    cached too (for shorter time). Modifications made through the decorator are written through to the
+    cache, modifications made elsewhere in the process invalidate it.
+    """
+
+    DEF_MAX_SIZE = 10000
+    DEF_TTL = 60  # sec
+    DEF_NEGATIVE_TTL = 5  # sec
+
+    def __init__(
+            self, pairwise_list: AbstractPairwiseList, max_size: int = DEF_MAX_SIZE,
+            ttl: float = DEF_TTL, negative_ttl: float = DEF_NEGATIVE_TTL
+    ):
+        """
+        :param pairwise_list: decorated pairwise list
+        :param max_size: max count of cached pairwise (and of cached misses)
+        :param ttl: time to live of cached pairwise in sec, None for unlimited
+        :param negative_ttl: time to live of cached misses in sec, 0 to disable negative caching
+        """
+        if max_size <= 0:
+            raise SiriusContextError('Cache size must be > 0')
+        self.__pairwise_list = pairwise_list
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__negative_ttl = negative_ttl
+        self.__by_did = collections.OrderedDict()
+        self.__by_verkey = {}
+        self.__missing = collections.OrderedDict()
+        self.__loading = {}
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        # listeners list must not keep cache alive
+        ref = weakref.WeakMethod(self.__on_updated)
+
+        def listener(their_did: str):
+            method = ref()
+            if method is not None:
+                method(their_did)
+            else:
+                AbstractPairwiseList.remove_update_listener(listener)
+
+        AbstractPairwiseList.add_update_listener(listener)
+
+    @property
+    def pairwise_list(self) -> AbstractPairwiseList:
+        return self.__pairwise_list
+
+    @property
+    def metrics(self) -> dict:
+        lookups = self.__hits + self.__misses
+        return {
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'evictions': self.__evictions,
+            'hit_rate': self.__hits / lookups if lookups else 0.0,
+            'size': len(self.__by_did),
+            'missing_size': len(self.__missing)
         }
-        return metadata
+
+    def __len__(self):
+        return len(self.__by_did)
+
+    async def create(self, pairwise: Pairwise):
+        await self.__pairwise_list.create(pairwise)
+        self.__put(pairwise)
+
+    async def update(self, pairwise: Pairwise):
+        await self.__pairwise_list.update(pairwise)
+        self.__put(pairwise)
+
+    async def create_many(
+            self, collection: List[Pairwise], concurrency: int = AbstractPairwiseList.DEF_BULK_CONCURRENCY
+    ) -> List[BulkResult]:
+        results = await self.__pairwise_list.create_many(collection, concurrency)
+        self.__put_succeeded(results)
+        return results
+
+    async def ensure_exists_many(
+            self, collection: List[Pairwise], concurrency: int = AbstractPairwiseList.DEF_BULK_CONCURRENCY
+    ) -> List[BulkResult]:
+        results = await self.__pairwise_list.ensure_exists_many(collection, concurrency)
+        self.__put_succeeded(results)
+        return results
+
+    async def is_exists(self, their_did: str) -> bool:
+        found, pairwise = self.__lookup(their_did=their_did)
+        if found:
+            return pairwise is not None
+        exists = await self.__pairwise_list.is_exists(their_did)
+        if not exists:
+            self.__put_missing(('did', their_did))
+        return exists
+
+    async def ensure_exists(self, pairwise: Pairwise):
+        # cached state may be stale, decorated list decides whether pairwise is created or updated
+        await self.__pairwise_list.ensure_exists(pairwise)
+        self.__put(pairwise)
+
+    async def load_for_did(self, their_did: str) -> Optional[Pairwise]:
+        found, pairwise = self.__lookup(their_did=their_did)
+        if found:
+            return pairwise
+        return await self.__load(('did', their_did), self.__pairwise_list.load_for_did)
+
+    async def load_for_verkey(self, their_verkey: str) -> Optional[Pairwise]:
+        found, pairwise = self.__lookup(their_verkey=their_verkey)
+        if found:
+            return pairwise
+        return await self.__load(('verkey', their_verkey), self.__pairwise_list.load_for_verkey)
+
+    def invalidate(self, their_did: str = None, their_verkey: str = None):
+        """Drop cached pairwise, misses and results of pending loads for DID, all entries by default
+
+        :param their_did: DID of the modified pairwise
+        :param their_verkey: (optional) verkey of the modified pairwise, if it is unknown
+          misses and pending loads of all verkeys are dropped since any of them may become a hit
+        """
+        if their_did is None:
+            self.__by_did.clear()
+            self.__by_verkey.clear()
+            self.__missing.clear()
+            self.__loading.clear()
+            return
+        entry = self.__by_did.get(their_did, None)
+        if their_verkey is None and entry is not None:
+            their_verkey = entry[0].their.verkey
+        self.__drop(their_did)
+        keys = [('did', their_did)]
+        if their_verkey is not None:
+            keys.append(('verkey', their_verkey))
+        else:
+            keys.extend(key for key in list(self.__missing) + list(self.__loading) if key[0] == 'verkey')
+        for key in keys:
+            self.__missing.pop(key, None)
+            # result of the pending load is not cached
+            self.__loading.pop(key, None)
+
+    async def enumerate(self):
+        async for item in self.__pairwise_list.enumerate():
+            yield item
+
+    async def _start_loading(self):
+        await self.__pairwise_list._start_loading()
+
+    async def _partial_load(self) -> (bool, List[Pairwise]):
+        return await self.__pairwise_list._partial_load()
+
+    async def _stop_loading(self):
+        await self.__pairwise_list._stop_loading()
+
+    def __on_updated(self, their_did: str):
+        self.invalidate(their_did)
+
+    def __lookup(self, their_did: str = None, their_verkey: str = None) -> (bool, Optional[Pairwise]):
+        now = time.monotonic()
+        if their_did is None:
+            their_did = self.__by_verkey.get(their_verkey, None)
+            missing_key = ('verkey', their_verkey)
+        else:
+            missing_key = ('did', their_did)
+        if their_did is not None:
+            entry = self.__by_did.get(their_did, None)
+            if entry is not None:
+                pairwise, expires_at = entry
+                if expires_at is None or now < expires_at:
+                    self.__by_did.move_to_end(their_did)
+                    self.__hits += 1
+                    return True, pairwise
+                self.__drop(their_did)
+        expires_at = self.__missing.get(missing_key, None)
+        if expires_at is not None:
+            if now < expires_at:
+                self.__hits += 1
+                return True, None
+            del self.__missing[missing_key]
+        self.__misses += 1
+        return False, None
+
+    async def __load(self, key: tuple, loader: Callable[[str], Any]) -> Optional[Pairwise]:
+        loading = self.__loading.get(key, None)
+        if loading is None:
+            # Concurrent lookups of the same key share single request, it is not cancelled with the caller started it
+            loading = asyncio.ensure_future(self.__fetch(key, loader))
+            self.__loading[key] = loading
+        return await asyncio.shield(loading)
+
+    async def __fetch(self, key: tuple, loader: Callable[[str], Any]) -> Optional[Pairwise]:
+        loading = asyncio.current_task()
+        try:
+            pairwise = await loader(key[1])
+        finally:
+            # key may be invalidated while loading
+            actual = self.__loading.get(key, None) is loading
+            if actual:
+                del self.__loading[key]
+        if actual:
+            if pairwise is None:
+                self.__put_missing(key)
+            else:
+                self.__put(pairwise)
+        return pairwise
+
+    def __put(self, pairwise: Pairwise):
+        their_did = pairwise.their.did
+        self.__drop(their_did)
+        self.__missing.pop(('did', their_did), None)
+        self.__missing.pop(('verkey', pairwise.their.verkey), None)
+        expires_at = None if self.__ttl is None else time.monotonic() + self.__ttl
+        self.__by_did[their_did] = (pairwise, expires_at)
+        if pairwise.their.verkey:
+            self.__by_verkey[pairwise.their.verkey] = their_did
+        while len(self.__by_did) > self.__max_size:
+            evicted_did, _ = next(iter(self.__by_did.items()))
+            self.__drop(evicted_did)
+            self.__evictions += 1
+
+    def __put_succeeded(self, results: List[BulkResult]):
+        for result in results:
+            if result.success:
+                self.__put(result.pairwise)
+
+    def __put_missing(self, key: tuple):
+        if not self.__negative_ttl:
+            return
+        self.__missing[key] = time.monotonic() + self.__negative_ttl
+        self.__missing.move_to_end(key)
+        while len(self.__missing) > self.__max_size:
+            self.__missing.popitem(last=False)
+
+    def __drop(self, their_did: str):
+        entry = self.__by_did.pop(their_did, None)
+        if entry is not None:
+            verkey = entry[0].their.verkey
+            if self.__by_verkey.get(verkey, None) == their_did:
+                del self.__by_verkey[verkey]
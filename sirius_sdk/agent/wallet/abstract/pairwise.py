@@ -36,6 +36,17 @@ class AbstractPairwise(ABC):
         """
         raise NotImplemented
 
+    async def list_pairwise_page(self, offset: int, limit: int) -> (List[Any], Optional[int]):
+        """
+        Get page of saved pairwise, pages of the same wallet state don't overlap.
+
+        :param offset: count of pairwise to skip
+        :param limit: max items count
+        :return: Results, TotalCount
+        """
+        items = await self.list_pairwise()
+        return items[offset:offset+limit], len(items)
+
     @abstractmethod
     async def get_pairwise(self, their_did: str) -> Optional[dict]:
         """
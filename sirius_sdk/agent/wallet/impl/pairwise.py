@@ -1,5 +1,6 @@
 from typing import Optional, List, Any
 
+from sirius_sdk.errors.exceptions import SiriusPromiseContextException
 from sirius_sdk.agent.wallet.abstract.pairwise import AbstractPairwise
 from sirius_sdk.agent.connections import AgentRPC
 
@@ -26,6 +27,23 @@ class PairwiseProxy(AbstractPairwise):
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/list_pairwise'
         )
 
+    async def list_pairwise_page(self, offset: int, limit: int) -> (List[Any], Optional[int]):
+        msg_type = 'did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/list_pairwise_page'
+        if self.__rpc.is_feature_supported(msg_type):
+            try:
+                items, total = await self.__rpc.remote_call(
+                    msg_type=msg_type,
+                    params=dict(offset=offset, limit=limit)
+                )
+                return items, total
+            except SiriusPromiseContextException as e:
+                if not self.__rpc.is_unknown_message_type_error(e):
+                    raise
+                self.__rpc.mark_feature_unsupported(msg_type)
+        # Agent may be outdated: rest of the list is returned as the last page to not load whole list every page
+        items = await self.list_pairwise()
+        return items[offset:], len(items)
+
     async def get_pairwise(self, their_did: str) -> Optional[dict]:
         return await self.__rpc.remote_call(
             msg_type='did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/get_pairwise',
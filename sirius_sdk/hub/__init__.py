@@ -13,6 +13,8 @@ from sirius_sdk.agent.microledgers import AbstractMicroledgerList
 
 from .core import _current_hub, init, context
 from .proxies import DIDProxy, CryptoProxy, MicroledgersProxy, PairwiseProxy, AnonCredsProxy, CacheProxy
+from .sharding import ShardedHub, ConsistentHashRing
+from .workers import WorkerLoops
 from .coprotocols import CoProtocolThreadedP2P, CoProtocolP2PAnon, CoProtocolP2P, AbstractP2PCoProtocol, \
     CoProtocolThreadedTheirs, open_communication
 
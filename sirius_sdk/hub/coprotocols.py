@@ -1,6 +1,7 @@
 import asyncio
 from abc import ABC, abstractmethod
-from typing import Optional, List, Any, Union, Tuple, Dict
+from collections import deque
+from typing import Optional, List, Any, Union, Tuple, Dict, AsyncIterator
 from contextlib import asynccontextmanager
 
 from sirius_sdk.agent.pairwise import Pairwise, TheirEndpoint
@@ -10,6 +11,7 @@ from sirius_sdk.errors.exceptions import SiriusContextError, OperationAbortedMan
     SiriusTimeoutIO
 
 from .core import _current_hub
+from .latency import LatencyTracker
 
 
 PLEASE_ACK_DECORATOR = '~please_ack'
@@ -258,20 +260,51 @@ class CoProtocolThreadedP2P(AbstractP2PCoProtocol):
 
 
 class CoProtocolThreadedTheirs(AbstractCoProtocol):
+    """Fan-out coprotocol: every message is sent to all participants and their responses are demultiplexed
+    to per-participant inboxes.
 
-    def __init__(self, thid: str, theirs: List[Pairwise], pthid: str = None, time_to_live: int = None):
+    Responses that were not awaited when they arrived (reply of the stage finished by quorum or timeout,
+    duplicates) don't shift the next stages, they are kept in late_responses.
+    """
+
+    MAX_LATE_RESPONSES = 100
+
+    def __init__(
+            self, thid: str, theirs: List[Pairwise], pthid: str = None, time_to_live: int = None,
+            latency: LatencyTracker = None
+    ):
+        """
+        :param thid: thread id
+        :param theirs: participants
+        :param pthid: (optional) parent thread id
+        :param time_to_live: (optional) coprotocol time to live in sec
+        :param latency: (optional) tracker of participants response times, switch waits responses
+            for the time derived from observed ones and time to live bounds the wait only if it is not set
+        """
         if len(theirs) < 1:
             raise SiriusContextError('theirs is empty')
         super().__init__(time_to_live=time_to_live)
         self.__thid = thid
         self.__pthid = pthid
         self.__theirs = theirs
-        self.__dids = [their.their.did for their in theirs]
+        self.__latency = latency
+        self.__by_verkey = {p2p.their.verkey: p2p for p2p in theirs}
+        self.__by_did = {p2p.their.did: p2p for p2p in theirs}
+        self.__inboxes = {p2p.their.did: deque() for p2p in theirs}
+        # count of responses every participant owes for finished stages
+        self.__owed = {p2p.their.did: 0 for p2p in theirs}
+        self.__awaited = {}
+        self.__late = deque(maxlen=self.MAX_LATE_RESPONSES)
 
     @property
     def theirs(self) -> List[Pairwise]:
         return self.__theirs
 
+    @property
+    def late_responses(self) -> List[Tuple[Pairwise, Message]]:
+        """Responses of the participants that arrived after their stage was finished"""
+        return list(self.__late)
+
     async def send(self, message: Message) -> Dict[Pairwise, Tuple[bool, str]]:
         """Send message to given participants
 
@@ -285,52 +318,116 @@ class CoProtocolThreadedTheirs(AbstractCoProtocol):
             results[p2p] = (success, body)
         return results
 
-    async def get_one(self) -> Tuple[Optional[Pairwise], Optional[Message]]:
+    async def get_one(self, timeout: float = None) -> Tuple[Optional[Pairwise], Optional[Message]]:
         """Read event from any of participants at given timeout
 
+        :param timeout: (optional) reading timeout in sec, time to live by default
         return: (Pairwise: participant-id, Message: message from given participant)
         """
-        async with self.__get_transport_lazy() as transport:
-            try:
-                message, sender_verkey, recipient_verkey = await transport.get_one()
-            except SiriusTimeoutIO:
-                return None, None
-            else:
-                p2p = self.__load_p2p_from_verkey(sender_verkey)
-                return p2p, message
-
-    async def switch(self, message: Message) -> Dict[Pairwise, Tuple[bool, Optional[Message]]]:
+        for did, inbox in self.__inboxes.items():
+            if inbox:
+                return self.__awaited.pop(did, None) or self.__by_did[did], inbox.popleft()
+        p2p = await self.__receive(timeout)
+        if p2p is None:
+            return None, None
+        return p2p, self.__inboxes[p2p.their.did].popleft()
+
+    async def responses(self, message: Message, quorum: int = None) -> AsyncIterator[Tuple[Pairwise, Message]]:
+        """Send message to participants and iterate their responses as they arrive
+
+        :param message: request
+        :param quorum: (optional) count of responses iteration is stopped after, all participants by default
+        """
+        statuses = await self.send(message)
+        self.__begin_stage([p2p for p2p, (ok, _) in statuses.items() if ok])
+        loop = asyncio.get_event_loop()
+        stamp = loop.time()
+        deadline = None
+        if self.__latency is not None:
+            timeout = self.__latency.timeout(list(self.__awaited.keys()), default=self.time_to_live)
+            if timeout is not None:
+                deadline = stamp + timeout
+        received = 0
+        while self.__awaited and (quorum is None or received < quorum):
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            p2p = await self.__receive(timeout)
+            if p2p is None:
+                if self.__latency is not None:
+                    for did in self.__awaited.keys():
+                        self.__latency.observe_timeout(did, loop.time() - stamp)
+                return
+            did = p2p.their.did
+            if did in self.__awaited:
+                del self.__awaited[did]
+                if self.__latency is not None:
+                    self.__latency.observe(did, loop.time() - stamp)
+                received += 1
+                yield p2p, self.__inboxes[did].popleft()
+
+    async def switch(
+            self, message: Message, quorum: int = None
+    ) -> Dict[Pairwise, Tuple[bool, Optional[Message]]]:
         """Switch state while participants at given timeout give responses
 
+        :param message: request
+        :param quorum: (optional) count of responses switch returns after, all participants by default
         return: {
             Pairwise: participant,
             (
-              bool: message was successfully sent to participant,
+              bool: response was received from participant,
               Message: response message from participant or Null if request message was not successfully sent
+                 or response was not received
             )
         }
         """
-        statuses = await self.send(message)
-        # fill errors to result just now
-        results = {p2p: (False, None) for p2p, stat in statuses.items() if stat[0] is True}
-        # then work with success participants only
-        success_theirs = {p2p: (False, None) for p2p, stat in statuses.items() if stat[0] is True}
-        accum = 0
-        while accum < len(success_theirs):
-            p2p, message = await self.get_one()
-            if p2p is None:
-                break
-            if p2p and p2p.their.did in self.__dids:
-                success_theirs[p2p] = (True, message)
-                accum += 1
-        results.update(success_theirs)
+        results = {p2p: (False, None) for p2p in self.__theirs}
+        async for p2p, response in self.responses(message, quorum):
+            results[p2p] = (True, response)
         return results
 
-    def __load_p2p_from_verkey(self, verkey: str) -> Optional[Pairwise]:
-        for p2p in self.__theirs:
-            if p2p.their.verkey == verkey:
-                return p2p
-        return None
+    def __begin_stage(self, awaited: List[Pairwise]):
+        # participants that did not respond to the previous stage still may do it
+        for did in self.__awaited.keys():
+            self.__owed[did] += 1
+        for did, inbox in self.__inboxes.items():
+            while inbox:
+                self.__late.append((self.__by_did[did], inbox.popleft()))
+                if self.__owed[did] > 0:
+                    self.__owed[did] -= 1
+        self.__awaited = {p2p.their.did: p2p for p2p in awaited}
+
+    async def __receive(self, timeout: float = None) -> Optional[Pairwise]:
+        """Route next message to the inbox of the sender
+
+        :return: sender or None on timeout
+        """
+        while True:
+            message, sender_verkey = await self._read_message(timeout)
+            if message is None:
+                return None
+            p2p = self.__by_verkey.get(sender_verkey, None)
+            if p2p is None:
+                continue
+            did = p2p.their.did
+            if self.__owed[did] > 0:
+                self.__owed[did] -= 1
+                self.__late.append((p2p, message))
+                continue
+            self.__inboxes[did].append(message)
+            return p2p
+
+    async def _read_message(self, timeout: float = None) -> Tuple[Optional[Message], Optional[str]]:
+        """Read message of the thread
+
+        :return: message and sender verkey, (None, None) on timeout
+        """
+        async with self.__get_transport_lazy() as transport:
+            try:
+                message, sender_verkey, recipient_verkey = await transport.get_one(timeout=timeout)
+            except SiriusTimeoutIO:
+                return None, None
+            else:
+                return message, sender_verkey
 
     @asynccontextmanager
     async def __get_transport_lazy(self):
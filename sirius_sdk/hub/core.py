@@ -1,8 +1,8 @@
 import asyncio
 import contextvars
 import threading
-from typing import Optional
-from contextlib import asynccontextmanager
+from typing import Optional, Any, Callable
+from contextlib import asynccontextmanager, contextmanager
 
 from sirius_sdk.encryption.p2p import P2PConnection
 from sirius_sdk.errors.exceptions import SiriusInitializationError
@@ -17,10 +17,119 @@ from sirius_sdk.agent.agent import Agent, BaseAgentConnection, SpawnStrategy
 
 
 __ROOT_HUB = None
+__ROOT_HUB_LOCK = threading.Lock()
 __THREAD_LOCAL_HUB = threading.local()
 __COROUTINE_LOCAL_HUB = contextvars.ContextVar('hub')
 
 
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _PooledAgent:
+
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.leases = 0
+        self.opening = None
+        # incremented every time connection is (re)opened, services of previous connection are stale
+        self.epoch = 0
+
+    async def open(self):
+        # concurrent contexts wait the same connection to be opened
+        if self.opening is None or self.opening.done():
+            self.opening = asyncio.ensure_future(self.__open())
+        await asyncio.shield(self.opening)
+
+    async def __open(self):
+        await self.agent.open()
+        self.epoch += 1
+
+
+class _AgentPool:
+    """Agent connections shared by Hub instances of the process.
+
+    Connections are keyed by (server_uri, credentials, storage) and event loop they are bound to, so every
+    coroutine context that copies the root hub reuses the connection instead of opening its own one.
+    Hub-level services overrides are still kept by every Hub instance. Connection is evicted from the pool
+    when its last lease is released, so pool does not keep connections (and event loops) nobody uses,
+    except connections of pinned loops: they are kept for the next contexts until loop is shut down.
+    """
+
+    def __init__(self):
+        self.__loops = {}
+        self.__pinned = set()
+        # hubs of different threads share pool
+        self.__lock = threading.Lock()
+
+    def acquire(
+            self, server_uri: str, credentials: bytes, p2p: P2PConnection, timeout: int,
+            storage: Optional[AbstractImmutableCollection], loop: asyncio.AbstractEventLoop
+    ) -> _PooledAgent:
+        with self.__lock:
+            entries = self.__loops.setdefault(loop, {})
+            key = (server_uri, credentials, storage)
+            entry = entries.get(key, None)
+            if entry is None:
+                entry = _PooledAgent(
+                    Agent(
+                        server_address=server_uri,
+                        credentials=credentials,
+                        p2p=p2p,
+                        timeout=timeout,
+                        loop=loop,
+                        storage=storage,
+                        spawn_strategy=SpawnStrategy.CONCURRENT
+                    )
+                )
+                entries[key] = entry
+            entry.leases += 1
+            return entry
+
+    def release(self, entry: _PooledAgent, loop: asyncio.AbstractEventLoop, evict: bool = False) -> bool:
+        """Release lease of the connection, connection is removed from pool with the last lease
+
+        :param evict: remove connection with the last lease even if loop is pinned
+        :return: True if connection was removed, caller is responsible to close it
+        """
+        with self.__lock:
+            entry.leases -= 1
+            if entry.leases > 0 or (loop in self.__pinned and not evict):
+                return False
+            entries = self.__loops.get(loop, {})
+            for key, value in list(entries.items()):
+                if value is entry:
+                    del entries[key]
+            if not entries:
+                self.__loops.pop(loop, None)
+            return True
+
+    def pin(self, loop: asyncio.AbstractEventLoop):
+        """Keep connections of the loop without leases until loop is shut down"""
+        with self.__lock:
+            self.__pinned.add(loop)
+
+    def size(self, loop: asyncio.AbstractEventLoop = None) -> int:
+        with self.__lock:
+            return len(self.__loops.get(loop or asyncio.get_event_loop(), {}))
+
+    async def shutdown(self, loop: asyncio.AbstractEventLoop = None):
+        """Close connections of the event loop, it must be called in that loop"""
+        loop = loop or asyncio.get_event_loop()
+        with self.__lock:
+            self.__pinned.discard(loop)
+            entries = self.__loops.pop(loop, {})
+        for entry in entries.values():
+            if entry.agent.is_open:
+                await entry.agent.close()
+
+
+_pool = _AgentPool()
+
+
 class Hub:
 
     def __init__(
@@ -40,84 +149,166 @@ class Hub:
         self.__timeout = io_timeout or BaseAgentConnection.IO_TIMEOUT
         self.__storage = storage
         self.__loop = loop or asyncio.get_event_loop()
+        self.__lease = None
+        self.__session = None
+        self.__session_epoch = None
+        self.__services = {}
+        self.__services_epoch = None
         self.__create_agent_instance()
 
     def __del__(self):
-        if self.__agent.is_open and self.__loop.is_running():
-            asyncio.ensure_future(self.__agent.close(), loop=self.__loop)
+        # may be collected in any thread: connections are closed in their loop if it is still running,
+        # connections of the stopped loop are just dropped
+        session = getattr(self, '_Hub__session', None)
+        if session is not None:
+            self.__schedule(session.close())
+        lease = getattr(self, '_Hub__lease', None)
+        if lease is not None and _pool.release(lease, self.__loop) and lease.agent.is_open:
+            self.__schedule(lease.agent.close())
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop agent connections of the hub are bound to"""
+        return self.__loop
 
     def copy(self):
+        """Hub of the other context, it shares agent connection of this one in the same event loop"""
         inst = Hub(
-            server_uri=self.__server_uri, credentials=self.__credentials, p2p=self.__p2p
+            server_uri=self.__server_uri, credentials=self.__credentials, p2p=self.__p2p,
+            io_timeout=self.__timeout, storage=self.__storage, crypto=self.__crypto,
+            microledgers=self.__microledgers, pairwise_storage=self.__pairwise_storage,
+            did=self.__did, anoncreds=self.__anoncreds
         )
-        inst.__crypto = self.__crypto
-        inst.__microledgers = self.__microledgers
-        inst.__pairwise_storage = self.__pairwise_storage
-        inst.__did = self.__did
         return inst
 
     async def abort(self):
         if self.__loop.is_running():
-            if self.__loop == asyncio.get_event_loop():
-                old_agent = self.__agent
+            if self.__loop is _running_loop():
+                old_lease = self.__lease
+                old_session = self.__session
+                last = _pool.release(old_lease, self.__loop, evict=True)
                 self.__create_agent_instance()
-                if old_agent.is_open:
-                    await old_agent.close()
+                # Connection shared with other contexts is kept alive, co-protocols and listeners
+                # of this hub are interrupted by closing of its own channels
+                if old_session is not None:
+                    await old_session.close()
+                if last and old_lease.agent.is_open:
+                    await old_lease.agent.close()
             else:
-                asyncio.ensure_future(self.abort(), loop=self.__loop)
+                # called from the thread of other event loop
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.abort(), self.__loop))
 
     def run_soon(self, coro):
         assert asyncio.iscoroutine(coro), 'Expected coroutine object'
-        if self.__loop.is_running():
-            asyncio.ensure_future(coro, loop=self.__loop)
+        self.__schedule(coro)
+
+    def __schedule(self, coro):
+        if self.__loop is _running_loop():
+            asyncio.ensure_future(coro)
+        elif self.__loop.is_running():
+            asyncio.run_coroutine_threadsafe(coro, self.__loop)
+        else:
+            coro.close()
 
     @asynccontextmanager
     async def get_agent_connection_lazy(self):
-        if not self.__agent.is_open:
-            await self.__agent.open()
-        yield self.__agent
+        agent = await self.__open_agent()
+        # co-protocols and events of the hub are served by own channels of the shared connection
+        session = self.__session
+        if session is None or self.__session_epoch != self.__lease.epoch:
+            stale, session = session, agent.fork()
+            self.__session, self.__session_epoch = session, self.__lease.epoch
+            if stale is not None:
+                await stale.close()
+        yield session
 
     async def open(self):
         async with self.get_agent_connection_lazy() as agent:
             pass
 
     async def close(self):
+        session, self.__session = self.__session, None
+        if session is not None:
+            await session.close()
+        if self.__lease.leases > 1:
+            # other contexts are still using connection
+            return
         if self.__agent.is_open:
             await self.__agent.close()
 
     async def get_crypto(self) -> AbstractCrypto:
-        async with self.get_agent_connection_lazy() as agent:
-            return self.__crypto or agent.wallet.crypto
+        service = self.__cached_service('crypto')
+        if service is None:
+            service = await self.__resolve_service('crypto', lambda agent: self.__crypto or agent.wallet.crypto)
+        return service
 
     async def get_microledgers(self) -> AbstractMicroledgerList:
-        async with self.get_agent_connection_lazy() as agent:
-            return self.__microledgers or agent.microledgers
+        service = self.__cached_service('microledgers')
+        if service is None:
+            service = await self.__resolve_service('microledgers', lambda agent: self.__microledgers or agent.microledgers)
+        return service
 
     async def get_pairwise_list(self) -> AbstractPairwiseList:
-        async with self.get_agent_connection_lazy() as agent:
-            return self.__pairwise_storage or agent.pairwise_list
+        service = self.__cached_service('pairwise_list')
+        if service is None:
+            service = await self.__resolve_service('pairwise_list', lambda agent: self.__pairwise_storage or agent.pairwise_list)
+        return service
 
     async def get_did(self) -> AbstractDID:
-        async with self.get_agent_connection_lazy() as agent:
-            return self.__did or agent.wallet.did
+        service = self.__cached_service('did')
+        if service is None:
+            service = await self.__resolve_service('did', lambda agent: self.__did or agent.wallet.did)
+        return service
 
     async def get_anoncreds(self) -> AbstractAnonCreds:
-        async with self.get_agent_connection_lazy() as agent:
-            return self.__anoncreds or agent.wallet.anoncreds
+        service = self.__cached_service('anoncreds')
+        if service is None:
+            service = await self.__resolve_service('anoncreds', lambda agent: self.__anoncreds or agent.wallet.anoncreds)
+        return service
 
     async def get_cache(self) -> AbstractCache:
-        async with self.get_agent_connection_lazy() as agent:
-            return self.__anoncreds or agent.wallet.cache
+        service = self.__cached_service('cache')
+        if service is None:
+            service = await self.__resolve_service('cache', lambda agent: agent.wallet.cache)
+        return service
+
+    def __cached_service(self, name: str) -> Optional[Any]:
+        # Steady state: services resolved for the current connection are returned without entering
+        # connection context, they are invalidated when connection is reopened or hub is aborted
+        if self.__services_epoch == self.__lease.epoch and self.__lease.agent.is_open:
+            return self.__services.get(name, None)
+        return None
+
+    async def __resolve_service(self, name: str, getter: Callable[[Agent], Any]) -> Any:
+        agent = await self.__open_agent()
+        if self.__services_epoch != self.__lease.epoch:
+            self.__services.clear()
+            self.__services_epoch = self.__lease.epoch
+        service = getter(agent)
+        self.__services[name] = service
+        return service
+
+    async def __open_agent(self) -> Agent:
+        if not self.__agent.is_open:
+            await self.__lease.open()
+        return self.__agent
+
+    @property
+    def __agent(self) -> Agent:
+        return self.__lease.agent
 
     def __create_agent_instance(self):
-        self.__agent = Agent(
-            server_address=self.__server_uri,
+        self.__services.clear()
+        self.__services_epoch = None
+        self.__session = None
+        self.__session_epoch = None
+        self.__lease = _pool.acquire(
+            server_uri=self.__server_uri,
             credentials=self.__credentials,
             p2p=self.__p2p,
             timeout=self.__timeout,
-            loop=self.__loop,
             storage=self.__storage,
-            spawn_strategy=SpawnStrategy.CONCURRENT
+            loop=self.__loop
         )
 
 
@@ -127,16 +318,22 @@ def init(server_uri: str, credentials: bytes, p2p: P2PConnection, io_timeout: in
          did: AbstractDID = None, pairwise_storage: AbstractPairwiseList = None
          ):
     global __ROOT_HUB
-    root = Hub(
-        server_uri=server_uri, credentials=credentials, p2p=p2p, io_timeout=io_timeout,
-        storage=storage, crypto=crypto, microledgers=microledgers,
-        pairwise_storage=pairwise_storage, did=did
-    )
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
+    if _running_loop() is not None:
         raise SiriusInitializationError('You must call this method outside coroutine')
-    loop.run_until_complete(root.open())
-    __ROOT_HUB = root
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        # thread other than main one
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    with __ROOT_HUB_LOCK:
+        root = Hub(
+            server_uri=server_uri, credentials=credentials, p2p=p2p, io_timeout=io_timeout,
+            storage=storage, crypto=crypto, microledgers=microledgers,
+            pairwise_storage=pairwise_storage, did=did, loop=loop
+        )
+        loop.run_until_complete(root.open())
+        __ROOT_HUB = root
 
 
 @asynccontextmanager
@@ -172,7 +369,6 @@ def __get_root_hub() -> Optional[Hub]:
 
 
 def __get_thread_local_gub() -> Optional[Hub]:
-    # For now thread local context not used but code prepared for future purposes
     try:
         inst = __THREAD_LOCAL_HUB.instance
     except AttributeError:
@@ -188,4 +384,20 @@ def _current_hub() -> Hub:
             raise SiriusInitializationError('Non initialized Sirius Agent connection')
         inst = root_hub.copy()
         __COROUTINE_LOCAL_HUB.set(inst)
+    elif isinstance(inst, Hub) and inst.loop is not _running_loop():
+        # context was propagated to other event loop: connections of hub can't be used there
+        loop = _running_loop()
+        if loop is not None:
+            inst = inst.copy()
+            __COROUTINE_LOCAL_HUB.set(inst)
     return inst
+
+
+@contextmanager
+def _bind_hub(hub):
+    """Bind hub to the current coroutine context without opening the agent connection"""
+    token = __COROUTINE_LOCAL_HUB.set(hub)
+    try:
+        yield hub
+    finally:
+        __COROUTINE_LOCAL_HUB.reset(token)
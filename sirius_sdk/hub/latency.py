@@ -0,0 +1,123 @@
+import math
+from collections import deque
+from typing import List, Optional
+
+from sirius_sdk.errors.exceptions import SiriusContextError
+
+
+class _PeerStats:
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.mean = None
+        self.deviation = None
+
+
+class LatencyTracker:
+    """Response times of the peers observed in coprotocol switches.
+
+    Every peer keeps EWMA of response time with mean deviation (as TCP does for RTT) and window of
+    recent samples. Timeout of the stage is derived from observed percentiles of the stage peers, so
+    the stage that waits dead participant is terminated after the time the slowest alive one would answer
+    instead of the whole time to live.
+    """
+
+    DEF_ALPHA = 0.125
+    DEF_BETA = 0.25
+    DEF_WINDOW = 64
+    DEF_PERCENTILE = 99
+    DEF_MULTIPLIER = 2.0
+    DEF_MIN_TIMEOUT = 1.0  # sec
+    MIN_SAMPLES = 8
+
+    def __init__(
+            self, alpha: float = DEF_ALPHA, beta: float = DEF_BETA, window: int = DEF_WINDOW,
+            percentile: float = DEF_PERCENTILE, multiplier: float = DEF_MULTIPLIER,
+            min_timeout: float = DEF_MIN_TIMEOUT
+    ):
+        """
+        :param alpha: smoothing factor of response time EWMA
+        :param beta: smoothing factor of response time deviation EWMA
+        :param window: count of recent samples percentiles are calculated for
+        :param percentile: percentile of response times stage timeout is based on
+        :param multiplier: safety factor applied to estimated response time
+        :param min_timeout: stage timeout lower bound in sec, it protects the stage from jitter of peers
+          that are observed as fast ones. Stage timeout derived from observations is kept between it and
+          the default one (caller's time to live), so observations may only shorten the stage
+        """
+        if not 0 < alpha <= 1 or not 0 < beta <= 1:
+            raise SiriusContextError('Smoothing factors must be in (0, 1]')
+        if window < self.MIN_SAMPLES:
+            raise SiriusContextError('Window must keep %d samples at least' % self.MIN_SAMPLES)
+        if min_timeout is None or min_timeout <= 0:
+            raise SiriusContextError('Timeout lower bound must be > 0')
+        self.__alpha = alpha
+        self.__beta = beta
+        self.__window = window
+        self.__percentile = percentile
+        self.__multiplier = multiplier
+        self.__min_timeout = min_timeout
+        self.__peers = {}
+
+    def observe(self, peer: str, elapsed: float):
+        """Register response time of the peer in sec"""
+        stats = self.__peers.get(peer, None)
+        if stats is None:
+            stats = _PeerStats(self.__window)
+            self.__peers[peer] = stats
+        if stats.mean is None:
+            stats.mean = elapsed
+            stats.deviation = elapsed / 2
+        else:
+            stats.deviation += self.__beta * (abs(elapsed - stats.mean) - stats.deviation)
+            stats.mean += self.__alpha * (elapsed - stats.mean)
+        stats.samples.append(elapsed)
+
+    def observe_timeout(self, peer: str, elapsed: float):
+        """Peer did not respond in elapsed sec: back off the next timeout like TCP retransmission timer does"""
+        self.observe(peer, elapsed * 2)
+
+    def forget(self, peer: str = None):
+        if peer is None:
+            self.__peers.clear()
+        else:
+            self.__peers.pop(peer, None)
+
+    def ewma(self, peer: str) -> Optional[float]:
+        stats = self.__peers.get(peer, None)
+        return stats.mean if stats is not None else None
+
+    def percentile(self, peer: str, percent: float = None) -> Optional[float]:
+        stats = self.__peers.get(peer, None)
+        if stats is None or not stats.samples:
+            return None
+        percent = self.__percentile if percent is None else percent
+        ordered = sorted(stats.samples)
+        index = min(math.ceil(percent / 100 * len(ordered)) - 1, len(ordered) - 1)
+        return ordered[max(index, 0)]
+
+    def estimate(self, peer: str) -> Optional[float]:
+        """Response time the peer is expected to answer in, None if there is not enough observations"""
+        stats = self.__peers.get(peer, None)
+        if stats is None or len(stats.samples) < self.MIN_SAMPLES:
+            return None
+        return max(self.percentile(peer), stats.mean + 4 * stats.deviation)
+
+    def timeout(self, peers: List[str], default: float = None) -> Optional[float]:
+        """Time to wait responses of all peers in sec
+
+        :param peers: peers of the stage
+        :param default: timeout if any peer is not observed enough, it is also upper bound of the result
+        """
+        estimates = []
+        for peer in peers:
+            estimate = self.estimate(peer)
+            if estimate is None:
+                return default
+            estimates.append(estimate)
+        if not estimates:
+            return default
+        value = max(max(estimates) * self.__multiplier, self.__min_timeout)
+        if default is not None:
+            value = min(value, default)
+        return value
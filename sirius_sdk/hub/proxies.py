@@ -344,6 +344,14 @@ class MicroledgersProxy(AbstractMicroledgerList):
         service = await _current_hub().get_microledgers()
         return await service.list()
 
+    async def load_many(self, names: List[str]) -> List[AbstractMicroledger]:
+        service = await _current_hub().get_microledgers()
+        return await service.load_many(names)
+
+    async def reload_all(self) -> List[AbstractMicroledger]:
+        service = await _current_hub().get_microledgers()
+        return await service.reload_all()
+
 
 class PairwiseProxy(AbstractPairwiseList):
 
@@ -0,0 +1,196 @@
+import asyncio
+import bisect
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Callable, Awaitable, Iterable, TypeVar
+
+from sirius_sdk.errors.exceptions import SiriusContextError
+from sirius_sdk.messaging import Message
+from sirius_sdk.agent.pairwise import Pairwise, AbstractPairwiseList
+from sirius_sdk.agent.wallet.abstract.crypto import AbstractCrypto
+from sirius_sdk.agent.wallet.abstract.did import AbstractDID
+from sirius_sdk.agent.wallet.abstract.anoncreds import AbstractAnonCreds
+from sirius_sdk.agent.microledgers import AbstractMicroledgerList
+
+from .core import Hub, _bind_hub
+
+
+T = TypeVar('T')
+
+
+class ConsistentHashRing:
+    """Consistent hashing of keys to nodes.
+
+    Every node is placed on the ring several times (virtual nodes), so keys are spread evenly and
+    only keys of the node are remapped when node is added or removed.
+    """
+
+    DEF_REPLICAS = 128
+
+    def __init__(self, nodes: Iterable[str] = None, replicas: int = DEF_REPLICAS):
+        """
+        :param nodes: names of the nodes
+        :param replicas: virtual nodes count per node
+        """
+        if replicas <= 0:
+            raise SiriusContextError('Replicas count must be > 0')
+        self.__replicas = replicas
+        self.__hashes = []
+        self.__owners = []
+        self.__nodes = set()
+        for node in nodes or []:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self.__nodes)
+
+    def add(self, node: str):
+        if node in self.__nodes:
+            return
+        self.__nodes.add(node)
+        for n in range(self.__replicas):
+            point = self.hash('%s#%d' % (node, n))
+            index = bisect.bisect(self.__hashes, point)
+            self.__hashes.insert(index, point)
+            self.__owners.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.__nodes:
+            return
+        self.__nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self.__hashes, self.__owners) if owner != node]
+        self.__hashes = [point for point, _ in kept]
+        self.__owners = [owner for _, owner in kept]
+
+    def node_for(self, key: str) -> str:
+        if not self.__hashes:
+            raise SiriusContextError('Hash ring is empty')
+        index = bisect.bisect(self.__hashes, self.hash(key))
+        if index == len(self.__hashes):
+            index = 0
+        return self.__owners[index]
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class ShardedHub:
+    """Several agent connections (different cloud agents or replicas) behind single routing point.
+
+    Wallet, microledgers and messaging calls are routed to the shard by sharding key with consistent
+    hashing: pairwise DID for relationships, ledger name for microledgers.
+    """
+
+    def __init__(self, shards: Dict[str, Hub], replicas: int = ConsistentHashRing.DEF_REPLICAS):
+        """
+        :param shards: hubs of the shards by shard name
+        :param replicas: virtual nodes count per shard on the hash ring
+        """
+        if not shards:
+            raise SiriusContextError('Shards are empty')
+        self.__shards = dict(shards)
+        self.__ring = ConsistentHashRing(self.__shards.keys(), replicas)
+
+    @property
+    def shards(self) -> Dict[str, Hub]:
+        return dict(self.__shards)
+
+    def add_shard(self, name: str, hub: Hub):
+        if name in self.__shards:
+            raise SiriusContextError('Shard "%s" already exists' % name)
+        self.__shards[name] = hub
+        self.__ring.add(name)
+
+    def remove_shard(self, name: str) -> Hub:
+        if len(self.__shards) == 1 and name in self.__shards:
+            raise SiriusContextError('Sharded hub must keep one shard at least')
+        self.__ring.remove(name)
+        return self.__shards.pop(name)
+
+    def shard_name(self, key: str) -> str:
+        return self.__ring.node_for(key)
+
+    def shard(self, key: str) -> Hub:
+        """Hub of the shard the key is routed to"""
+        return self.__shards[self.__ring.node_for(key)]
+
+    def partition(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """Group keys by shard names"""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.__ring.node_for(key), []).append(key)
+        return groups
+
+    @asynccontextmanager
+    async def bind(self, key: str):
+        """Route calls of sirius_sdk services (DID, Crypto, PairwiseList, ...) in the context to the shard of key
+
+        Context is served by own copy of the shard hub, so co-protocols of concurrent contexts don't share channels
+        """
+        async with self.__bound(self.shard(key)) as hub:
+            yield hub
+
+    async def open(self):
+        await asyncio.gather(*[hub.open() for hub in self.__shards.values()])
+
+    async def close(self):
+        await asyncio.gather(*[hub.close() for hub in self.__shards.values()])
+
+    async def get_crypto(self, key: str) -> AbstractCrypto:
+        return await self.shard(key).get_crypto()
+
+    async def get_did(self, key: str) -> AbstractDID:
+        return await self.shard(key).get_did()
+
+    async def get_anoncreds(self, key: str) -> AbstractAnonCreds:
+        return await self.shard(key).get_anoncreds()
+
+    async def get_pairwise_list(self, their_did: str) -> AbstractPairwiseList:
+        return await self.shard(their_did).get_pairwise_list()
+
+    async def get_microledgers(self, ledger_name: str) -> AbstractMicroledgerList:
+        return await self.shard(ledger_name).get_microledgers()
+
+    async def send_to(self, message: Message, to: Pairwise):
+        """Send message through agent of the shard the pairwise is routed to"""
+        async with self.shard(to.their.did).get_agent_connection_lazy() as agent:
+            await agent.send_to(message=message, to=to)
+
+    async def fan_out(self, call: Callable[[Hub], Awaitable[T]]) -> Dict[str, T]:
+        """Run call for every shard concurrently, call is bound to the shard context
+
+        :return: results by shard names
+        """
+        names = list(self.__shards.keys())
+        results = await asyncio.gather(*[self.__call_bound(self.__shards[name], call) for name in names])
+        return dict(zip(names, results))
+
+    async def map(self, keys: Iterable[str], call: Callable[[Hub, List[str]], Awaitable[T]]) -> Dict[str, T]:
+        """Run call for every shard with the keys routed to it, shards are processed concurrently
+
+        :return: results by shard names
+        """
+        groups = self.partition(keys)
+        names = list(groups.keys())
+        results = await asyncio.gather(
+            *[self.__call_bound(self.__shards[name], call, groups[name]) for name in names]
+        )
+        return dict(zip(names, results))
+
+    @classmethod
+    async def __call_bound(cls, hub: Hub, call: Callable[..., Awaitable[Any]], *args) -> Any:
+        async with cls.__bound(hub) as context:
+            return await call(context, *args)
+
+    @staticmethod
+    @asynccontextmanager
+    async def __bound(hub: Hub):
+        # copy shares agent connection of the shard, closing it releases channels of the context only
+        context = hub.copy()
+        try:
+            with _bind_hub(context):
+                yield context
+        finally:
+            await context.close()
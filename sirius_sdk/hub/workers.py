@@ -0,0 +1,113 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+from typing import List, Callable, Awaitable, Any, Optional
+
+from sirius_sdk.errors.exceptions import SiriusContextError
+
+from .core import _pool
+
+
+class WorkerLoops:
+    """Event loops running in dedicated threads, one per CPU core by default.
+
+    Every loop has its own agent connections (Hub connections pool is per event loop), so coroutines that
+    use sirius_sdk services may be submitted to any worker. Connections of the worker are kept by pool
+    for the next coroutines until workers are stopped. Coroutines are dispatched round-robin.
+    """
+
+    def __init__(self, count: int = None, name: str = 'sirius-worker'):
+        """
+        :param count: workers count, CPU cores count by default
+        :param name: prefix of worker threads names
+        """
+        self.__count = count or os.cpu_count() or 1
+        self.__name = name
+        self.__loops = []
+        self.__threads = []
+        self.__next = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def loops(self) -> List[asyncio.AbstractEventLoop]:
+        return list(self.__loops)
+
+    @property
+    def is_running(self) -> bool:
+        return len(self.__loops) > 0
+
+    def start(self):
+        if self.__loops:
+            raise SiriusContextError('Workers are already running')
+        for n in range(self.__count):
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            thread = threading.Thread(
+                target=self.__run_loop, args=(loop, ready), name='%s-%d' % (self.__name, n), daemon=True
+            )
+            thread.start()
+            ready.wait()
+            _pool.pin(loop)
+            self.__loops.append(loop)
+            self.__threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Close agent connections of the workers and stop their loops"""
+        loops, threads = self.__loops, self.__threads
+        self.__loops, self.__threads = [], []
+        for loop in loops:
+            future = asyncio.run_coroutine_threadsafe(_pool.shutdown(loop), loop)
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+            loop.call_soon_threadsafe(loop.stop)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args, worker: int = None) -> concurrent.futures.Future:
+        """Run coroutine function in the worker loop, it is safe to call from any thread
+
+        :param func: coroutine function
+        :param worker: (optional) worker index, next one is selected by default
+        :return: future of the result
+        """
+        loop = self.__select(worker)
+        return asyncio.run_coroutine_threadsafe(func(*args), loop)
+
+    async def run(self, func: Callable[..., Awaitable[Any]], *args, worker: int = None) -> Any:
+        """Same as submit but awaits the result in the caller loop"""
+        return await asyncio.wrap_future(self.submit(func, *args, worker=worker))
+
+    def __select(self, worker: Optional[int]) -> asyncio.AbstractEventLoop:
+        loops = self.__loops
+        if not loops:
+            raise SiriusContextError('Workers are not running')
+        if worker is not None:
+            return loops[worker % len(loops)]
+        with self.__lock:
+            index = self.__next % len(loops)
+            self.__next += 1
+        return loops[index]
+
+    @staticmethod
+    def __run_loop(loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+            pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        finally:
+            loop.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
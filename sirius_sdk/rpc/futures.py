@@ -1,17 +1,51 @@
 import uuid
 import json
 import base64
+import asyncio
 import logging
+import weakref
 import datetime
-from typing import Any, Optional
+from typing import Any, Optional, Callable
 
 from sirius_sdk.errors.exceptions import *
 from sirius_sdk.errors.indy_exceptions import *
+from sirius_sdk.messaging import Message
 from sirius_sdk.rpc.tunnel import AddressedTunnel
 
 MSG_TYPE = 'did:sov:BzCbsNYhMrjHiqZDTUASHg;spec/sirius_rpc/1.0/future'
 
 
+class _Mailbox:
+    """Responses that were read from tunnel by one future on behalf of others waiting on the same tunnel"""
+
+    MAX_PARKED = 1000
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.parked = {}
+        # receiver of non-RPC payloads (co-protocol events) that share the tunnel connection
+        self.on_event: Optional[Callable[[Message], None]] = None
+
+    def park(self, thid: str, payload: Message):
+        if len(self.parked) >= self.MAX_PARKED:
+            # responses of futures that stopped waiting are never claimed
+            expired = next(iter(self.parked))
+            del self.parked[expired]
+            logging.warning('Drop unclaimed response for future with id: "%s"' % expired)
+        self.parked[thid] = payload
+
+
+_mailboxes = weakref.WeakKeyDictionary()
+
+
+def _get_mailbox(tunnel: AddressedTunnel) -> _Mailbox:
+    mailbox = _mailboxes.get(tunnel, None)
+    if mailbox is None:
+        mailbox = _Mailbox()
+        _mailboxes[tunnel] = mailbox
+    return mailbox
+
+
 class Future:
     """Futures and Promises pattern.
     (http://dist-prog-book.com/chapter/2/futures.html)
@@ -26,6 +60,8 @@ class Future:
     response awaiting routines.
     """
 
+    MSG_TYPE = MSG_TYPE
+
     def __init__(self, tunnel: AddressedTunnel, expiration_time: datetime.datetime = None):
         """
         :param tunnel: communication tunnel for server-side cloud agent
@@ -38,6 +74,11 @@ class Future:
         self.__exception = None
         self.expiration_time = expiration_time
 
+    @staticmethod
+    def mailbox(tunnel: AddressedTunnel) -> _Mailbox:
+        """Responses parking and reading lock shared by all futures of the tunnel"""
+        return _get_mailbox(tunnel)
+
     @property
     def promise(self):
         """
@@ -68,10 +109,36 @@ class Future:
                 expires_time = datetime.datetime.now() + datetime.timedelta(seconds=timeout)
             else:
                 expires_time = datetime.datetime.now() + datetime.timedelta(days=365)
+            # Several futures may wait on the same tunnel concurrently: the one who reads response of another
+            # parks it, so tunnel is read by single reader at a time and no response is lost
+            mailbox = _get_mailbox(self.__tunnel)
             while datetime.datetime.now() < expires_time:
-                timedelta = expires_time - datetime.datetime.now()
-                timeout = max(timedelta.seconds, 0)
-                payload = await self.__tunnel.receive(timeout)
+                payload = mailbox.parked.pop(self.__id, None)
+                if payload is None:
+                    # Lock may be held by reader of another future, so waiting for it is bounded by own timeout
+                    remaining = (expires_time - datetime.datetime.now()).total_seconds()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(mailbox.lock.acquire(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    try:
+                        if self.__id in mailbox.parked:
+                            continue
+                        remaining = (expires_time - datetime.datetime.now()).total_seconds()
+                        if remaining <= 0:
+                            break
+                        payload = await self.__tunnel.receive(remaining)
+                    finally:
+                        mailbox.lock.release()
+                    thid = payload.get('~thread', {}).get('thid', None)
+                    if payload.get('@type') == MSG_TYPE and thid is not None and thid != self.__id:
+                        mailbox.park(thid, payload)
+                        continue
+                    if payload.get('@type') != MSG_TYPE and mailbox.on_event is not None:
+                        mailbox.on_event(payload)
+                        continue
                 if (payload.get('@type') == MSG_TYPE) and (payload.get('~thread', {}).get('thid', None) == self.__id):
                     exception = payload['exception']
                     if exception:
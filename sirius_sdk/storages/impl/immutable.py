@@ -1,29 +1,95 @@
-from typing import Optional, Any, List
+from bisect import bisect_left
+from typing import Optional, Any, List, Tuple, Iterable
 
 from sirius_sdk.storages.abstract.immutable import AbstractImmutableCollection
 
 
+class _IndexedDatabase:
+    """Items with inverted index: (tag name, tag value) -> ascending ids of the items"""
+
+    def __init__(self):
+        self.items = []
+        self.index = {}
+
+    def add(self, value: Any, tags: dict):
+        id_ = len(self.items)
+        self.items.append((value, tags))
+        for key in tags.items():
+            if _is_hashable(key):
+                self.index.setdefault(key, []).append(id_)
+
+    def find(self, tags: dict) -> List[int]:
+        indexed = []
+        scanned = []
+        for key in tags.items():
+            (indexed if _is_hashable(key) else scanned).append(key)
+        if indexed:
+            postings = []
+            for key in indexed:
+                posting = self.index.get(key, None)
+                if not posting:
+                    return []
+                postings.append(posting)
+            ids = self.__intersect(postings)
+        else:
+            ids = range(len(self.items))
+        if scanned:
+            ids = [id_ for id_ in ids if all(self.items[id_][1].get(name, _MISSING) == value for name, value in scanned)]
+        return list(ids)
+
+    @staticmethod
+    def __intersect(postings: List[List[int]]) -> Iterable[int]:
+        postings = sorted(postings, key=len)
+        smallest, others = postings[0], postings[1:]
+        if not others:
+            return smallest
+        result = []
+        # Posting lists are sorted, so every next id is searched from the position of the previous one
+        positions = [0] * len(others)
+        for id_ in smallest:
+            for n, posting in enumerate(others):
+                pos = bisect_left(posting, id_, positions[n])
+                positions[n] = pos
+                if pos == len(posting):
+                    return result
+                if posting[pos] != id_:
+                    break
+            else:
+                result.append(id_)
+        return result
+
+
+_MISSING = object()
+
+
+def _is_hashable(key: Tuple[str, Any]) -> bool:
+    try:
+        hash(key)
+    except TypeError:
+        return False
+    return True
+
+
 class InMemoryImmutableCollection(AbstractImmutableCollection):
 
     def __init__(self, *args, **kwargs):
         self.__databases = {}
-        self.__selected_db = None
+        self.__selected_db: Optional[_IndexedDatabase] = None
         super().__init__(*args, **kwargs)
 
     async def select_db(self, db_name: str):
         if db_name not in self.__databases:
-            self.__databases[db_name] = []
+            self.__databases[db_name] = _IndexedDatabase()
         self.__selected_db = self.__databases[db_name]
 
     async def add(self, value: Any, tags: dict):
-        item = (value, tags)
-        self.__selected_db.append(item)
+        self.__selected_db.add(value, tags)
 
     async def fetch(self, tags: dict, limit: int = None) -> (List[Any], int):
-        result = []
-        for item in self.__selected_db:
-            value_ = item[0]
-            tags_ = item[1]
-            if tags.items() <= tags_.items():
-                result.append(value_)
-        return result
+        ids = self.__selected_db.find(tags)
+        if limit is not None:
+            selected = ids[:limit]
+        else:
+            selected = ids
+        items = self.__selected_db.items
+        return [items[id_][0] for id_ in selected], len(ids)
@@ -0,0 +1,633 @@
+import json
+import uuid
+import random
+import asyncio
+import contextlib
+from typing import List, Dict, Optional, Tuple, Any
+
+import nacl.bindings
+import nacl.exceptions
+
+from sirius_sdk.agent.pairwise import Pairwise, AbstractPairwiseList
+from sirius_sdk.agent.microledgers import Transaction, AbstractMicroledgerList
+from sirius_sdk.agent.local_microledgers import InMemoryMicroledgerList
+from sirius_sdk.agent.wallet.abstract.crypto import AbstractCrypto
+from sirius_sdk.agent.consensus.simple.messages import InitRequestLedgerMessage, ProposeTransactionsMessage
+from sirius_sdk.agent.consensus.simple.state_machines import MicroLedgerSimpleConsensus
+from sirius_sdk.encryption import create_keypair, bytes_to_b58, b58_to_bytes, b64_to_bytes, pack_message, unpack_message
+from sirius_sdk.errors.exceptions import *
+from sirius_sdk.hub import CoProtocolThreadedTheirs
+from sirius_sdk.hub.core import _bind_hub
+from sirius_sdk.hub.latency import LatencyTracker
+from sirius_sdk.messaging import Message, restore_message_instance
+
+from .helpers import InMemoryChannel
+
+
+THREAD_DECORATOR = '~thread'
+
+
+class SimulatedCrypto(AbstractCrypto):
+    """Ed25519 signatures with keys kept in memory, signing cost is the same as for the wallet"""
+
+    def __init__(self):
+        self.__keys = {}
+        self.__metadata = {}
+
+    async def create_key(self, seed: str = None, crypto_type: str = None) -> str:
+        if isinstance(seed, str):
+            seed = seed.encode()
+        verkey, sigkey = create_keypair(seed)
+        verkey = bytes_to_b58(verkey)
+        self.__keys[verkey] = sigkey
+        return verkey
+
+    async def set_key_metadata(self, verkey: str, metadata: dict) -> None:
+        self.__metadata[verkey] = metadata
+
+    async def get_key_metadata(self, verkey: str) -> Optional[dict]:
+        return self.__metadata.get(verkey, None)
+
+    async def crypto_sign(self, signer_vk: str, msg: bytes) -> bytes:
+        sigkey = self.__sigkey(signer_vk)
+        return nacl.bindings.crypto_sign(msg, sigkey)[:nacl.bindings.crypto_sign_BYTES]
+
+    async def crypto_verify(self, signer_vk: str, msg: bytes, signature: bytes) -> bool:
+        try:
+            nacl.bindings.crypto_sign_open(signature + msg, b58_to_bytes(signer_vk))
+        except nacl.exceptions.BadSignatureError:
+            return False
+        else:
+            return True
+
+    async def anon_crypt(self, recipient_vk: str, msg: bytes) -> bytes:
+        pk = nacl.bindings.crypto_sign_ed25519_pk_to_curve25519(b58_to_bytes(recipient_vk))
+        return nacl.bindings.crypto_box_seal(msg, pk)
+
+    async def anon_decrypt(self, recipient_vk: str, encrypted_msg: bytes) -> bytes:
+        sigkey = self.__sigkey(recipient_vk)
+        pk = nacl.bindings.crypto_sign_ed25519_pk_to_curve25519(b58_to_bytes(recipient_vk))
+        sk = nacl.bindings.crypto_sign_ed25519_sk_to_curve25519(sigkey)
+        try:
+            return nacl.bindings.crypto_box_seal_open(encrypted_msg, pk, sk)
+        except nacl.exceptions.CryptoError as e:
+            raise SiriusCryptoError('Unable to decrypt message') from e
+
+    async def pack_message(self, message: Any, recipient_verkeys: list, sender_verkey: str = None) -> bytes:
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        sigkey = self.__sigkey(sender_verkey) if sender_verkey else None
+        return pack_message(message, recipient_verkeys, sender_verkey, sigkey)
+
+    async def unpack_message(self, jwe: bytes) -> dict:
+        envelope = json.loads(jwe)
+        recipients = json.loads(b64_to_bytes(envelope['protected'], urlsafe=True).decode())['recipients']
+        for recipient in recipients:
+            verkey = recipient['header']['kid']
+            if verkey in self.__keys:
+                message, sender_vk, recipient_vk = unpack_message(envelope, verkey, self.__keys[verkey])
+                unpacked = {'message': message, 'recipient_verkey': recipient_vk}
+                if sender_vk:
+                    unpacked['sender_verkey'] = sender_vk
+                return unpacked
+        raise SiriusCryptoError('No one of recipient keys is known')
+
+    def __sigkey(self, verkey: str) -> bytes:
+        sigkey = self.__keys.get(verkey, None)
+        if sigkey is None:
+            raise SiriusCryptoError('Unknown key "%s"' % verkey)
+        return sigkey
+
+
+class SimulatedPairwiseList(AbstractPairwiseList):
+
+    def __init__(self):
+        self.__by_did = {}
+        self.__by_verkey = {}
+
+    async def create(self, pairwise: Pairwise):
+        self.__by_did[pairwise.their.did] = pairwise
+        self.__by_verkey[pairwise.their.verkey] = pairwise
+        self._notify_updated(pairwise.their.did)
+
+    async def update(self, pairwise: Pairwise):
+        await self.create(pairwise)
+
+    async def is_exists(self, their_did: str) -> bool:
+        return their_did in self.__by_did
+
+    async def ensure_exists(self, pairwise: Pairwise):
+        await self.create(pairwise)
+
+    async def load_for_did(self, their_did: str) -> Optional[Pairwise]:
+        return self.__by_did.get(their_did, None)
+
+    async def load_for_verkey(self, their_verkey: str) -> Optional[Pairwise]:
+        return self.__by_verkey.get(their_verkey, None)
+
+    async def _start_loading(self):
+        pass
+
+    async def _partial_load(self) -> (bool, List[Pairwise]):
+        return False, list(self.__by_did.values())
+
+    async def _stop_loading(self):
+        pass
+
+
+class SimulatedHub:
+    """Services of the participant that state machines reach via sirius_sdk proxies"""
+
+    def __init__(self, crypto: AbstractCrypto, microledgers: AbstractMicroledgerList, pairwise_list: AbstractPairwiseList):
+        self.__crypto = crypto
+        self.__microledgers = microledgers
+        self.__pairwise_list = pairwise_list
+
+    async def get_crypto(self) -> AbstractCrypto:
+        return self.__crypto
+
+    async def get_microledgers(self) -> AbstractMicroledgerList:
+        return self.__microledgers
+
+    async def get_pairwise_list(self) -> AbstractPairwiseList:
+        return self.__pairwise_list
+
+    @contextlib.asynccontextmanager
+    async def get_agent_connection_lazy(self):
+        raise SiriusContextError('Agent connection is not available in simulation')
+        yield
+
+
+class SimulatedNetwork:
+    """Delivers messages among participants with given link latency and loss probability
+
+    :param latency: one-way delivery time in sec
+    :param jitter: random extra delay in sec, messages may be reordered, so Propose of the next round
+        may outrun Post-Commit of the previous one
+    :param loss: probability of message loss
+    :param seed: seed of the random generator to reproduce the run
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, seed: int = None):
+        if not 0 <= loss < 1:
+            raise SiriusContextError('Loss probability must be in [0, 1)')
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.sent = 0
+        self.lost = 0
+        self.__random = random.Random(seed)
+        self.__nodes = {}
+
+    def attach(self, node: 'SimulatedParticipant'):
+        self.__nodes[node.me.verkey] = node
+
+    def transmit(self, sender_verkey: str, recipient_verkey: str, message: Message) -> bool:
+        node = self.__nodes.get(recipient_verkey, None)
+        if node is None:
+            return False
+        self.sent += 1
+        if self.loss and self.__random.random() < self.loss:
+            self.lost += 1
+            return True
+        # every recipient receives its own copy as it would be over the wire
+        packet = json.dumps({'sender': sender_verkey, 'message': message}).encode()
+        delay = self.latency + (self.__random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            asyncio.get_event_loop().call_later(delay, self.__deliver, node, packet)
+        else:
+            self.__deliver(node, packet)
+        return True
+
+    @staticmethod
+    def __deliver(node: 'SimulatedParticipant', packet: bytes):
+        # inbox is unbounded, so writes are completed in the order they were scheduled
+        asyncio.ensure_future(node.inbox.write(packet))
+
+
+class _SimulatedThread:
+    """Messages of the thread routed by the participant dispatcher"""
+
+    def __init__(self, node: 'SimulatedParticipant', thid: str, time_to_live: float = None):
+        self.node = node
+        self.thid = thid
+        self.queue = asyncio.Queue()
+        self.is_aborted = False
+        loop = asyncio.get_event_loop()
+        self.die_timestamp = loop.time() + time_to_live if time_to_live else None
+        node.register_thread(thid, self.queue)
+
+    def abort(self):
+        self.is_aborted = True
+        self.queue.put_nowait(None)
+
+    def close(self):
+        self.node.unregister_thread(self.thid)
+
+    def transmit(self, message: Message, their: Pairwise) -> bool:
+        message[THREAD_DECORATOR] = {'thid': self.thid}
+        return self.node.network.transmit(self.node.me.verkey, their.their.verkey, message)
+
+    async def read(self, timeout: float = None) -> Tuple[Optional[str], Optional[Message]]:
+        if self.die_timestamp is not None:
+            rest = max(self.die_timestamp - asyncio.get_event_loop().time(), 0)
+            timeout = rest if timeout is None else min(timeout, rest)
+        try:
+            item = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None, None
+        if item is None:
+            raise OperationAbortedManually('User aborted operation')
+        return item
+
+
+class SimulatedThreadedP2P:
+    """Simulated analog of sirius_sdk.hub.CoProtocolThreadedP2P"""
+
+    def __init__(self, node: 'SimulatedParticipant', thid: str, to: Pairwise, time_to_live: float = None):
+        self.__thread = _SimulatedThread(node, thid, time_to_live)
+        self.__to = to
+
+    @property
+    def is_aborted(self) -> bool:
+        return self.__thread.is_aborted
+
+    async def abort(self):
+        self.__thread.abort()
+
+    def close(self):
+        self.__thread.close()
+
+    async def send(self, message: Message):
+        self.__thread.transmit(message, self.__to)
+
+    async def get_one(self) -> (Optional[Message], str, Optional[str]):
+        sender_verkey, message = await self.__thread.read()
+        return message, sender_verkey, self.__thread.node.me.verkey
+
+    async def switch(self, message: Message) -> (bool, Message):
+        await self.send(message)
+        while True:
+            message, sender_verkey, _ = await self.get_one()
+            if message is None:
+                return False, None
+            if sender_verkey == self.__to.their.verkey:
+                return True, message
+
+
+class SimulatedThreadedTheirs(CoProtocolThreadedTheirs):
+    """CoProtocolThreadedTheirs over the simulated network, fan-out logic is inherited"""
+
+    def __init__(
+            self, node: 'SimulatedParticipant', thid: str, theirs: List[Pairwise], time_to_live: float = None,
+            latency: LatencyTracker = None
+    ):
+        super().__init__(thid, theirs, time_to_live=time_to_live, latency=latency)
+        self.__thread = _SimulatedThread(node, thid, time_to_live)
+
+    @property
+    def is_aborted(self) -> bool:
+        return self.__thread.is_aborted
+
+    async def abort(self):
+        self.__thread.abort()
+
+    def close(self):
+        self.__thread.close()
+
+    async def send(self, message: Message) -> Dict[Pairwise, Tuple[bool, str]]:
+        return {p2p: (self.__thread.transmit(message, p2p), None) for p2p in self.theirs}
+
+    async def _read_message(self, timeout: float = None) -> Tuple[Optional[Message], Optional[str]]:
+        sender_verkey, message = await self.__thread.read(timeout)
+        return message, sender_verkey
+
+
+class SimulatedConsensus(MicroLedgerSimpleConsensus):
+    """MicroLedgerSimpleConsensus communicating over SimulatedNetwork"""
+
+    def __init__(self, node: 'SimulatedParticipant', *args, **kwargs):
+        super().__init__(node.me, *args, **kwargs)
+        self.__node = node
+
+    @contextlib.asynccontextmanager
+    async def acceptors(self, theirs: List[Pairwise], thread_id: str):
+        co = SimulatedThreadedTheirs(
+            self.__node, thread_id, theirs, time_to_live=self.time_to_live, latency=self.latency_tracker
+        )
+        self._register_for_aborting(co)
+        try:
+            try:
+                yield co
+            except OperationAbortedManually:
+                await self.log(progress=100, message='Aborted')
+                raise StateMachineAborted('Aborted by User')
+        finally:
+            co.close()
+            self._unregister_for_aborting(co)
+
+    @contextlib.asynccontextmanager
+    async def leader(self, their: Pairwise, thread_id: str, time_to_live: int = None):
+        co = SimulatedThreadedP2P(self.__node, thread_id, their, time_to_live=time_to_live or self.time_to_live)
+        self._register_for_aborting(co)
+        try:
+            try:
+                yield co
+            except OperationAbortedManually:
+                await self.log(progress=100, message='Aborted')
+                raise StateMachineAborted('Aborted by User')
+        finally:
+            co.close()
+            self._unregister_for_aborting(co)
+
+
+class SimulatedParticipant:
+    """Consensus actor: own wallet keys, microledgers and pairwise list, accepts proposals from the inbox
+
+    :param slowness: delay in sec of every incoming message processing
+    :param tracker: (optional) latency tracker of the participant state machines, stages wait whole time to live without it
+    """
+
+    def __init__(
+            self, network: SimulatedNetwork, label: str, slowness: float = 0.0, time_to_live: float = 5,
+            tracker: LatencyTracker = None
+    ):
+        self.network = network
+        self.tracker = tracker
+        self.label = label
+        self.slowness = slowness
+        self.time_to_live = time_to_live
+        self.crypto = SimulatedCrypto()
+        self.microledgers = InMemoryMicroledgerList()
+        self.pairwise_list = SimulatedPairwiseList()
+        self.hub = SimulatedHub(self.crypto, self.microledgers, self.pairwise_list)
+        self.inbox = InMemoryChannel()
+        self.accepted = 0
+        self.declined = 0
+        self.dropped = 0
+        self.__me = None
+        self.__threads = {}
+        self.__dispatcher = None
+        self.__tasks = set()
+
+    @property
+    def me(self) -> Pairwise.Me:
+        return self.__me
+
+    async def setup(self):
+        verkey = await self.crypto.create_key()
+        self.__me = Pairwise.Me(did=bytes_to_b58(b58_to_bytes(verkey)[:16]), verkey=verkey)
+        self.network.attach(self)
+
+    async def establish(self, other: 'SimulatedParticipant'):
+        await self.pairwise_list.create(
+            Pairwise(
+                me=self.me,
+                their=Pairwise.Their(
+                    did=other.me.did, label=other.label, endpoint='sim://' + other.label, verkey=other.me.verkey
+                )
+            )
+        )
+
+    def start(self):
+        if self.__dispatcher is None:
+            self.__dispatcher = asyncio.ensure_future(self.__dispatch())
+
+    async def stop(self):
+        if self.__dispatcher is not None:
+            # empty packet stops dispatcher without interrupting the channel reading
+            await self.inbox.write(b'')
+            await self.__dispatcher
+            self.__dispatcher = None
+        tasks = list(self.__tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def join(self):
+        """Wait acceptors of the proposals received so far are terminated"""
+        while self.__tasks:
+            await asyncio.wait(list(self.__tasks))
+
+    def register_thread(self, thid: str, queue: asyncio.Queue):
+        self.__threads[thid] = queue
+
+    def unregister_thread(self, thid: str):
+        self.__threads.pop(thid, None)
+
+    def state_machine(self, logger=None) -> SimulatedConsensus:
+        state_machine = SimulatedConsensus(self, time_to_live=self.time_to_live, logger=logger)
+        if self.tracker is not None:
+            state_machine.latency_tracker = self.tracker
+        return state_machine
+
+    async def run(self, coro):
+        """Run coroutine in the context of the participant services"""
+        with _bind_hub(self.hub):
+            return await coro
+
+    async def __dispatch(self):
+        while True:
+            packet = await self.inbox.read()
+            if not packet:
+                break
+            packet = json.loads(packet.decode())
+            if self.slowness:
+                await asyncio.sleep(self.slowness)
+            ok, message = restore_message_instance(packet['message'])
+            thid = message.get(THREAD_DECORATOR, {}).get('thid', None)
+            queue = self.__threads.get(thid, None)
+            if queue is not None:
+                queue.put_nowait((packet['sender'], message))
+            elif isinstance(message, (InitRequestLedgerMessage, ProposeTransactionsMessage)):
+                task = asyncio.ensure_future(self.run(self.__accept(packet['sender'], message)))
+                self.__tasks.add(task)
+                task.add_done_callback(self.__tasks.discard)
+            else:
+                # late message of the finished or timed out thread
+                self.dropped += 1
+
+    async def __accept(self, sender_verkey: str, propose: Message):
+        leader = await self.pairwise_list.load_for_verkey(sender_verkey)
+        if leader is None:
+            self.dropped += 1
+            return
+        state_machine = self.state_machine()
+        if isinstance(propose, InitRequestLedgerMessage):
+            ok, _ = await state_machine.accept_microledger(leader, propose)
+        else:
+            ok = await state_machine.accept_commit(leader, propose)
+        if ok:
+            self.accepted += 1
+        else:
+            self.declined += 1
+
+
+class _StageTimer:
+    """State machine logger that marks time of progress points"""
+
+    def __init__(self):
+        self.marks = {}
+
+    async def __call__(self, **kwargs):
+        progress = kwargs.get('progress', None)
+        if progress is not None:
+            self.marks[progress] = asyncio.get_event_loop().time()
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(percent / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class SimulationReport:
+
+    def __init__(self):
+        self.commits = 0
+        self.failures = 0
+        self.transactions = 0
+        self.elapsed = 0.0
+        self.stages = {name: [] for name in ConsensusSimulator.STAGES}
+        self.problem_reports = []
+
+    @property
+    def commits_per_sec(self) -> float:
+        return self.commits / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def txns_per_sec(self) -> float:
+        return self.transactions / self.elapsed if self.elapsed else 0.0
+
+    def latency(self, stage: str, percent: float = 50) -> Optional[float]:
+        """Stage latency percentile in sec among successful rounds"""
+        values = self.stages[stage]
+        return _percentile(values, percent) if values else None
+
+    def __str__(self):
+        lines = [
+            'commits: %d, failures: %d, elapsed: %.3f sec' % (self.commits, self.failures, self.elapsed),
+            'commits/sec: %.1f, txns/sec: %.1f' % (self.commits_per_sec, self.txns_per_sec)
+        ]
+        for stage in self.stages:
+            if self.stages[stage]:
+                lines.append(
+                    '%-12s p50: %.2f ms, p95: %.2f ms, max: %.2f ms' % (
+                        stage, self.latency(stage, 50) * 1000, self.latency(stage, 95) * 1000,
+                        max(self.stages[stage]) * 1000
+                    )
+                )
+        return '\n'.join(lines)
+
+
+class ConsensusSimulator:
+    """Runs N MicroLedgerSimpleConsensus actors in-process over simulated transport.
+
+    First participant is the leader of all rounds, ledgers are committed concurrently
+    while rounds of the same ledger are sequential.
+
+    :param participants: count of participants
+    :param latency: link latency in sec
+    :param jitter: random extra link delay in sec
+    :param loss: message loss probability
+    :param slowness: processing delay in sec of participants by index
+    :param time_to_live: consensus state machines timeout in sec
+    :param seed: random seed
+    :param tracker: (optional) latency tracker of the participants state machines
+    """
+
+    # Leader progress points of MicroLedgerSimpleConsensus.commit
+    STAGES = {
+        'propose': (20, 30),
+        'commit': (60, 70),
+        'post-commit': (90, 100),
+        'total': (0, 100)
+    }
+
+    def __init__(
+            self, participants: int = 3, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0,
+            slowness: Dict[int, float] = None, time_to_live: float = 5, seed: int = None,
+            tracker: LatencyTracker = None
+    ):
+        if participants < 2:
+            raise SiriusContextError('Consensus expects 2 participants at least')
+        self.network = SimulatedNetwork(latency=latency, jitter=jitter, loss=loss, seed=seed)
+        slowness = slowness or {}
+        self.participants = [
+            SimulatedParticipant(
+                self.network, label='participant-%d' % n, slowness=slowness.get(n, 0.0),
+                time_to_live=time_to_live, tracker=tracker
+            )
+            for n in range(participants)
+        ]
+
+    @property
+    def leader(self) -> SimulatedParticipant:
+        return self.participants[0]
+
+    @property
+    def dids(self) -> List[str]:
+        return [p.me.did for p in self.participants]
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def start(self):
+        for p in self.participants:
+            await p.setup()
+        for p in self.participants:
+            for other in self.participants:
+                if other is not p:
+                    await p.establish(other)
+            p.start()
+
+    async def stop(self):
+        for p in self.participants:
+            await p.stop()
+
+    async def init_ledger(self, name: str, genesis: List[dict] = None) -> bool:
+        genesis = [Transaction.create(txn) for txn in (genesis or [{'op': 'genesis', 'ledger': name}])]
+        state_machine = self.leader.state_machine()
+        ok, _ = await self.leader.run(state_machine.init_microledger(name, self.dids, genesis))
+        return ok
+
+    async def benchmark(self, rounds: int = 100, batch_size: int = 1, ledgers: int = 1) -> SimulationReport:
+        """Commit rounds * batch_size transactions to every of ledgers
+
+        :return: throughput and per-stage latency of commit rounds
+        """
+        report = SimulationReport()
+        names = ['ledger-' + uuid.uuid4().hex for _ in range(ledgers)]
+        for name in names:
+            if not await self.init_ledger(name):
+                raise SiriusContextError('Ledger "%s" was not initialized' % name)
+        loop = asyncio.get_event_loop()
+        stamp = loop.time()
+        await asyncio.gather(*[self.__commit_rounds(name, rounds, batch_size, report) for name in names])
+        report.elapsed = loop.time() - stamp
+        # acceptors flush transactions after the leader
+        for p in self.participants:
+            await p.join()
+        return report
+
+    async def __commit_rounds(self, name: str, rounds: int, batch_size: int, report: SimulationReport):
+        ledger = await self.leader.microledgers.ledger(name)
+        for n in range(rounds):
+            txns = [Transaction.create({'op': 'op', 'round': n, 'no': i}) for i in range(batch_size)]
+            timer = _StageTimer()
+            state_machine = self.leader.state_machine(logger=timer)
+            ok, _ = await self.leader.run(state_machine.commit(ledger, self.dids, txns))
+            if ok:
+                report.commits += 1
+                report.transactions += batch_size
+                for stage, (begin, end) in self.STAGES.items():
+                    if begin in timer.marks and end in timer.marks:
+                        report.stages[stage].append(timer.marks[end] - timer.marks[begin])
+            else:
+                report.failures += 1
+                report.problem_reports.append(state_machine.problem_report)
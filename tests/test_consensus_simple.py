@@ -1,4 +1,6 @@
 import copy
+import json
+import asyncio
 from typing import List
 from datetime import datetime
 
@@ -6,11 +8,17 @@ import pytest
 
 import sirius_sdk
 from sirius_sdk import Agent, P2PConnection
-from sirius_sdk.agent.consensus.simple.state_machines import MicroLedgerSimpleConsensus
+from sirius_sdk.agent.consensus.simple.state_machines import MicroLedgerSimpleConsensus, ParticipantsCache, \
+    REQUEST_NOT_ACCEPTED
+from sirius_sdk.agent.pairwise import AbstractPairwiseList
+from sirius_sdk.agent.consensus.simple.group_commit import MicroLedgerGroupCommit
+from sirius_sdk.hub.latency import LatencyTracker
+from sirius_sdk.agent.local_microledgers import InMemoryMicroledgerList
 from sirius_sdk.agent.consensus.simple.messages import *
 
 from .conftest import get_pairwise
 from .helpers import run_coroutines, ServerTestSuite
+from .consensus_simulator import ConsensusSimulator, SimulatedCrypto
 
 
 async def routine_of_ledger_creator(
@@ -410,3 +418,259 @@ async def test_simple_consensus_error(A: Agent, B: Agent, C: Agent, ledger_name:
         await A.close()
         await B.close()
         await C.close()
+
+
+class RecordingGroupCommit(MicroLedgerGroupCommit):
+    """Commits batches to the ledger directly instead of consensus round"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rounds = []
+
+    async def _run_round(self, ledger, participants, transactions):
+        self.rounds.append(len(transactions))
+        if any(txn['op'] == 'fail' for txn in transactions):
+            return False, None, SimpleConsensusProblemReport(REQUEST_NOT_ACCEPTED, 'Declined')
+        await ledger.append(transactions)
+        await asyncio.sleep(0.05)
+        _, _, txns = await ledger.commit(len(transactions))
+        return True, txns, None
+
+
+@pytest.mark.asyncio
+async def test_group_commit_batching():
+    ledger, _ = await InMemoryMicroledgerList().create('ledger', [{"reqId": 0, "op": "genesis"}])
+    me = Pairwise.Me(did='did', verkey='verkey')
+    participants = ['did', 'did2']
+    group = RecordingGroupCommit(me, max_batch_size=5, max_delay=0.01)
+
+    async def submit(n: int, count: int):
+        return await group.commit(ledger, participants, [{"reqId": n, "op": "op%d-%d" % (n, i)} for i in range(count)])
+
+    results = await asyncio.gather(*[submit(n, 2) for n in range(10)])
+    await group.flush()
+    # Callers transactions are batched but never split among rounds
+    assert sum(group.rounds) == 20 and len(group.rounds) < 10 and max(group.rounds) <= 5
+    for n, (ok, txns) in enumerate(results):
+        assert ok
+        assert [txn['op'] for txn in txns] == ['op%d-0' % n, 'op%d-1' % n]
+    assert ledger.size == 21
+
+    ok, txns = await group.commit(ledger, participants, [{"reqId": 11, "op": "fail"}])
+    assert not ok and txns is None
+    assert group.problem_report.problem_code == REQUEST_NOT_ACCEPTED
+    pending = asyncio.ensure_future(submit(12, 1))
+    await asyncio.sleep(0)
+    with pytest.raises(SiriusContextError):
+        await group.commit(ledger, ['did', 'did3'], [{"op": "op"}])
+    assert (await pending)[0]
+
+    # Every caller of the failed batch gets its own problem report
+    async def fail(n: int):
+        ok_, _ = await group.commit(ledger, participants, [{"reqId": n, "op": "fail"}])
+        return ok_, group.problem_report
+
+    (ok1, report1), (ok2, report2) = await asyncio.gather(fail(13), fail(14))
+    assert not ok1 and not ok2
+    assert report1 is not report2 and report1.problem_code == report2.problem_code == REQUEST_NOT_ACCEPTED
+    # report of the caller context is kept
+    assert group.problem_report is not report1 and group.problem_report is not report2
+
+    # Callers don't hang if worker was cancelled before or after it was started
+    for delay in [0, 0.001]:
+        pending = [asyncio.ensure_future(submit(n, 1)) for n in (15, 16)]
+        await asyncio.sleep(0)
+        worker = group._MicroLedgerGroupCommit__queues['ledger'].worker
+        await asyncio.sleep(delay)
+        worker.cancel()
+        for fut in pending:
+            with pytest.raises(SiriusContextError):
+                await fut
+
+
+class CountingPairwiseList(AbstractPairwiseList):
+
+    def __init__(self, dids: List[str]):
+        self.dids = dids
+        self.loads = 0
+
+    async def load_for_did(self, their_did: str):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        if their_did in self.dids:
+            return Pairwise(
+                me=Pairwise.Me(did='me', verkey='me_verkey'),
+                their=Pairwise.Their(did=their_did, label=their_did, endpoint='http://endpoint', verkey=their_did)
+            )
+        else:
+            return None
+
+    async def create(self, pairwise: Pairwise):
+        self._notify_updated(pairwise.their.did)
+
+    async def update(self, pairwise: Pairwise):
+        self._notify_updated(pairwise.their.did)
+
+    async def is_exists(self, their_did: str) -> bool:
+        return their_did in self.dids
+
+    async def ensure_exists(self, pairwise: Pairwise):
+        await self.update(pairwise)
+
+    async def load_for_verkey(self, their_verkey: str):
+        return None
+
+    async def _start_loading(self):
+        pass
+
+    async def _partial_load(self):
+        return False, []
+
+    async def _stop_loading(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_participants_cache():
+    cache = ParticipantsCache()
+    dids = ['did%d' % n for n in range(50)]
+    pairwise_list = CountingPairwiseList(dids)
+    me = Pairwise.Me(did='me', verkey='me_verkey')
+    # Concurrent state machines share loading of the same participants
+    results = await asyncio.gather(*[cache.resolve(me, ['me'] + dids, pairwise_list) for _ in range(3)])
+    assert all(set(resolved.keys()) == set(dids) for resolved in results)
+    assert pairwise_list.loads == len(dids)
+
+    await cache.resolve(me, dids, pairwise_list)
+    assert pairwise_list.loads == len(dids)
+    await pairwise_list.update(results[0]['did1'])
+    await cache.resolve(me, dids, pairwise_list)
+    assert pairwise_list.loads == len(dids) + 1
+
+    with pytest.raises(SiriusValidationError):
+        await cache.resolve(me, ['unknown'], pairwise_list)
+
+    # Entries are scoped to pairwise list
+    other_list = CountingPairwiseList(dids)
+    await cache.resolve(me, ['did1'], other_list)
+    assert other_list.loads == 1
+    # Cancelled caller does not cancel loading shared with others
+    await pairwise_list.update(results[0]['did2'])
+    owner = asyncio.ensure_future(cache.resolve(me, ['did2'], pairwise_list))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(cache.resolve(me, ['did2'], pairwise_list))
+    await asyncio.sleep(0)
+    owner.cancel()
+    assert 'did2' in await follower
+    # Modification of the participant drops pending load of that participant only
+    await asyncio.gather(pairwise_list.update(results[0]['did3']), pairwise_list.update(results[0]['did4']))
+    loads = pairwise_list.loads
+    loading = asyncio.ensure_future(cache.resolve(me, ['did3', 'did4'], pairwise_list))
+    await asyncio.sleep(0.005)
+    await pairwise_list.update(results[0]['did4'])
+    assert set(await loading) == {'did3', 'did4'}
+    await cache.resolve(me, ['did3', 'did4'], pairwise_list)
+    assert pairwise_list.loads == loads + 3
+    AbstractPairwiseList.remove_update_listener(cache.invalidate)
+
+    # Cache is bounded by size and time to live
+    cache = ParticipantsCache(max_size=2, ttl=0.5)
+    pairwise_list = CountingPairwiseList(dids)
+    for did in dids[:3]:
+        await cache.resolve(me, [did], pairwise_list)
+    await cache.resolve(me, dids[1:3], pairwise_list)
+    assert pairwise_list.loads == 3
+    await cache.resolve(me, dids[:1], pairwise_list)
+    assert pairwise_list.loads == 4
+    await asyncio.sleep(0.6)
+    await cache.resolve(me, dids[:1], pairwise_list)
+    assert pairwise_list.loads == 5
+    AbstractPairwiseList.remove_update_listener(cache.invalidate)
+
+
+def test_latency_tracker_opt_in():
+    me = Pairwise.Me(did='did', verkey='verkey')
+    assert MicroLedgerSimpleConsensus(me).latency_tracker is None
+    tracker = LatencyTracker()
+    assert MicroLedgerSimpleConsensus(me, latency_tracker=tracker).latency_tracker is tracker
+    assert MicroLedgerSimpleConsensus(me).latency_tracker is None
+
+
+@pytest.mark.asyncio
+async def test_simulated_crypto():
+    crypto = SimulatedCrypto()
+    alice, bob = await crypto.create_key(), await crypto.create_key()
+    encrypted = await crypto.anon_crypt(bob, b'secret')
+    assert await crypto.anon_decrypt(bob, encrypted) == b'secret'
+    with pytest.raises(SiriusCryptoError):
+        await crypto.anon_decrypt(alice, encrypted)
+
+    packed = await crypto.pack_message({'@type': 'test'}, [bob], alice)
+    unpacked = await crypto.unpack_message(packed)
+    assert json.loads(unpacked['message']) == {'@type': 'test'}
+    assert unpacked['sender_verkey'] == alice and unpacked['recipient_verkey'] == bob
+    unpacked = await crypto.unpack_message(await crypto.pack_message('anon', [bob]))
+    assert unpacked['message'] == 'anon' and 'sender_verkey' not in unpacked
+    with pytest.raises(SiriusCryptoError):
+        await SimulatedCrypto().unpack_message(packed)
+
+
+@pytest.mark.asyncio
+async def test_simulated_consensus():
+    async with ConsensusSimulator(participants=4, latency=0.002) as sim:
+        report = await sim.benchmark(rounds=20, batch_size=5, ledgers=2)
+        print('\n' + str(report))
+        assert report.commits == 40
+        assert report.failures == 0
+        assert report.transactions == 200
+        assert report.commits_per_sec > 0
+        assert 0 < report.latency('propose') <= report.latency('total')
+        for p in sim.participants:
+            states = [ledger.root_hash for ledger in p.microledgers.instances.values()]
+            assert len(states) == 2
+            for ledger in p.microledgers.instances.values():
+                assert ledger.size == 101
+                assert ledger.uncommitted_size == ledger.size
+        leader_hashes = {ledger.name: ledger.root_hash for ledger in sim.leader.microledgers.instances.values()}
+        for p in sim.participants[1:]:
+            assert {ledger.name: ledger.root_hash for ledger in p.microledgers.instances.values()} == leader_hashes
+
+
+@pytest.mark.asyncio
+async def test_simulated_consensus_faults():
+    # Slow participant stretches rounds but they still succeed
+    async with ConsensusSimulator(participants=3, slowness={2: 0.01}) as sim:
+        report = await sim.benchmark(rounds=5)
+        assert report.commits == 5
+        assert report.latency('total') >= 0.03
+    # All messages are lost: rounds are terminated by timeout
+    async with ConsensusSimulator(participants=3, time_to_live=0.2, seed=1) as sim:
+        assert await sim.init_ledger('ledger')
+        sim.network.loss = 0.99
+        ledger = await sim.leader.microledgers.ledger('ledger')
+        state_machine = sim.leader.state_machine()
+        ok, _ = await sim.leader.run(state_machine.commit(ledger, sim.dids, [Transaction.create({'op': 'op'})]))
+        assert ok is False
+        assert state_machine.problem_report.problem_code == 'request_processing_error'
+        assert ledger.size == ledger.uncommitted_size == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('tracker, max_duration', [
+    (LatencyTracker(min_timeout=0.05), 1),
+    # opting in with default tracker is enough to terminate the stage long before time to live
+    (LatencyTracker(), 3 * LatencyTracker.DEF_MIN_TIMEOUT)
+])
+async def test_simulated_dead_participant(tracker: LatencyTracker, max_duration: float):
+    async with ConsensusSimulator(participants=3, latency=0.002, time_to_live=30, tracker=tracker) as sim:
+        report = await sim.benchmark(rounds=LatencyTracker.MIN_SAMPLES)
+        assert report.commits == LatencyTracker.MIN_SAMPLES
+        ledger = list(sim.leader.microledgers.instances.values())[0]
+        await sim.participants[2].stop()
+        state_machine = sim.leader.state_machine()
+        stamp = datetime.now()
+        ok, _ = await sim.leader.run(state_machine.commit(ledger, sim.dids, [Transaction.create({'op': 'op'})]))
+        assert ok is False
+        assert sim.participants[2].me.did in state_machine.problem_report.explain
+        # Dead participant is detected by observed latencies instead of time to live
+        assert (datetime.now() - stamp).total_seconds() < max_duration
@@ -1,11 +1,15 @@
 import uuid
 import asyncio
+from typing import List, Optional
+from datetime import datetime
 
 import pytest
 
 import sirius_sdk
 from sirius_sdk import Agent
 from sirius_sdk.agent.coprotocols import *
+from sirius_sdk.agent.connections import CoProtocolsMultiplexer
+from sirius_sdk.hub.latency import LatencyTracker
 from .conftest import get_pairwise
 from .helpers import run_coroutines
 from .helpers import ServerTestSuite
@@ -864,3 +868,237 @@ async def test_coprotocol_threaded_theirs_switch_timeout(
     stat1 = statuses[pw2]
     assert stat1[0] is False
     assert stat1[1] is None
+
+
+def test_latency_tracker():
+    tracker = LatencyTracker(min_timeout=0.1)
+    for n in range(LatencyTracker.MIN_SAMPLES - 1):
+        tracker.observe('fast', 0.01)
+        tracker.observe('slow', 0.2)
+    # Not enough observations
+    assert tracker.timeout(['fast', 'slow'], default=60) == 60
+    assert tracker.timeout(['fast']) is None
+    tracker.observe('fast', 0.01)
+    tracker.observe('slow', 0.2)
+    assert tracker.ewma('fast') == pytest.approx(0.01)
+    assert tracker.percentile('slow') == pytest.approx(0.2)
+    assert tracker.timeout(['fast']) == pytest.approx(0.1)
+    assert 0.4 <= tracker.timeout(['fast', 'slow']) < 1
+    assert tracker.timeout(['fast', 'slow'], default=0.3) == pytest.approx(0.3)
+    assert tracker.timeout(['fast', 'unknown'], default=60) == 60
+    # Timeouts back off the next stage timeout
+    tracker.observe_timeout('slow', 0.4)
+    assert tracker.timeout(['slow']) >= 1.6
+    tracker.forget('slow')
+    assert tracker.ewma('slow') is None
+    # Default lower bound: observations shorten caller's timeout, but not below the bound
+    tracker = LatencyTracker()
+    for n in range(LatencyTracker.MIN_SAMPLES):
+        tracker.observe('fast', 0.01)
+    assert tracker.timeout(['fast'], default=60) == LatencyTracker.DEF_MIN_TIMEOUT
+    assert tracker.timeout(['fast'], default=0.5) == 0.5
+    with pytest.raises(SiriusContextError):
+        LatencyTracker(min_timeout=None)
+
+
+class ScriptedTheirs(sirius_sdk.CoProtocolThreadedTheirs):
+
+    def __init__(self, theirs: List[Pairwise], delays: dict):
+        super().__init__('thread-id-' + uuid.uuid4().hex, theirs)
+        self.delays = delays
+        self.stage = 0
+        self.queue = asyncio.Queue()
+
+    async def send(self, message: Message):
+        self.stage += 1
+        loop = asyncio.get_event_loop()
+        for p2p in self.theirs:
+            response = Message({'@type': TEST_MSG_TYPES[1], 'stage': self.stage})
+            loop.call_later(self.delays[p2p.their.did], self.queue.put_nowait, (response, p2p.their.verkey))
+        return {p2p: (True, None) for p2p in self.theirs}
+
+    async def _read_message(self, timeout: float = None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None, None
+
+
+@pytest.mark.asyncio
+async def test_fan_out_coprotocol():
+    theirs = [
+        Pairwise(
+            me=Pairwise.Me(did='me', verkey='me_verkey'),
+            their=Pairwise.Their(did=did, label=did, endpoint='http://endpoint', verkey=did + '_verkey')
+        )
+        for did in ['fast', 'medium', 'slow']
+    ]
+    co = ScriptedTheirs(theirs, delays={'fast': 0.01, 'medium': 0.02, 'slow': 0.2})
+    request = Message({'@type': TEST_MSG_TYPES[0]})
+    # Responses are iterated as they arrive
+    arrived = [(p2p.their.did, response['stage']) async for p2p, response in co.responses(request)]
+    assert arrived == [('fast', 1), ('medium', 1), ('slow', 1)]
+    # Switch returns as soon as quorum is reached
+    stamp = datetime.now()
+    results = await co.switch(request, quorum=2)
+    assert (datetime.now() - stamp).total_seconds() < 0.1
+    assert [ok for ok, _ in results.values()] == [True, True, False]
+    # Late reply of the slow participant does not shift the next stage
+    results = await co.switch(request)
+    assert all(ok and response['stage'] == 3 for ok, response in results.values())
+    assert [(p2p.their.did, response['stage']) for p2p, response in co.late_responses] == [('slow', 2)]
+
+
+class RecordingRPC:
+
+    def __init__(self):
+        self.timeout = 30
+        self.calls = []
+        self.events = asyncio.Queue()
+        self.multiplexer = CoProtocolsMultiplexer(self)
+
+    async def send_message(self, message: Message, **kwargs):
+        self.calls.append(('send_message', kwargs.get('threads'), kwargs.get('stop_threads')))
+        response = {
+            'message': {'@type': TEST_MSG_TYPES[1], '@id': uuid.uuid4().hex, '~thread': message.get('~thread', {})}
+        }
+        if kwargs.get('coprotocol'):
+            return response
+        self.events.put_nowait(response)
+
+    async def read_protocol_message(self):
+        return await self.multiplexer.read(None, timeout=self.timeout)
+
+    async def _pump_protocol_channel(self, timeout: float, ready) -> Optional[Message]:
+        if ready():
+            return None
+        try:
+            return await asyncio.wait_for(self.events.get(), timeout)
+        except asyncio.TimeoutError:
+            raise SiriusTimeoutIO()
+
+    async def start_protocol_with_threading(self, thid: str, ttl: int = None):
+        self.calls.append(('start_protocol_with_threading', thid))
+
+    async def stop_protocol_with_threading(self, thid: str, off_response: bool = False):
+        self.calls.append(('stop_protocol_with_threading', thid))
+
+    async def start_protocol_with_threads(self, threads: List[str], ttl: int = None):
+        self.calls.append(('start_protocol_with_threads', threads))
+
+    async def stop_protocol_with_threads(self, threads: List[str], off_response: bool = False):
+        self.calls.append(('stop_protocol_with_threads', threads))
+
+
+@pytest.mark.asyncio
+async def test_please_ack_threads_in_send_request():
+    rpc = RecordingRPC()
+    pairwise = Pairwise(
+        me=Pairwise.Me(did='me', verkey='me_verkey'),
+        their=Pairwise.Their(did='their', label='their', endpoint='http://endpoint', verkey='their_verkey')
+    )
+    transport = ThreadBasedCoProtocolTransport('thread-id', pairwise, rpc)
+    await transport.start(time_to_live=30)
+    rpc.calls.clear()
+    for n in range(2):
+        request = Message({'@type': TEST_MSG_TYPES[0], '@id': 'ack-%d' % n, '~please_ack': {}})
+        ok, response = await transport.switch(request)
+        assert ok is True
+    # Ack threads are started by send request itself, switch does not wait for them to be stopped
+    assert [call for call in rpc.calls if call[0] == 'send_message'] == [
+        ('send_message', ['ack-0'], None),
+        ('send_message', ['ack-1'], None),
+    ]
+    await transport.stop()
+    stopped = [call for call in rpc.calls if call[0] == 'stop_protocol_with_threads']
+    assert ('stop_protocol_with_threads', ['ack-0']) in stopped
+    assert ('stop_protocol_with_threads', ['ack-1']) in stopped
+
+    # Error of the scheduled stop is raised by transport stop
+    async def failed_stop(threads: List[str], off_response: bool = False):
+        raise SiriusRPCError('stop failed')
+
+    rpc.stop_protocol_with_threads = failed_stop
+    await transport.start(time_to_live=30)
+    request = Message({'@type': TEST_MSG_TYPES[0], '@id': 'ack-2', '~please_ack': {}})
+    ok, response = await transport.switch(request)
+    assert ok is True
+    with pytest.raises(SiriusRPCError):
+        await transport.stop()
+
+
+def test_transport_services_shared():
+    rpc = RecordingRPC()
+    transport1 = ThreadBasedCoProtocolTransport('thread-1', None, rpc)
+    transport2 = PairwiseCoProtocolTransport(
+        Pairwise(
+            me=Pairwise.Me(did='me', verkey='me_verkey'),
+            their=Pairwise.Their(did='their', label='their', endpoint='http://endpoint', verkey='their_verkey')
+        ),
+        rpc
+    )
+    assert not hasattr(transport1, '__dict__')
+    # Services are built lazily once per RPC connection
+    assert getattr(rpc, 'coprotocol_services', None) is None
+    assert transport1.wallet is transport2.wallet
+    assert transport1.microledgers is transport2.microledgers
+    assert transport1.pairwise_list is transport2.pairwise_list
+    assert ThreadBasedCoProtocolTransport('thread-2', None, RecordingRPC()).wallet is not transport1.wallet
+
+
+@pytest.mark.asyncio
+async def test_coprotocols_multiplexer():
+    rpc = RecordingRPC()
+    transports = [
+        ThreadBasedCoProtocolTransport(
+            'thread-%d' % n,
+            Pairwise(
+                me=Pairwise.Me(did='me', verkey='me_verkey'),
+                their=Pairwise.Their(did='their', label='their', endpoint='http://endpoint', verkey='their-%d' % n)
+            ),
+            rpc
+        )
+        for n in range(3)
+    ]
+    # Threads of concurrently started transports are registered by single request
+    await asyncio.wait([transport.start(time_to_live=30) for transport in transports])
+    starts = [call for call in rpc.calls if call[0] == 'start_protocol_with_threads']
+    assert len(starts) == 1
+    assert set(starts[0][1]) == {'thread-0', 'thread-1', 'thread-2'}
+    assert set(rpc.multiplexer.threads) == {'thread-0', 'thread-1', 'thread-2'}
+    # Events are demultiplexed by thid and pthid, thread-less and unknown ones are kept aside
+    # even if they are sent by the counterparty of the subscriber
+    rpc.multiplexer.link('ack-0', 'thread-0')
+    for event in [
+        {'message': {'@type': TEST_MSG_TYPES[1], '@id': 'by-pthid', '~thread': {'thid': 'unknown', 'pthid': 'thread-1'}}},
+        {'message': {'@type': TEST_MSG_TYPES[1], '@id': 'thread-less'}, 'sender_verkey': 'their-0'},
+        {'message': {'@type': TEST_MSG_TYPES[1], '@id': 'unknown', '~thread': {'thid': 'unknown'}}, 'sender_verkey': 'their-0'},
+        {'message': {'@type': TEST_MSG_TYPES[1], '@id': 'by-link', '~thread': {'thid': 'ack-0'}}, 'sender_verkey': 'their-0'},
+        {'message': {'@type': TEST_MSG_TYPES[1], '@id': 'by-thid', '~thread': {'thid': 'thread-2'}}},
+    ]:
+        rpc.events.put_nowait(event)
+    message, sender_verkey, _ = await transports[2].get_one(timeout=1)
+    assert message.id == 'by-thid'
+    message, sender_verkey, _ = await transports[0].get_one(timeout=1)
+    assert message.id == 'by-link' and sender_verkey == 'their-0'
+    message, _, _ = await transports[1].get_one(timeout=1)
+    assert message.id == 'by-pthid'
+    event = await rpc.read_protocol_message()
+    assert event['message']['@id'] == 'thread-less'
+    event = await rpc.read_protocol_message()
+    assert event['message']['@id'] == 'unknown'
+    rpc.multiplexer.unlink(['ack-0'])
+    with pytest.raises(SiriusTimeoutIO):
+        await transports[0].get_one(timeout=0.1)
+    # Concurrent switches of the threads share channel
+    requests = [Message({'@type': TEST_MSG_TYPES[0], '@id': 'req-%d' % n}) for n in range(3)]
+    results = await asyncio.gather(*[transport.switch(req) for transport, req in zip(transports, requests)])
+    for n, (ok, response) in enumerate(results):
+        assert ok is True
+        assert response['~thread']['thid'] == 'thread-%d' % n
+    rpc.calls.clear()
+    await asyncio.wait([transport.stop() for transport in transports])
+    stops = [call for call in rpc.calls if call[0] == 'stop_protocol_with_threads' and call[1]]
+    assert len(stops) == 1
+    assert set(stops[0][1]) == {'thread-0', 'thread-1', 'thread-2'}
+    assert rpc.multiplexer.threads == []
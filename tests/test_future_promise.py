@@ -1,4 +1,5 @@
 import base64
+import asyncio
 import datetime
 
 import pytest
@@ -189,3 +190,41 @@ async def test_bytes_value(p2p: dict):
     assert ok is True
     actual = future.get_value()
     assert expected == actual
+
+
+@pytest.mark.asyncio
+async def test_concurrent_futures(p2p: dict):
+    agent_to_sdk = p2p['agent']['tunnel']
+    sdk_to_agent = p2p['sdk']['tunnel']
+
+    futures = [Future(tunnel=sdk_to_agent) for _ in range(5)]
+    waiters = [asyncio.ensure_future(future.wait(5)) for future in futures]
+    # Responses come in reversed order
+    for n, future in reversed(list(enumerate(futures))):
+        await agent_to_sdk.post(message=Message({
+            '@type': MSG_TYPE_FUTURE,
+            '@id': 'promise-message-id-%d' % n,
+            'is_tuple': False,
+            'is_bytes': False,
+            'value': n,
+            'exception': None,
+            '~thread': {
+                'thid': future.promise['id']
+            }
+        }))
+    assert await asyncio.gather(*waiters) == [True] * 5
+    assert [future.get_value() for future in futures] == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_futures_timeout(p2p: dict):
+    sdk_to_agent = p2p['sdk']['tunnel']
+
+    # Second waiter is blocked by the reader of the first one, but it must not overrun own timeout
+    reader = asyncio.ensure_future(Future(tunnel=sdk_to_agent).wait(3))
+    await asyncio.sleep(0.1)
+    stamp = datetime.datetime.now()
+    ok = await Future(tunnel=sdk_to_agent).wait(1)
+    assert ok is False
+    assert (datetime.datetime.now() - stamp).total_seconds() < 2
+    assert await reader is False
@@ -1,9 +1,19 @@
+import gc
 import asyncio
+import threading
 
 import pytest
 
 import sirius_sdk
 from sirius_sdk.hub import _current_hub
+from sirius_sdk.hub.core import Hub
+from sirius_sdk.hub import ShardedHub, ConsistentHashRing, WorkerLoops
+from sirius_sdk.hub.core import _bind_hub
+from sirius_sdk.encryption import P2PConnection
+from sirius_sdk.storages import InMemoryImmutableCollection
+from sirius_sdk.messaging import Message
+from sirius_sdk.agent.pairwise import Pairwise
+from sirius_sdk.errors.exceptions import SiriusConnectionClosed
 
 from .helpers import ServerTestSuite
 
@@ -61,3 +71,311 @@ async def test_aborting(test_suite: ServerTestSuite):
     assert id(agent1) != id(agent2)
     assert agent1 is not None
     assert agent2 is not None
+
+
+@pytest.mark.asyncio
+async def test_hub_connection_pool():
+    p2p = P2PConnection(my_keys=('verkey', 'sigkey'), their_verkey='their_verkey')
+    storage = InMemoryImmutableCollection()
+    anoncreds = object()
+    root = Hub('https://agent.example.com', b'credentials', p2p, storage=storage, anoncreds=anoncreds)
+    copies = [root.copy() for _ in range(10)]
+    other = Hub('https://agent.example.com', b'other-credentials', p2p)
+    for hub in [root] + copies:
+        assert hub._Hub__agent is root._Hub__agent
+        assert hub._Hub__storage is storage
+        assert hub._Hub__anoncreds is anoncreds
+    assert other._Hub__agent is not root._Hub__agent
+
+    # Connections are not shared across event loops
+    def copy_in_other_loop():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return root.copy()._Hub__agent
+        finally:
+            loop.close()
+
+    agent_of_other_loop = await asyncio.get_event_loop().run_in_executor(None, copy_in_other_loop)
+    assert agent_of_other_loop is not root._Hub__agent
+
+
+def test_hub_connection_pool_eviction():
+    p2p = P2PConnection(my_keys=('verkey', 'sigkey'), their_verkey='their_verkey')
+    pool = sirius_sdk.hub.core._pool
+    loops = [asyncio.new_event_loop() for _ in range(3)]
+    hubs = [Hub('https://evicted.example.com', b'credentials', p2p, loop=loop) for loop in loops]
+    copies = [Hub('https://evicted.example.com', b'credentials', p2p, loop=loop) for loop in loops]
+    for loop in loops:
+        loop.close()
+    assert all(pool.size(loop) == 1 for loop in loops)
+    # Connection is kept while any hub of the loop holds the lease
+    del hubs
+    gc.collect()
+    assert all(pool.size(loop) == 1 for loop in loops)
+    # Last lease evicts connection and event loop from pool
+    del copies
+    gc.collect()
+    assert all(pool.size(loop) == 0 for loop in loops)
+    assert not any(loop in pool._AgentPool__loops for loop in loops)
+
+
+class StubWallet:
+
+    def __init__(self):
+        self.did = object()
+
+
+class StubAgent:
+
+    def __init__(self):
+        self.is_open = False
+        self.opened = 0
+        self.wallet_requests = 0
+        self.__wallet = None
+
+    async def open(self):
+        self.is_open = True
+        self.opened += 1
+        self.__wallet = StubWallet()
+
+    async def close(self):
+        self.is_open = False
+
+    @property
+    def wallet(self):
+        self.wallet_requests += 1
+        return self.__wallet
+
+
+@pytest.mark.asyncio
+async def test_hub_services_cache():
+    p2p = P2PConnection(my_keys=('verkey', 'sigkey'), their_verkey='their_verkey')
+    hub = Hub('https://cached.example.com', b'credentials', p2p)
+    agent = StubAgent()
+    hub._Hub__lease.agent = agent
+    did1 = await hub.get_did()
+    for _ in range(10):
+        assert await hub.get_did() is did1
+    assert agent.opened == 1
+    assert agent.wallet_requests == 1
+    # Services of the previous connection are not used after reconnect
+    agent.is_open = False
+    did2 = await hub.get_did()
+    assert did2 is not did1
+    assert agent.opened == 2
+    assert await hub.copy().get_did() is did2
+    await hub.abort()
+    assert hub._Hub__lease.agent is not agent
+    assert hub._Hub__services == {}
+
+
+class EchoAgentRPC:
+    """Connection that answers co-protocol requests on the channel they were sent by, with a delay of the request"""
+
+    opened = []
+
+    def __init__(self):
+        self.is_open = True
+        self.timeout = 30
+        self.endpoints = []
+        self.networks = []
+        self.events = asyncio.Queue()
+        self.closed = asyncio.Event()
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        inst = cls()
+        cls.opened.append(inst)
+        return inst
+
+    async def close(self):
+        self.is_open = False
+        self.closed.set()
+
+    async def start_protocol_for_p2p(self, *args, **kwargs):
+        pass
+
+    async def stop_protocol_for_p2p(self, *args, **kwargs):
+        pass
+
+    async def send_message(self, message: Message, **kwargs):
+        async def reply():
+            await asyncio.sleep(message['delay'])
+            self.events.put_nowait({'message': {'@type': message.type, 'echo': message.id}})
+        asyncio.ensure_future(reply())
+
+    async def read_protocol_message(self):
+        get = asyncio.ensure_future(self.events.get())
+        closed = asyncio.ensure_future(self.closed.wait())
+        await asyncio.wait([get, closed], return_when=asyncio.FIRST_COMPLETED)
+        closed.cancel()
+        if not get.done():
+            get.cancel()
+            raise SiriusConnectionClosed()
+        return get.result()
+
+
+@pytest.mark.asyncio
+async def test_hub_pairwise_coprotocols_of_contexts(monkeypatch):
+    monkeypatch.setattr('sirius_sdk.agent.agent.AgentRPC', EchoAgentRPC)
+    EchoAgentRPC.opened = []
+    p2p = P2PConnection(my_keys=('verkey', 'sigkey'), their_verkey='their_verkey')
+    root = Hub('https://echo.example.com', b'credentials', p2p)
+    hubs = [root.copy(), root.copy()]
+    pairwise = Pairwise(
+        me=Pairwise.Me(did='me', verkey='me_verkey'),
+        their=Pairwise.Their(did='their', label='their', endpoint='http://endpoint', verkey='their_verkey')
+    )
+
+    async def run_coprotocol(hub: Hub, delay: float):
+        async with hub.get_agent_connection_lazy() as agent:
+            transport = await agent.spawn(pairwise)
+        await transport.start(['test_protocol'])
+        request = Message({'@type': 'https://didcomm.org/test_protocol/1.0/request', 'delay': delay})
+        ok, response = await transport.switch(request)
+        assert ok is True
+        return request.id, response['echo']
+
+    # The first request is answered last: with shared channel it would read the reply of the other context
+    results = await asyncio.gather(run_coprotocol(hubs[0], 0.2), run_coprotocol(hubs[1], 0.05))
+    for request_id, echo in results:
+        assert echo == request_id
+    # RPC connection is shared, co-protocols channels are owned by contexts
+    assert hubs[0]._Hub__agent is hubs[1]._Hub__agent
+    shared = EchoAgentRPC.opened[0]
+    assert len(EchoAgentRPC.opened) == 3
+
+    # Aborting interrupts co-protocol of the context but keeps connection of others alive
+    async with hubs[0].get_agent_connection_lazy() as agent:
+        transport = await agent.spawn(pairwise)
+    await transport.start(['test_protocol'])
+    reading = asyncio.ensure_future(transport.get_one())
+    await asyncio.sleep(0.1)
+    await hubs[0].abort()
+    with pytest.raises(SiriusConnectionClosed):
+        await asyncio.wait_for(reading, 1)
+    assert shared.is_open
+    assert await run_coprotocol(hubs[1], 0) is not None
+    for hub in hubs + [root]:
+        await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_sharded_hub_bind_coprotocols(monkeypatch):
+    monkeypatch.setattr('sirius_sdk.agent.agent.AgentRPC', EchoAgentRPC)
+    EchoAgentRPC.opened = []
+    p2p = P2PConnection(my_keys=('verkey', 'sigkey'), their_verkey='their_verkey')
+    shard = Hub('https://echo.example.com', b'credentials', p2p)
+    sharded = ShardedHub({'shard': shard})
+    pairwise = Pairwise(
+        me=Pairwise.Me(did='me', verkey='me_verkey'),
+        their=Pairwise.Their(did='their', label='their', endpoint='http://endpoint', verkey='their_verkey')
+    )
+
+    async def run_coprotocol(delay: float):
+        async with sharded.bind(pairwise.their.did) as hub:
+            async with hub.get_agent_connection_lazy() as agent:
+                transport = await agent.spawn(pairwise)
+            await transport.start(['test_protocol'])
+            request = Message({'@type': 'https://didcomm.org/test_protocol/1.0/request', 'delay': delay})
+            ok, response = await transport.switch(request)
+            assert ok is True
+            return hub, request.id, response['echo']
+
+    # Both contexts are routed to the same shard but read replies by own channels
+    results = await asyncio.gather(run_coprotocol(0.2), run_coprotocol(0.05))
+    for _, request_id, echo in results:
+        assert echo == request_id
+    assert results[0][0] is not results[1][0]
+    assert all(hub._Hub__agent is shard._Hub__agent for hub, _, _ in results)
+    # Channels of the contexts are closed on exit, shared connection is kept alive
+    assert len(EchoAgentRPC.opened) == 3
+    assert all(not rpc.is_open for rpc in EchoAgentRPC.opened[1:])
+    assert EchoAgentRPC.opened[0].is_open
+    await sharded.close()
+
+
+def test_consistent_hash_ring():
+    ring = ConsistentHashRing(['shard-1', 'shard-2', 'shard-3'])
+    keys = ['did:%d' % n for n in range(3000)]
+    placement = {key: ring.node_for(key) for key in keys}
+    counts = {node: list(placement.values()).count(node) for node in ring.nodes}
+    assert min(counts.values()) > 500
+    # Only keys of the removed node are remapped
+    ring.remove('shard-2')
+    for key, node in placement.items():
+        if node != 'shard-2':
+            assert ring.node_for(key) == node
+        else:
+            assert ring.node_for(key) in ['shard-1', 'shard-3']
+    ring.add('shard-2')
+    assert all(ring.node_for(key) == node for key, node in placement.items())
+
+
+class StubShard:
+
+    def __init__(self, name: str, source=None):
+        self.name = name
+        self.source = source
+        self.closed = False
+
+    def copy(self):
+        return StubShard(self.name, source=self)
+
+    async def close(self):
+        self.closed = True
+
+    async def get_did(self):
+        return self.name
+
+
+@pytest.mark.asyncio
+async def test_sharded_hub():
+    shards = {name: StubShard(name) for name in ['a', 'b', 'c']}
+    sharded = ShardedHub(shards)
+    key = 'did:sov:123'
+    assert await sharded.get_did(key) == sharded.shard_name(key)
+    async with sharded.bind(key) as hub:
+        # context is served by own copy of the shard hub
+        assert _current_hub() is hub
+        assert hub.source is shards[sharded.shard_name(key)]
+    assert hub.closed
+
+    async def current(hub, *args):
+        await asyncio.sleep(0)
+        assert hub is _current_hub() and hub.source is not None
+        return _current_hub().name, args
+
+    results = await sharded.fan_out(current)
+    assert {name: result[0] for name, result in results.items()} == {'a': 'a', 'b': 'b', 'c': 'c'}
+    keys = ['key-%d' % n for n in range(100)]
+    results = await sharded.map(keys, current)
+    routed = []
+    for name, (current_name, args) in results.items():
+        assert current_name == name
+        assert all(sharded.shard_name(key) == name for key in args[0])
+        routed.extend(args[0])
+    assert sorted(routed) == sorted(keys)
+
+
+@pytest.mark.asyncio
+async def test_worker_loops():
+    p2p = P2PConnection(my_keys=('verkey', 'sigkey'), their_verkey='their_verkey')
+    hub = Hub('https://workers.example.com', b'credentials', p2p)
+
+    async def hub_of_worker():
+        # Hub propagated from other loop is rebound to the loop of the worker
+        with _bind_hub(hub):
+            inst = _current_hub()
+            return threading.current_thread().name, inst.loop is asyncio.get_event_loop(), inst._Hub__agent
+
+    with WorkerLoops(count=2) as workers:
+        assert len(workers.loops) == 2
+        results = await asyncio.gather(*[workers.run(hub_of_worker) for _ in range(4)])
+    assert {name for name, _, _ in results} == {'sirius-worker-0', 'sirius-worker-1'}
+    assert all(rebound for _, rebound, _ in results)
+    agents = {id(agent) for _, _, agent in results}
+    assert len(agents) == 2
+    assert id(hub._Hub__agent) not in agents
+    assert workers.is_running is False
@@ -1,10 +1,20 @@
+import os
+import json
 import uuid
+import tempfile
 from datetime import datetime
 
 import pytest
 
 from sirius_sdk import Agent
-from sirius_sdk.agent.microledgers import Transaction, LedgerMeta
+from sirius_sdk.errors.exceptions import SiriusContextError, SiriusPromiseContextException
+from sirius_sdk.agent.connections import AgentRPC
+from sirius_sdk.messaging import restore_message_instance
+from sirius_sdk.agent.consensus.simple.messages import ProposeTransactionsMessage
+from sirius_sdk.agent import merkle
+from sirius_sdk.agent.local_microledgers import FileMicroledgerList, InMemoryMicroledgerList
+from sirius_sdk.agent.microledgers import Microledger, MicroledgerList, Transaction, LedgerMeta, TransactionsCache, MerkleInfo, AuditProof, \
+    serialize_ordering, calc_leaf_hash
 
 
 @pytest.mark.asyncio
@@ -245,6 +255,55 @@ async def test_get_all_txns(agent4: Agent, ledger_name: str):
         await agent4.close()
 
 
+@pytest.mark.asyncio
+async def test_iter_transactions(agent4: Agent, ledger_name: str):
+    await agent4.open()
+    try:
+        genesis_txns = [
+            {"reqId": n, "identifier": "5rArie7XKukPCaEwq5XGQJnM9Fc5aZE3M9HAPVfMU2xC", "op": "op%d" % n}
+            for n in range(1, 11)
+        ]
+        ledger, _ = await agent4.microledgers.create(ledger_name, genesis_txns)
+        txns = [
+            {"reqId": 11, "identifier": "2btLJAAb1S3x6hZYdVyAePjqtQYi2ZBSRGy4569RZu8h", "op": "op11"},
+            {"reqId": 12, "identifier": "CECeGXDi6EHuhpwz19uyjjEnsRGNXodFYqCRgdLmLRkt", "op": "op12"},
+        ]
+        await ledger.append(txns)
+
+        committed = [txn async for txn in ledger.iter_transactions(page_size=3)]
+        assert [txn['op'] for txn in committed] == ['op%d' % n for n in range(1, 11)]
+        assert all([isinstance(txn, Transaction) for txn in committed])
+
+        partial = [txn async for txn in ledger.iter_transactions(start=4, end=8, page_size=2, read_ahead=True)]
+        assert [txn['op'] for txn in partial] == ['op%d' % n for n in range(4, 9)]
+
+        uncommitted = [txn async for txn in ledger.iter_transactions(uncommitted=True)]
+        assert [txn['op'] for txn in uncommitted] == ['op11', 'op12']
+    finally:
+        await agent4.close()
+
+
+@pytest.mark.asyncio
+async def test_load_many(agent4: Agent, ledger_name: str):
+    await agent4.open()
+    try:
+        names = ['%s_%d' % (ledger_name, n) for n in range(3)]
+        for n, name in enumerate(names):
+            ledger, _ = await agent4.microledgers.create(name, [{"reqId": 1, "op": "op1"}])
+            await ledger.append([{"reqId": i, "op": "op%d" % i} for i in range(2, n + 2)])
+        agent4.microledgers.instances.clear()
+        ledgers = await agent4.microledgers.load_many(names)
+        assert [ledger.name for ledger in ledgers] == names
+        assert [ledger.uncommitted_size for ledger in ledgers] == [1, 2, 3]
+        assert all(agent4.microledgers.instances[name] is ledger for name, ledger in zip(names, ledgers))
+        with pytest.raises(SiriusContextError):
+            await agent4.microledgers.load_many(names + [uuid.uuid4().hex])
+        ledgers = await agent4.microledgers.reload_all()
+        assert set(names).issubset(set(ledger.name for ledger in ledgers))
+    finally:
+        await agent4.close()
+
+
 @pytest.mark.asyncio
 async def test_audit_proof(agent4: Agent, ledger_name: str):
     await agent4.open()
@@ -320,3 +379,358 @@ async def test_rename(agent4: Agent, ledger_name: str):
         assert is_exists2 is True
     finally:
         await agent4.close()
+
+
+def test_transaction_serialization_cache():
+    def expected(value) -> bytes:
+        return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode()
+
+    txn = Transaction({"reqId": 1, "identifier": "5rArie7XKukPCaEwq5XGQJnM9Fc5aZE3M9HAPVfMU2xC", "op": {"args": [1]}})
+    serialized = txn.serialize()
+    assert serialized == expected(txn)
+    assert txn.serialize() is serialized
+    digest = txn.digest()
+
+    # nested mutation invalidates memoized values
+    txn['op']['args'].append(2)
+    txn['txnMetadata']['seqNo'] = 1
+    assert txn.serialize() == expected(txn)
+    assert txn.digest() != digest
+
+    # copies keep memoized values but are tracked independently
+    copy = Transaction(txn)
+    assert copy.serialize() is txn.serialize()
+    copy['op'] = 'op2'
+    assert copy.serialize() == expected(copy)
+    assert txn.serialize() == expected(txn)
+
+    ledger = {'name': 'ledger', 'genesis': [txn, copy], 'root_hash': 'xxx'}
+    assert serialize_ordering(ledger) == expected(ledger)
+
+    # nested containers of the caller are not copied on construction, they are shared until serialization
+    inner = {'a': 1, 'args': [{'b': 2}]}
+    txn = Transaction({'op': inner})
+    inner['a'] = 2
+    assert txn['op']['a'] == 2
+    serialized = txn.serialize()
+    inner['a'] = 3
+    inner['args'][0]['b'] = 3
+    assert txn.serialize() is serialized
+    assert txn['op'] == {'a': 2, 'args': [{'b': 2}]}
+    txn['op']['args'][0]['b'] = 4
+    assert txn.serialize() == expected(txn)
+
+
+def test_transactions_message_memo():
+    txn = {'reqId': 1, 'op': {'args': [1]}, 'txnMetadata': {'seqNo': 1}}
+    ok, message = restore_message_instance(json.loads(json.dumps(ProposeTransactionsMessage(transactions=[txn]))))
+    assert ok and isinstance(message, ProposeTransactionsMessage)
+    first = message.transactions[0]
+    serialized = first.serialize()
+    # transactions are restored once, memoized serialization is reused by the next stages
+    assert message.transactions[0].serialize() is serialized
+
+
+def test_transactions_cache():
+    cache = TransactionsCache(max_size=2)
+    for seq_no in [1, 2, 3]:
+        cache.put(seq_no, Transaction({"reqId": seq_no, "op": "op%d" % seq_no, "txnMetadata": {"seqNo": seq_no}}))
+    assert len(cache) == 2
+    assert cache.get(1) is None
+    txn = cache.get(2)
+    assert txn['op'] == 'op2'
+    # Cached value can't be corrupted by caller
+    txn['op'] = 'corrupted'
+    assert cache.get(2)['op'] == 'op2'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = TransactionsCache(max_size=1, spill_path=os.path.join(tmp_dir, 'spill'))
+        for seq_no in [1, 2, 3]:
+            cache.put(seq_no, Transaction({"reqId": seq_no, "op": "op%d" % seq_no}))
+        assert len(cache) == 1
+        assert all(cache.get(seq_no)['op'] == 'op%d' % seq_no for seq_no in [1, 2, 3])
+        cache.clear()
+        assert all(cache.get(seq_no) is None for seq_no in [1, 2, 3])
+        del cache
+
+        # Caches sharing spill directory don't interfere, spill files are removed on close
+        cache1 = TransactionsCache(max_size=1, spill_dir=tmp_dir)
+        cache2 = TransactionsCache(max_size=1, spill_dir=tmp_dir)
+        assert cache1.spill_path != cache2.spill_path
+        for seq_no in [1, 2]:
+            cache1.put(seq_no, Transaction({"reqId": seq_no, "op": "op%d" % seq_no}))
+        cache2.put(1, Transaction({"reqId": 1, "op": "other"}))
+        assert cache1.get(1)['op'] == 'op1'
+        cache1.close()
+        cache2.close()
+        assert [name for name in os.listdir(tmp_dir) if name.startswith('txns-')] == []
+
+
+def test_merkle_local_verification():
+    ops = [
+        ("5rArie7XKukPCaEwq5XGQJnM9Fc5aZE3M9HAPVfMU2xC", "op1"),
+        ("2btLJAAb1S3x6hZYdVyAePjqtQYi2ZBSRGy4569RZu8h", "op2"),
+        ("CECeGXDi6EHuhpwz19uyjjEnsRGNXodFYqCRgdLmLRkt", "op3"),
+        ("2btLJAAb1S3x6hZYdVyAePjqtQYi2ZBSRGy4569RZu8h", "op4"),
+        ("CECeGXDi6EHuhpwz19uyjjEnsRGNXodFYqCRgdLmLRkt", "op5"),
+    ]
+    txns = [
+        Transaction({"reqId": n, "identifier": identifier, "op": op, "txnMetadata": {"seqNo": n}})
+        for n, (identifier, op) in enumerate(ops, start=1)
+    ]
+    leaves = [calc_leaf_hash(txn) for txn in txns]
+    assert leaves[0] == merkle.leaf_hash(txns[0].serialize())
+    # bytes are serialized transaction for both APIs
+    assert calc_leaf_hash(txns[0].serialize()) == leaves[0]
+    # Values are calculated by Agent: see test_init_ledger and test_merkle_info
+    assert merkle.to_b58(merkle.root_hash(leaves[:3])) == '3u8ZCezSXJq72H5CdEryyTuwAKzeZnCZyfftJVFr7y8U'
+    info = MerkleInfo(
+        'CwX1TRYKpejHmdnx3gMgHtSioDzhDGTASAD145kjyyRh',
+        ['46kxvYf7RjRERXdS56vUpFCzm2A3qRYSLaRr6tVT6tSd', '3sgNJmsXpmin7P5C6jpHiqYfeWwej5L6uYdYoXTMc1XQ']
+    )
+    assert merkle.to_b58(merkle.audit_path(3, leaves[:4])) == info.audit_path
+    assert info.verify(txns[3], 4)
+    assert info.verify(txns[3].serialize(), 4)
+    assert not info.verify(txns[2], 4)
+    assert not info.verify(txns[3], 3)
+
+    root = merkle.to_b58(merkle.root_hash(leaves))
+    proofs = [AuditProof(root, merkle.to_b58(merkle.audit_path(i, leaves)), len(leaves)) for i in range(len(leaves))]
+    assert all(proof.verify(txn, n) for n, (txn, proof) in enumerate(zip(txns, proofs), start=1))
+    items = [(leaf, n, len(leaves), proofs[n-1].audit_path, root) for n, leaf in enumerate(leaves, start=1)]
+    items.append((leaves[0], 2, len(leaves), proofs[0].audit_path, root))
+    assert merkle.verify_many(items) == [True] * len(leaves) + [False]
+
+    for second in range(1, 12):
+        tree = [merkle.leaf_hash(b'%d' % i) for i in range(second)]
+        for first in range(1, second + 1):
+            proof = merkle.consistency_proof(first, tree)
+            first_root, second_root = merkle.root_hash(tree[:first]), merkle.root_hash(tree)
+            assert merkle.verify_consistency(first, second, first_root, second_root, proof)
+            if first < second:
+                assert not merkle.verify_consistency(first, second, second_root, second_root, proof)
+        for i in range(second):
+            assert merkle.verify_audit_path(tree[i], i + 1, second, merkle.audit_path(i, tree), merkle.root_hash(tree))
+
+
+@pytest.mark.asyncio
+async def test_file_microledger():
+    genesis_txns = [
+        {"reqId": 1, "identifier": "5rArie7XKukPCaEwq5XGQJnM9Fc5aZE3M9HAPVfMU2xC", "op": "op1"},
+        {"reqId": 2, "identifier": "2btLJAAb1S3x6hZYdVyAePjqtQYi2ZBSRGy4569RZu8h", "op": "op2"},
+        {"reqId": 3, "identifier": "CECeGXDi6EHuhpwz19uyjjEnsRGNXodFYqCRgdLmLRkt", "op": "op3"}
+    ]
+    txns = [
+        {"reqId": 4, "identifier": "2btLJAAb1S3x6hZYdVyAePjqtQYi2ZBSRGy4569RZu8h", "op": "op4"},
+        {"reqId": 5, "identifier": "CECeGXDi6EHuhpwz19uyjjEnsRGNXodFYqCRgdLmLRkt", "op": "op5"},
+        {"reqId": 6, "identifier": "CECeGXDi6EHuhpwz19uyjjEnsRGNXodFYqCRgdLmLRkt", "op": "op6"},
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ledgers = FileMicroledgerList(tmp_dir)
+        ledger, genesis = await ledgers.create('ledger', genesis_txns)
+        # Same root hash as Agent calculates: see test_init_ledger
+        assert ledger.root_hash == '3u8ZCezSXJq72H5CdEryyTuwAKzeZnCZyfftJVFr7y8U'
+        assert [txn['txnMetadata']['seqNo'] for txn in genesis] == [1, 2, 3]
+
+        txn_time = str(datetime.now())
+        start, end, appended = await ledger.append(txns, txn_time)
+        assert (start, end) == (4, 6)
+        assert all(txn['txnMetadata']['txnTime'] == txn_time for txn in appended)
+        assert ledger.size == 3 and ledger.uncommitted_size == 6
+        assert ledger.uncommitted_root_hash != ledger.root_hash
+        assert 'op5' in str(await ledger.get_uncommitted_transaction(5))
+        assert 'op6' in str(await ledger.get_last_transaction())
+
+        start, end, committed = await ledger.commit(1)
+        assert (start, end) == (4, 4) and committed == appended[:1]
+        await ledger.discard(1)
+        assert ledger.size == 4 and ledger.uncommitted_size == 5
+        assert [txn['op'] for txn in await ledger.get_uncommitted_transactions()] == ['op5']
+
+        for seq_no in range(1, 5):
+            txn = await ledger.get_transaction(seq_no)
+            assert (await ledger.audit_proof(seq_no)).verify(txn, seq_no)
+            assert (await ledger.merkle_info(seq_no)).verify(txn, seq_no)
+        root_hash, uncommitted_root_hash = ledger.root_hash, ledger.uncommitted_root_hash
+        assert merkle.verify_consistency(
+            3, 5, '3u8ZCezSXJq72H5CdEryyTuwAKzeZnCZyfftJVFr7y8U', uncommitted_root_hash, ledger.consistency_proof(3)
+        )
+
+        # State survives reopening
+        ledgers.close()
+        ledgers = FileMicroledgerList(tmp_dir)
+        ledger = await ledgers.ledger('ledger')
+        assert (ledger.size, ledger.uncommitted_size) == (4, 5)
+        assert (ledger.root_hash, ledger.uncommitted_root_hash) == (root_hash, uncommitted_root_hash)
+        assert [txn['op'] async for txn in ledger.iter_transactions(page_size=3)] == ['op1', 'op2', 'op3', 'op4']
+        await ledger.reset_uncommitted()
+        assert ledger.uncommitted_root_hash == ledger.root_hash
+
+        await ledger.rename('ledger2')
+        assert not await ledgers.is_exists('ledger')
+        assert (await ledgers.ledger('ledger2')) is ledger
+        assert [meta.name for meta in await ledgers.list()] == ['ledger2']
+        await ledgers.reset('ledger2')
+        assert await ledgers.list() == []
+        ledgers.close()
+
+
+@pytest.mark.asyncio
+async def test_inmemory_microledger():
+    ledgers = InMemoryMicroledgerList()
+    ledger, _ = await ledgers.create('ledger', [{"reqId": 1, "op": "op1"}])
+    expected_leaves = [calc_leaf_hash(txn) for txn in await ledger.get_all_transactions()]
+    for n in range(2, 40):
+        start, end, txns = await ledger.append([{"reqId": n, "op": "op%d" % n}])
+        assert start == end == n
+        expected_leaves.append(calc_leaf_hash(txns[0]))
+        assert ledger.uncommitted_root_hash == merkle.to_b58(merkle.root_hash(expected_leaves))
+        assert ledger.root_hash == merkle.to_b58(merkle.root_hash(expected_leaves[:ledger.size]))
+        if n % 3 == 0:
+            await ledger.commit(2)
+            assert ledger.root_hash == merkle.to_b58(merkle.root_hash(expected_leaves[:ledger.size]))
+    assert (ledger.size, ledger.uncommitted_size) == (27, 39)
+    await ledger.discard(5)
+    assert ledger.uncommitted_root_hash == merkle.to_b58(merkle.root_hash(expected_leaves[:34]))
+    await ledger.reset_uncommitted()
+    assert ledger.uncommitted_root_hash == ledger.root_hash
+    txn = await ledger.get_transaction(1)
+    assert await ledgers.leaf_hash(txn) == await ledgers.leaf_hash(txn.serialize()) == expected_leaves[0]
+    # Returned transactions are copies
+    txn = await ledger.get_transaction(1)
+    txn['op'] = 'corrupted'
+    assert (await ledger.get_transaction(1))['op'] == 'op1'
+
+    await ledger.rename('ledger2')
+    assert await ledgers.is_exists('ledger2') and not await ledgers.is_exists('ledger')
+    assert [meta.name for meta in await ledgers.list()] == ['ledger2']
+    await ledgers.reset('ledger2')
+    assert await ledgers.list() == []
+
+
+@pytest.mark.asyncio
+async def test_inmemory_load_many():
+    ledgers = InMemoryMicroledgerList()
+    for name in ['a', 'b', 'c']:
+        await ledgers.create(name, [{"reqId": 1, "op": name}])
+    loaded = await ledgers.load_many(['c', 'a'])
+    assert [ledger.name for ledger in loaded] == ['c', 'a']
+    assert sorted(ledger.name for ledger in await ledgers.reload_all()) == ['a', 'b', 'c']
+    with pytest.raises(SiriusContextError):
+        await ledgers.load_many(['d'])
+
+
+class ScriptedAgentRPC:
+    """Agent connection answering microledgers calls with prepared handlers"""
+
+    is_unknown_message_type_error = staticmethod(AgentRPC.is_unknown_message_type_error)
+
+    def __init__(self, handlers: dict):
+        self.handlers = handlers
+        self.calls = []
+        self.unsupported = set()
+
+    def is_feature_supported(self, feature: str) -> bool:
+        return feature not in self.unsupported
+
+    def mark_feature_unsupported(self, feature: str):
+        self.unsupported.add(feature)
+
+    async def remote_call(self, msg_type: str, params: dict = None, **kwargs):
+        name = msg_type.split('/')[-1]
+        self.calls.append(name)
+        handler = self.handlers[name]
+        if isinstance(handler, Exception):
+            raise handler
+        return handler(params)
+
+
+def scripted_state(size: int, uncommitted_size: int) -> dict:
+    return {
+        'name': 'ledger', 'seqNo': size, 'size': size, 'uncommitted_size': uncommitted_size,
+        'root_hash': 'root-%d' % size, 'uncommitted_root_hash': 'root-%d' % uncommitted_size
+    }
+
+
+def scripted_append(params: dict):
+    txns = [dict(txn, txnMetadata={'seqNo': n}) for n, txn in enumerate(params['txns'], start=2)]
+    return scripted_state(1, 1 + len(txns)), 2, 1 + len(txns), txns
+
+
+@pytest.mark.asyncio
+async def test_microledger_append_single_call():
+    api = ScriptedAgentRPC({'append_txns_with_metadata': scripted_append})
+    ledger = Microledger('ledger', api)
+    start, end, txns = await ledger.append([{"reqId": 1, "op": "op1"}, {"reqId": 2, "op": "op2"}])
+    assert (start, end) == (2, 3)
+    assert [txn['txnMetadata']['seqNo'] for txn in txns] == [2, 3]
+    assert ledger.uncommitted_size == 3
+    assert api.calls == ['append_txns_with_metadata']
+
+
+@pytest.mark.asyncio
+async def test_microledger_append_fallback():
+    unknown = SiriusPromiseContextException('RuntimeError', 'Unknown message type "append_txns_with_metadata"')
+    api = ScriptedAgentRPC({
+        'append_txns_with_metadata': unknown,
+        'append_txns_metadata': lambda params: params['txns'],
+        'append_txns': scripted_append
+    })
+    ledger = Microledger('ledger', api)
+    start, end, _ = await ledger.append([{"reqId": 1, "op": "op1"}])
+    assert (start, end) == (2, 2)
+    assert api.calls == ['append_txns_with_metadata', 'append_txns_metadata', 'append_txns']
+    # Outdated agent is remembered
+    api.calls.clear()
+    await ledger.append([{"reqId": 2, "op": "op2"}])
+    assert api.calls == ['append_txns_metadata', 'append_txns']
+
+    # Failed append is not re-submitted and connection is not downgraded
+    api = ScriptedAgentRPC({'append_txns_with_metadata': SiriusPromiseContextException('IOError', 'Timeout')})
+    ledger = Microledger('ledger', api)
+    with pytest.raises(SiriusPromiseContextException):
+        await ledger.append([{"reqId": 1, "op": "op1"}])
+    assert api.calls == ['append_txns_with_metadata']
+    assert api.unsupported == set()
+
+
+@pytest.mark.asyncio
+async def test_microledger_list_cache_opt_in():
+    api = ScriptedAgentRPC({
+        'is_exists': lambda params: True,
+        'get_last_committed_txn': lambda params: {"reqId": 1, "op": "op%d" % len(api.calls), "txnMetadata": {"seqNo": 1}}
+    })
+    ledger = await MicroledgerList(api).ledger('ledger')
+    assert ledger.cache is None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ledgers = MicroledgerList(api, cache_size=10, spill_dir=tmp_dir)
+        ledger = await ledgers.ledger('ledger')
+        ledger._assign_state(scripted_state(1, 1))
+        assert ledger.cache is not None
+        # Last committed transaction is not served from cache since state may be stale
+        txn1 = await ledger.get_last_committed_transaction()
+        txn2 = await ledger.get_last_committed_transaction()
+        assert txn1['op'] != txn2['op']
+        ledgers.close()
+        assert os.listdir(tmp_dir) == []
+
+
+@pytest.mark.asyncio
+async def test_microledger_txns_range_fallback():
+    unknown = SiriusPromiseContextException('RuntimeError', 'Unknown message type "get_txns_range"')
+    api = ScriptedAgentRPC({
+        'get_txns_range': unknown,
+        'get_by_seq_no': lambda params: {"reqId": params['seqNo'], "txnMetadata": {"seqNo": params['seqNo']}}
+    })
+    ledger = Microledger('ledger', api)
+    ledger._assign_state(scripted_state(3, 3))
+    txns = [txn async for txn in ledger.iter_transactions()]
+    assert [txn['reqId'] for txn in txns] == [1, 2, 3]
+    assert api.calls[0] == 'get_txns_range' and api.calls.count('get_txns_range') == 1
+
+    api = ScriptedAgentRPC({'get_txns_range': SiriusPromiseContextException('IOError', 'Timeout')})
+    ledger = Microledger('ledger', api)
+    ledger._assign_state(scripted_state(3, 3))
+    with pytest.raises(SiriusPromiseContextException):
+        _ = [txn async for txn in ledger.iter_transactions()]
+    assert api.unsupported == set()
@@ -1,9 +1,17 @@
+import json
 import uuid
+import asyncio
+from typing import List, Any
 from datetime import datetime
 
 import pytest
 
 from sirius_sdk import Agent, Pairwise
+from sirius_sdk.agent.pairwise import WalletPairwiseList, CachedPairwiseList
+from sirius_sdk.agent.wallet.abstract.pairwise import AbstractPairwise
+from sirius_sdk.agent.wallet.impl.pairwise import PairwiseProxy
+from sirius_sdk.agent.connections import AgentRPC
+from sirius_sdk.errors.exceptions import SiriusPromiseContextException
 
 
 @pytest.mark.asyncio
@@ -36,3 +44,314 @@ async def test_pairwise_list(agent1: Agent, agent2: Agent):
     finally:
         await agent1.close()
         await agent2.close()
+
+
+class InMemoryPairwiseAPI(AbstractPairwise):
+
+    def __init__(self, count: int):
+        self.items = [
+            {'metadata': WalletPairwiseList._build_metadata(
+                Pairwise(
+                    me=Pairwise.Me(did='my-did', verkey='my-verkey'),
+                    their=Pairwise.Their(
+                        did='their-did-%d' % n, label='Their %d' % n, endpoint='http://endpoint', verkey='vk-%d' % n
+                    )
+                )
+            )}
+            for n in range(count)
+        ]
+        self.pages = []
+
+    async def is_pairwise_exists(self, their_did: str) -> bool:
+        return any(item['metadata']['their']['did'] == their_did for item in self.items)
+
+    async def create_pairwise(self, their_did: str, my_did: str, metadata: dict = None, tags: dict = None) -> None:
+        self.items.append({'metadata': metadata})
+
+    async def list_pairwise(self) -> List[Any]:
+        raise AssertionError('Whole list must not be loaded')
+
+    async def list_pairwise_page(self, offset: int, limit: int) -> (List[Any], int):
+        self.pages.append(offset)
+        await asyncio.sleep(0)
+        return self.items[offset:offset+limit], len(self.items)
+
+    async def get_pairwise(self, their_did: str):
+        pass
+
+    async def set_pairwise_metadata(self, their_did: str, metadata: dict = None, tags: dict = None) -> None:
+        pass
+
+    async def search(self, tags: dict, limit: int = None) -> (List[dict], int):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_pairwise_list_pages():
+    api = InMemoryPairwiseAPI(count=25)
+    pairwise_list = WalletPairwiseList(api=(api, None), page_size=10)
+    dids = []
+    async for n, p in pairwise_list.enumerate():
+        assert n == len(dids)
+        if n == 0:
+            # first page is yielded while the next one is prefetched
+            await asyncio.sleep(0)
+            assert api.pages == [0, 10]
+        dids.append(p.their.did)
+    assert dids == ['their-did-%d' % n for n in range(25)]
+    assert api.pages == [0, 10, 20]
+    api.pages.clear()
+    pages = WalletPairwiseList(api=(api, None), page_size=10, prefetch=False).enumerate()
+    async for n, p in pages:
+        break
+    await pages.aclose()
+    assert api.pages == [0]
+
+
+class PagesAgentRPC:
+    """Agent connection that fails list_pairwise_page call with prepared error"""
+
+    is_unknown_message_type_error = staticmethod(AgentRPC.is_unknown_message_type_error)
+
+    def __init__(self, error: Exception):
+        self.error = error
+        self.calls = []
+        self.unsupported = set()
+
+    def is_feature_supported(self, feature: str) -> bool:
+        return feature not in self.unsupported
+
+    def mark_feature_unsupported(self, feature: str):
+        self.unsupported.add(feature)
+
+    async def remote_call(self, msg_type: str, params: dict = None, **kwargs):
+        name = msg_type.split('/')[-1]
+        self.calls.append(name)
+        if name == 'list_pairwise_page':
+            raise self.error
+        return ['item-%d' % n for n in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_pairwise_page_fallback():
+    # Transient errors are raised and page is requested again next time
+    rpc = PagesAgentRPC(SiriusPromiseContextException('IOError', 'Timeout'))
+    proxy = PairwiseProxy(rpc)
+    for _ in range(2):
+        with pytest.raises(SiriusPromiseContextException):
+            await proxy.list_pairwise_page(0, 2)
+    assert rpc.calls == ['list_pairwise_page', 'list_pairwise_page']
+    assert not rpc.unsupported
+    # Outdated agent: rest of the whole list is returned, paging is not requested anymore
+    rpc = PagesAgentRPC(SiriusPromiseContextException('RuntimeError', 'Unknown message type "list_pairwise_page"'))
+    proxy = PairwiseProxy(rpc)
+    assert await proxy.list_pairwise_page(2, 2) == (['item-2', 'item-3', 'item-4'], 5)
+    assert await proxy.list_pairwise_page(0, 2) == (['item-%d' % n for n in range(5)], 5)
+    assert rpc.calls == ['list_pairwise_page', 'list_pairwise', 'list_pairwise']
+
+
+class CountingPairwiseList(WalletPairwiseList):
+
+    def __init__(self, count: int):
+        super().__init__(api=(InMemoryPairwiseAPI(count), None))
+        self.calls = []
+
+    async def create(self, pairwise: Pairwise):
+        self.calls.append(('create', pairwise.their.did))
+        self._api_pairwise.items.append({'metadata': self._build_metadata(pairwise)})
+        self._notify_updated(pairwise.their.did)
+
+    async def update(self, pairwise: Pairwise):
+        self.calls.append(('update', pairwise.their.did))
+        self._notify_updated(pairwise.their.did)
+
+    async def is_exists(self, their_did: str) -> bool:
+        self.calls.append(('is_exists', their_did))
+        return await self._api_pairwise.is_pairwise_exists(their_did)
+
+    async def load_for_did(self, their_did: str):
+        self.calls.append(('load_for_did', their_did))
+        await asyncio.sleep(0)
+        for item in self._api_pairwise.items:
+            if item['metadata']['their']['did'] == their_did:
+                return self._restore_pairwise(item['metadata'])
+        return None
+
+    async def load_for_verkey(self, their_verkey: str):
+        self.calls.append(('load_for_verkey', their_verkey))
+        for item in self._api_pairwise.items:
+            if item['metadata']['their']['verkey'] == their_verkey:
+                return self._restore_pairwise(item['metadata'])
+        return None
+
+
+@pytest.mark.asyncio
+async def test_cached_pairwise_list():
+    inner = CountingPairwiseList(count=5)
+    cached = CachedPairwiseList(inner, max_size=3, ttl=60, negative_ttl=60)
+    # Concurrent lookups share single load, both indexes are filled
+    p1, p2 = await asyncio.gather(cached.load_for_did('their-did-1'), cached.load_for_did('their-did-1'))
+    assert p1 is p2 and p1.their.verkey == 'vk-1'
+    assert (await cached.load_for_verkey('vk-1')) is p1
+    assert inner.calls == [('load_for_did', 'their-did-1')]
+    # Negative caching
+    assert await cached.load_for_did('unknown') is None
+    assert await cached.load_for_did('unknown') is None
+    assert await cached.is_exists('unknown') is False
+    assert inner.calls.count(('load_for_did', 'unknown')) == 1
+    # Write-through and invalidation of misses
+    new = Pairwise(
+        me=Pairwise.Me(did='my-did', verkey='my-verkey'),
+        their=Pairwise.Their(did='unknown', label='New', endpoint='http://endpoint', verkey='vk-new')
+    )
+    inner.calls.clear()
+    await cached.ensure_exists(new)
+    assert inner.calls == [('is_exists', 'unknown'), ('create', 'unknown')]
+    assert await cached.load_for_verkey('vk-new') is new
+    assert await cached.is_exists('unknown') is True
+    # Size-bounded LRU
+    for n in range(2, 5):
+        await cached.load_for_did('their-did-%d' % n)
+    assert len(cached) == 3
+    metrics = cached.metrics
+    assert metrics['evictions'] == 2
+    assert metrics['hits'] == 5 and metrics['misses'] == 6
+    assert metrics['hit_rate'] == 5 / 11
+    # Modifications elsewhere invalidate entries
+    inner.calls.clear()
+    await inner.update(Pairwise(
+        me=Pairwise.Me(did='my-did', verkey='my-verkey'),
+        their=Pairwise.Their(did='their-did-4', label='Their 4', endpoint='http://new-endpoint', verkey='vk-4')
+    ))
+    await cached.load_for_did('their-did-4')
+    assert ('load_for_did', 'their-did-4') in inner.calls
+    dids = [p.their.did async for _, p in cached.enumerate()]
+    assert len(dids) == 6
+
+
+@pytest.mark.asyncio
+async def test_cached_pairwise_list_consistency():
+    inner = CountingPairwiseList(count=2)
+    cached = CachedPairwiseList(inner, negative_ttl=60)
+    stale = Pairwise(
+        me=Pairwise.Me(did='my-did', verkey='my-verkey'),
+        their=Pairwise.Their(did='stale', label='Stale', endpoint='http://endpoint', verkey='vk-stale')
+    )
+    # Miss cached before pairwise was stored elsewhere does not turn ensure_exists into create
+    assert await cached.load_for_did('stale') is None
+    inner._api_pairwise.items.append({'metadata': inner._build_metadata(stale)})
+    inner.calls.clear()
+    await cached.ensure_exists(stale)
+    assert inner.calls == [('is_exists', 'stale'), ('update', 'stale')]
+    assert await cached.load_for_did('stale') is stale
+    # Modification of the pairwise does not drop misses and loads of the others
+    assert await cached.load_for_did('unknown') is None
+    loading = asyncio.ensure_future(cached.load_for_did('their-did-0'))
+    await asyncio.sleep(0)
+    cached.invalidate('stale', 'vk-stale')
+    assert await loading is not None
+    inner.calls.clear()
+    assert await cached.load_for_did('unknown') is None
+    assert await cached.load_for_did('their-did-0') is not None
+    assert inner.calls == []
+    # Load of the invalidated key is completed but not cached
+    loading = asyncio.ensure_future(cached.load_for_did('their-did-1'))
+    await asyncio.sleep(0)
+    cached.invalidate('their-did-1')
+    assert await loading is not None
+    assert await cached.load_for_did('their-did-1') is not None
+    assert inner.calls == [('load_for_did', 'their-did-1'), ('load_for_did', 'their-did-1')]
+    # Cancellation of the lookup that started load does not cancel load shared with others
+    inner.calls.clear()
+    cached.invalidate()
+    owner = asyncio.ensure_future(cached.load_for_did('their-did-0'))
+    await asyncio.sleep(0)
+    other = asyncio.ensure_future(cached.load_for_did('their-did-0'))
+    await asyncio.sleep(0)
+    owner.cancel()
+    assert (await other).their.did == 'their-did-0'
+    assert inner.calls == [('load_for_did', 'their-did-0')]
+
+
+@pytest.mark.asyncio
+async def test_pairwise_bulk_operations():
+    inner = CountingPairwiseList(count=3)
+    active = []
+    max_active = []
+    create = inner.create
+
+    async def slow_create(pairwise: Pairwise):
+        active.append(pairwise)
+        max_active.append(len(active))
+        await asyncio.sleep(0.001)
+        active.remove(pairwise)
+        if pairwise.their.did == 'bulk-did-13':
+            raise RuntimeError('wallet error')
+        await create(pairwise)
+
+    inner.create = slow_create
+    collection = [
+        Pairwise(
+            me=Pairwise.Me(did='my-did', verkey='my-verkey'),
+            their=Pairwise.Their(did='bulk-did-%d' % n, label='Bulk', endpoint='http://endpoint', verkey='bulk-%d' % n)
+        )
+        for n in range(50)
+    ]
+    results = await inner.create_many(collection, concurrency=4)
+    assert max(max_active) == 4
+    assert [r.pairwise for r in results] == collection
+    assert [n for n, r in enumerate(results) if not r.success] == [13]
+    assert isinstance(results[13].error, RuntimeError)
+    assert all(r.created for r in results if r.success)
+    # Existing ones are updated, results are written through to the cache
+    inner.create = create
+    cached = CachedPairwiseList(inner)
+    inner.calls.clear()
+    results = await cached.ensure_exists_many(collection[10:15] + [collection[0]], concurrency=2)
+    assert [r.created for r in results] == [False, False, False, True, False, False]
+    assert all(r.success for r in results)
+    assert await cached.load_for_did('bulk-did-13') is collection[13]
+    assert ('load_for_did', 'bulk-did-13') not in inner.calls
+
+
+def test_pairwise_compact():
+    endpoint = ''.join(['http://', 'endpoint/', 'path'])
+    metadata = {
+        'me': {'did': 'my-did', 'verkey': 'my-verkey', 'did_doc': {'id': 'my-did'}},
+        'their': {
+            'did': 'their-did', 'verkey': 'their-verkey', 'label': 'Their',
+            'endpoint': {'address': endpoint, 'routing_keys': ['routing-key']},
+            'did_doc': {'id': 'their-did', 'service': []}
+        },
+        'tags': {'custom': 'value'}
+    }
+    p1 = WalletPairwiseList._restore_pairwise(metadata)
+    p2 = WalletPairwiseList._restore_pairwise(json.loads(json.dumps(metadata)))
+    for obj in [p1, p1.me, p1.their]:
+        assert not hasattr(obj, '__dict__')
+    # Repeated strings are shared among relationships
+    assert p1.their.endpoint is p2.their.endpoint
+    assert p1.their.routing_keys[0] is p2.their.routing_keys[0]
+    assert p1.me.did is p2.me.did
+    assert p1.their.did_doc == {'id': 'their-did', 'service': []}
+    assert p1.metadata == metadata
+    assert p2.metadata == metadata
+    # Metadata is what was restored even if relationship is changed before metadata is accessed
+    p3 = WalletPairwiseList._restore_pairwise(metadata)
+    p3.me.did = 'changed-did'
+    p3.their.netloc = 'changed:8080'
+    p3.their.routing_keys.append('changed-key')
+    p3.their.did_doc = {'id': 'changed'}
+    assert p3.metadata == metadata
+    assert p3.their.did_doc == {'id': 'changed'}
+    # DID Docs are kept parsed unless lazy serialized form is requested
+    assert p1.me.did_doc is metadata['me']['did_doc']
+    p5 = WalletPairwiseList._restore_pairwise(metadata, lazy_did_docs=True)
+    assert p5.me._Me__did_doc == json.dumps(metadata['me']['did_doc'])
+    assert p5.their.did_doc == {'id': 'their-did', 'service': []}
+    assert p5.metadata == metadata
+    # Unknown fields are kept as is
+    metadata['their']['extra'] = 'value'
+    p4 = WalletPairwiseList._restore_pairwise(metadata)
+    assert p4.metadata is metadata
+    assert p4.their.did_doc == {'id': 'their-did', 'service': []}
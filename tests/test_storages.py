@@ -40,18 +40,59 @@ async def test_inmemory_immutable_collection():
     await collection.add('Value1', {'tag1': 'tag-val-1', 'tag2': 'tag-val-2'})
     await collection.add('Value2', {'tag1': 'tag-val-1', 'tag2': 'tag-val-3'})
 
-    fetched1 = await collection.fetch({'tag1': 'tag-val-1'})
+    fetched1, count = await collection.fetch({'tag1': 'tag-val-1'})
+    assert count == 2
     assert len(fetched1) == 2
 
-    fetched1 = await collection.fetch({'tag2': 'tag-val-2'})
+    fetched1, count = await collection.fetch({'tag2': 'tag-val-2'})
+    assert count == 1
     assert len(fetched1) == 1
     assert fetched1[0] == 'Value1'
 
+    fetched2, count = await collection.fetch({'tag1': 'tag-val-1', 'tag2': 'tag-val-3'})
+    assert count == 1
+    assert fetched2 == ['Value2']
+
+    fetched2, count = await collection.fetch({'tag1': 'tag-val-1', 'tag2': 'unknown'})
+    assert count == 0
+    assert fetched2 == []
+
+    fetched2, count = await collection.fetch({'tag1': 'tag-val-1'}, limit=1)
+    assert count == 2
+    assert fetched2 == ['Value1']
+
     await collection.select_db('db2')
-    fetched3 = await collection.fetch({})
+    fetched3, count = await collection.fetch({})
+    assert count == 0
     assert len(fetched3) == 0
 
 
+@pytest.mark.asyncio
+async def test_inmemory_immutable_collection_index():
+    collection = InMemoryImmutableCollection()
+    await collection.select_db('db')
+    for n in range(1000):
+        await collection.add(n, {'mod2': str(n % 2), 'mod3': str(n % 3), 'mod5': str(n % 5), 'attrs': ['a', 'b']})
+
+    fetched, count = await collection.fetch({'mod2': '0', 'mod3': '0', 'mod5': '0'})
+    assert fetched == [n for n in range(1000) if n % 30 == 0]
+    assert count == len(fetched)
+
+    fetched, count = await collection.fetch({'mod3': '1', 'mod5': '4'}, limit=5)
+    assert fetched == [4, 19, 34, 49, 64]
+    assert count == len([n for n in range(1000) if n % 15 == 4])
+
+    # Tags with unhashable values are matched by equality
+    fetched, count = await collection.fetch({'mod5': '3', 'attrs': ['a', 'b']})
+    assert count == 200
+    fetched, count = await collection.fetch({'attrs': ['a']})
+    assert count == 0
+
+    fetched, count = await collection.fetch({}, limit=3)
+    assert fetched == [0, 1, 2]
+    assert count == 1000
+
+
 @pytest.mark.asyncio
 async def test_inwallet_immutable_collection(agent1: Agent):
     await agent1.open()